@@ -41,6 +41,7 @@ logging.basicConfig(level=logging.DEBUG)
 
 import geotiler
 from geotiler.cache import redis_downloader
+from geotiler.prefetch import MotionPrefetch
 
 client = redis.Redis('localhost')
 downloader = redis_downloader(client)
@@ -66,11 +67,15 @@ def read_gps(queue):
 def show_map(queue, map):
     """
     Save map centered at location to a file.
+
+    Map tiles along motion vector of the map are prefetched into the cache.
     """
+    prefetch = MotionPrefetch(map, downloader)
     while True:
         pos = yield from queue.get()
 
         map.center = pos
+        prefetch.update()
         img = yield from render_map_async(map)
         img.save('ex-async-gps.png', 'png')
 
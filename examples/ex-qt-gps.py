@@ -56,6 +56,7 @@ from quamash import QEventLoop
 
 import geotiler
 from geotiler.cache import redis_downloader
+from geotiler.prefetch import MotionPrefetch, ZoomPrefetch
 
 logging.getLogger('geotiler').setLevel(logging.DEBUG)
 logging.basicConfig()
@@ -108,6 +109,9 @@ def refresh_map(widget):
     """
     Refresh map when map widget refresh event is set.
 
+    Map tiles along motion vector of the map and map tiles of adjacent
+    zoom levels are prefetched into the cache.
+
     This is asyncio coroutine.
 
     :param widget: Map widget.
@@ -121,14 +125,18 @@ def refresh_map(widget):
     render_map = functools.partial(
         geotiler.render_map_async, downloader=downloader
     )
+    prefetch = MotionPrefetch(map, downloader)
+    zoom_prefetch = ZoomPrefetch(map, downloader)
 
     while True:
         yield from event.wait()
         event.clear()
+        prefetch.update()
 
         logger.debug('fetching map image...')
         img = yield from render_map(map)
         logger.debug('got map image')
+        zoom_prefetch.update()
 
         pixmap = QPixmap.fromImage(ImageQt(img))
         widget.map_layer.setPixmap(pixmap)
@@ -38,16 +38,17 @@ from geotiler.cache import redis_downloader
 import logging
 logging.basicConfig(level=logging.DEBUG)
 
-# create tile downloader with Redis client as cache
+bbox = 11.78560, 46.48083, 11.79067, 46.48283
+mm = geotiler.Map(extent=bbox, zoom=18)
+
+# create tile downloader with Redis client as cache; map tiles are stored
+# with compact map tile keys of the map provider
 client = redis.Redis('localhost')
-downloader = redis_downloader(client)
+downloader = redis_downloader(client, provider=mm.provider)
 
 # use map renderer with new downloader
 render_map = functools.partial(geotiler.render_map, downloader=downloader)
 
-bbox = 11.78560, 46.48083, 11.79067, 46.48283
-mm = geotiler.Map(extent=bbox, zoom=18)
-
 # render the map for the first time...
 img = render_map(mm)
 
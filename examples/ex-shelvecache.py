@@ -47,6 +47,9 @@ class Cache:
     WARNING: There is nothing that prevents cache from growing very large
     and also nothing which determines if the data is recent (however the
     time at the moment something is placed in the database is saved).
+
+    Use :py:class:`geotiler.cache.ManagedDiskCache` for a disk cache with
+    limited size.
     """
     def __init__(self, filename):
         """
@@ -27,7 +27,9 @@
 
 __version__ = '0.11.0'
 
-from .map import Map, render_map, render_map_async
-from .provider import find_provider, providers
+from .map import Map, render_map, render_map_async, render_maps, \
+    render_maps_async, render_map_blocks, render_frames, render_frames_async
+from .provider import find_provider, providers, register_provider, \
+    register_providers
 
 # vim: sw=4:et:ai
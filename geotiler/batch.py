@@ -0,0 +1,228 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Batch rendering of maps with a pool of processes.
+
+Decoding and compositing of map tiles is CPU bound and limited to one CPU
+core in a Python process. Batch rendering distributes map specifications
+between worker processes. Each worker process keeps its own map providers
+registry, asyncio loop and cache of decoded map tile images, so map tiles
+shared by consecutive maps are decoded once per worker.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+from collections import OrderedDict
+from functools import partial
+
+from .cache import disk_downloader
+from .encode import encode_image
+from .map import Map
+from .provider import register_providers
+from .tile.img import compose_image, ColorTile, _tile_image
+from .tile.io import fetch_tiles
+
+logger = logging.getLogger(__name__)
+
+# state of a worker process, initialized on first use
+_WORKER = None
+
+def render_batch(
+    maps, workers=None, downloader=None, mode='RGBA', encoder=None,
+    output=None, cache_dir=None, providers=None, cache_size=256
+):
+    """
+    Render maps with a pool of processes.
+
+    A map is specified with a dictionary of :py:class:`geotiler.Map`
+    constructor parameters, i.e.::
+
+        {'center': (-6.069, 53.390), 'zoom': 15, 'size': (512, 512)}
+
+    Map provider has to be specified with its identificator. Use
+    `providers` parameter to register map providers from a directory in
+    each worker process (see :py:func:`geotiler.register_providers`).
+
+    The function is a generator of tuples of map specification and
+    rendering result. The tuples are generated in order of rendering
+    completion. The result is map image file data created with the
+    encoder. If `output` is specified, then map image file data is saved
+    into a file and name of the file is the result. The file name is
+    created by formatting `output` with index of map specification, i.e.
+    `map-{:06d}.png`.
+
+    Map image is encoded into PNG file data by default. The encoder is a
+    function accepting map image as its only parameter, i.e.::
+
+        encoder = functools.partial(encode_image, format='png', colors=64)
+
+    If `cache_dir` is specified, then map tiles are stored in the
+    directory, which is shared by all worker processes (see
+    :py:func:`geotiler.cache.disk_downloader`). Each worker process keeps
+    up to `cache_size` decoded map tile images in memory.
+
+    The encoder and downloader are sent to worker processes, so they have
+    to be picklable, i.e. module level functions.
+
+    An exception raised by a worker process is raised by the generator.
+
+    :param maps: Collection of map specifications.
+    :param workers: Number of worker processes (number of CPU cores if
+        `None`).
+    :param downloader: Map tiles downloader, use `None` for default
+        downloader.
+    :param mode: Map image mode, determined automatically if `None`.
+    :param encoder: Map image encoder, PNG encoder if `None`.
+    :param output: Format string of map image file name.
+    :param cache_dir: Map tiles cache directory.
+    :param providers: Directory containing map providers data.
+    :param cache_size: Number of decoded map tile images cached by a worker
+        process.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if encoder is None:
+        encoder = partial(encode_image, format='png')
+
+    config = (
+        providers, downloader, cache_dir, cache_size, mode, encoder, output
+    )
+
+    # keep limited number of map specifications in flight, so collection
+    # of map specifications can be large or lazy
+    maps = enumerate(maps)
+    pending = {}
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        try:
+            while True:
+                while len(pending) < workers * 2:
+                    item = next(maps, None)
+                    if item is None:
+                        break
+                    i, spec = item
+                    task = executor.submit(_render, i, spec, config)
+                    pending[task] = spec
+
+                if not pending:
+                    break
+
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield pending.pop(task), task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def _render(i, spec, config):
+    """
+    Render map in a worker process.
+
+    :param i: Index of map specification.
+    :param spec: Map specification.
+    :param config: Worker process configuration.
+    """
+    global _WORKER
+    if _WORKER is None:
+        _WORKER = _Worker(config)
+
+    return _WORKER.render(i, spec)
+
+
+class _Worker:
+    """
+    State of worker process rendering maps.
+
+    :var loop: Asyncio loop of worker process.
+    :var downloader: Map tiles downloader.
+    :var tiles: Cache of decoded map tile images.
+    """
+    def __init__(self, config):
+        providers, downloader, cache_dir, cache_size, mode, encoder, output \
+            = config
+
+        if providers is not None:
+            register_providers(providers)
+
+        if downloader is None:
+            downloader = fetch_tiles
+        if cache_dir is not None:
+            downloader = disk_downloader(cache_dir, downloader)
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        self.downloader = downloader
+        self.tiles = OrderedDict()
+        self.cache_size = cache_size
+        self.mode = mode
+        self.encoder = encoder
+        self.output = output
+
+
+    def render(self, i, spec):
+        """
+        Render map and encode map image.
+
+        :param i: Index of map specification.
+        :param spec: Map specification.
+        """
+        map = Map(**spec)
+        grid = map.tile_grid
+        urls = map.provider.tile_urls(grid, map.zoom)
+        tiles = self.tiles
+
+        missing = tuple(u for u in urls if u not in tiles)
+        if missing:
+            task = self.downloader(missing, loop=self.loop)
+            data = self.loop.run_until_complete(task)
+            for u, d in zip(missing, data):
+                if d is not None:
+                    img = _tile_image(d, self.mode)
+                    if not isinstance(img, ColorTile):
+                        img.load()
+                    tiles[u] = img
+
+        for u in urls:
+            if u in tiles:
+                tiles.move_to_end(u)
+        images = [tiles.get(u) for u in urls]
+        image = compose_image(map, images, grid.offsets, self.mode)
+
+        # evict after map image is composed, so all map tile images of a
+        # map are available even if the map is larger than the cache
+        while len(tiles) > self.cache_size:
+            tiles.popitem(last=False)
+
+        data = self.encoder(image)
+        if self.output is None:
+            return data
+
+        fn = self.output.format(i)
+        with open(fn, 'wb') as f:
+            f.write(data)
+        return fn
+
+
+# vim: sw=4:et:ai
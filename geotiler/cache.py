@@ -30,15 +30,25 @@ Caching strategies for GeoTiler.
 """
 
 import asyncio
+import hashlib
 import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
 from functools import partial
 
-from geotiler.tile.io import fetch_tiles
+from geotiler.tile.img import uniform_tile
+from geotiler.tile.io import fetch_tiles, _accepts_stats
+from geotiler.tile.key import url_key, KEY_STRUCT, ZOOM_SHIFT
 
 logger = logging.getLogger(__name__)
 
 @asyncio.coroutine
-def caching_downloader(get, set, downloader, urls, **kw):
+def caching_downloader(
+    get, set, downloader, urls, name='cache', key=None, uniform=False, **kw
+):
     """
     Create caching map tiles downloader.
 
@@ -53,16 +63,35 @@ def caching_downloader(get, set, downloader, urls, **kw):
     The cache getter function (`get` parameter) should return `None` if
     tile data is not in cache for given URL.
 
+    If `key` function is specified, then cache is accessed with map tile
+    keys calculated with the function instead of URLs, i.e. see
+    :py:func:`geotiler.tile.key.url_key`. Map tile is not cached if the
+    key function returns `None`.
+
+    If `uniform` is true, then data of downloaded map tiles having single
+    colour is replaced with colour marker, which is stored in cache and
+    rendered with rectangle fill, see
+    :py:func:`geotiler.tile.img.uniform_tile`.
+
     The collection of tile data is returned for each input URL (or `None`
     if tile data could not be obtained).
 
+    If map rendering statistics object is passed with `stats` parameter,
+    then number of cache hits and misses is recorded using cache name. The
+    statistics object is passed to the original downloader only if it
+    accepts `stats` parameter.
+
     :param get: Function to get a tile from cache.
     :param set: Function to put a tile in cache.
     :param downloader: Original tiles downloader (asyncio coroutine).
     :param urls: Collection of URLs of tiles.
+    :param name: Cache name used by map rendering statistics.
+    :param key: Function to calculate cache key of map tile URL.
+    :param uniform: Replace data of uniform map tiles with colour marker.
     :param kw: Parameters passed to downloader coroutine.
     """
-    data = {u: get(u) for u in urls}
+    keys = {u: u for u in urls} if key is None else {u: key(u) for u in urls}
+    data = {u: None if k is None else get(k) for u, k in keys.items()}
     if __debug__:
         items = (u for u, v in data.items() if v is not None)
         for u in items:
@@ -70,30 +99,677 @@ def caching_downloader(get, set, downloader, urls, **kw):
 
     # download missing tiles, keep the order of urls
     missing = tuple(u for u in urls if data[u] is None)
+
+    stats = kw.get('stats')
+    if stats is not None:
+        stats.cached(name, len(urls) - len(missing), len(missing))
+        if not _accepts_stats(downloader):
+            kw = {k: v for k, v in kw.items() if k != 'stats'}
     result = yield from downloader(missing, **kw)
+    if uniform:
+        result = (uniform_tile(t) if t else t for t in result)
     data.update(zip(missing, result))
 
     # reset cache for new and old tiles
-    existing = ((u, t) for u, t in data.items() if t)
-    for u, t in existing:
-        set(u, t)
+    existing = ((keys[u], t) for u, t in data.items() if t)
+    for k, t in existing:
+        if k is not None:
+            set(k, t)
 
     # keep the original order
     return (data[u] for u in urls)
 
 
-def redis_downloader(client, downloader=None, timeout=3600 * 24 * 7):
+def redis_downloader(
+    client, downloader=None, timeout=3600 * 24 * 7, provider=None,
+    uniform=False
+):
     """
     Create downloader using Redis as cache for map tiles.
 
+    Map tile URLs are used as Redis keys by default. If `provider` is
+    specified, then Redis key is map provider identificator followed by
+    8-byte map tile key (see :py:mod:`geotiler.tile.key`), i.e.
+    `osm:\x3c\x00...`. Redis keys of map tiles of a map provider sort as map
+    tile keys. The `ValueError` exception is raised if map provider
+    identificator is missing.
+
     :param client: Redis client object.
     :param downloader: Map tiles downloader, use `None` for default downloader.
     :param timeout: Map tile data expiry timeout, default 1 week.
+    :param provider: Map provider of map tiles.
+    :param uniform: Store colour marker of uniform map tiles, see
+        :py:func:`geotiler.cache.caching_downloader`.
     """
     if downloader is None:
         downloader = fetch_tiles
     set = lambda key, value: client.setex(key, value, timeout)
-    return partial(caching_downloader, client.get, set, downloader)
+
+    key = None if provider is None else _redis_key(provider)
+    return partial(
+        caching_downloader, client.get, set, downloader, name='redis',
+        key=key, uniform=uniform
+    )
+
+
+def dedup_downloader(
+    client, downloader=None, provider=None, recompress=None, uniform=False
+):
+    """
+    Create downloader using content-addressed cache for map tiles.
+
+    Map tiles having identical data are stored once, see
+    :py:class:`geotiler.cache.DedupCache`. Map tile keys are calculated as
+    for :py:func:`geotiler.cache.redis_downloader`.
+
+    :param client: Redis client object or other key-value store.
+    :param downloader: Map tiles downloader, use `None` for default downloader.
+    :param provider: Map provider of map tiles.
+    :param recompress: Function to recompress map tile data, i.e.
+        :py:func:`geotiler.encode.recompress_png`.
+    :param uniform: Store colour marker of uniform map tiles, see
+        :py:func:`geotiler.cache.caching_downloader`.
+    """
+    if downloader is None:
+        downloader = fetch_tiles
+    cache = DedupCache(client, recompress=recompress)
+    key = None if provider is None else _redis_key(provider)
+    return partial(
+        caching_downloader, cache.get, cache.set, downloader, name='dedup',
+        key=key, uniform=uniform
+    )
+
+
+def disk_downloader(
+    path, downloader=None, provider=None, max_size=None, uniform=False,
+    **options
+):
+    """
+    Create downloader using a directory as cache for map tiles.
+
+    The cache can be shared by multiple processes, see
+    :py:class:`geotiler.cache.DiskCache`.
+
+    If `provider` is specified, then map tiles are stored in map provider
+    subdirectory of the cache directory using map tile keys (see
+    :py:mod:`geotiler.tile.key`). The `ValueError` exception is raised if
+    map provider identificator is missing.
+
+    If `max_size` is specified, then size of the cache is limited, see
+    :py:class:`geotiler.cache.ManagedDiskCache`. The options are passed to
+    the managed cache, i.e. eviction policy or retention rules. If
+    `provider` is specified, then the size limit applies to the map
+    provider subdirectory, so each map provider sharing the cache directory
+    has its own limit.
+
+    :param path: Cache directory.
+    :param downloader: Map tiles downloader, use `None` for default downloader.
+    :param provider: Map provider of map tiles.
+    :param max_size: Maximum size of the cache in bytes, per map provider
+        if `provider` is specified.
+    :param uniform: Store colour marker of uniform map tiles, see
+        :py:func:`geotiler.cache.caching_downloader`.
+    :param options: Options of managed cache.
+    """
+    if downloader is None:
+        downloader = fetch_tiles
+
+    key = None
+    if provider is not None:
+        _check_provider(provider)
+        path = os.path.join(path, provider.id)
+        key = url_key(provider)
+
+    if max_size is None:
+        cache = DiskCache(path)
+    else:
+        cache = ManagedDiskCache(path, max_size, **options)
+    return partial(
+        caching_downloader, cache.get, cache.set, downloader, name='disk',
+        key=key, uniform=uniform
+    )
+
+
+class DedupCache:
+    """
+    Content-addressed cache of map tiles.
+
+    Map tile key points at SHA-1 hash of map tile data. Map tile data is
+    stored once for all map tiles with the same data, i.e. sea map tiles,
+    with reference counter.
+
+    The cache uses key-value store with Redis client interface, i.e.
+    `get`, `set` (with `nx` parameter), `delete` and `incrby` methods. The
+    store keys are
+
+    `t:<key>`
+        Hash of map tile data.
+    `b:<hash>`
+        Map tile data.
+    `r:<hash>`
+        Reference counter of map tile data.
+
+    The map tiles do not expire. Map tile data is removed when its last map
+    tile is removed from the cache with :py:meth:`delete` method.
+
+    Map tile data is stored before its reference counter is incremented and
+    map tile key is stored last, so a map tile key never points at missing
+    map tile data if a process storing map tile data is interrupted. At
+    worst, reference counter is too large and map tile data is never
+    removed.
+
+    Map tile data is recompressed with `recompress` function before it is
+    stored, i.e. see :py:func:`geotiler.encode.recompress_png`.
+
+    :var client: Redis client object or other key-value store.
+    :var recompress: Function to recompress map tile data.
+    """
+    def __init__(self, client, recompress=None):
+        """
+        Create content-addressed cache of map tiles.
+
+        :param client: Redis client object or other key-value store.
+        :param recompress: Function to recompress map tile data.
+        """
+        self.client = client
+        self.recompress = recompress
+
+
+    def get(self, key):
+        """
+        Get map tile data from cache.
+
+        Null is returned if key does not exist.
+
+        :param key: Map tile URL or map tile key.
+        """
+        client = self.client
+        tk = b't:' + _bytes(key)
+        h = client.get(tk)
+        if h is None:
+            return None
+
+        data = client.get(b'b:' + h)
+        if data is None:
+            # map tile data removed by concurrent delete, so forget the
+            # map tile and allow to store it again
+            client.delete(tk)
+        return data
+
+
+    def set(self, key, data):
+        """
+        Store map tile data in cache.
+
+        Existing map tile data is not overwritten.
+
+        :param key: Map tile URL or map tile key.
+        :param data: Map tile data.
+        """
+        client = self.client
+        tk = b't:' + _bytes(key)
+        if client.get(tk) is not None:
+            return
+
+        if self.recompress is not None:
+            data = self.recompress(data)
+
+        h = hashlib.sha1(data).digest()
+        client.set(b'b:' + h, data)
+        client.incrby(b'r:' + h, 1)
+
+        # another process might have stored the map tile in the meantime
+        if not client.set(tk, h, nx=True):
+            client.incrby(b'r:' + h, -1)
+
+
+    def delete(self, key):
+        """
+        Remove map tile from cache.
+
+        Map tile data is removed if it is not used by other map tiles.
+
+        :param key: Map tile URL or map tile key.
+        """
+        client = self.client
+        tk = b't:' + _bytes(key)
+        h = client.get(tk)
+        if h is None:
+            return
+
+        client.delete(tk)
+        if client.incrby(b'r:' + h, -1) <= 0:
+            client.delete(b'b:' + h, b'r:' + h)
+
+
+class DiskCache:
+    """
+    Cache of map tiles stored in files of a directory.
+
+    A map tile is stored in a file named with SHA-1 hash of map tile URL or
+    with hexadecimal value of integer map tile key. Map tile data is written
+    into temporary file, which is renamed afterwards, so the cache can be
+    shared by multiple processes.
+
+    :var path: Cache directory.
+    """
+    def __init__(self, path):
+        """
+        Create cache of map tiles stored in a directory.
+
+        The directory is created if it does not exist.
+
+        :param path: Cache directory.
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+
+    def get(self, key):
+        """
+        Get map tile data from cache.
+
+        Null is returned if key does not exist.
+
+        :param key: Map tile URL or integer map tile key.
+        """
+        try:
+            with open(self._filename(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+    def set(self, key, data):
+        """
+        Store map tile data in cache.
+
+        Existing map tile data is not overwritten.
+
+        :param key: Map tile URL or integer map tile key.
+        :param data: Map tile data.
+        """
+        fn = self._filename(key)
+        if not os.path.exists(fn):
+            self._write(fn, data)
+
+
+    def _write(self, fn, data):
+        """
+        Write map tile data into a file via temporary file.
+
+        :param fn: Name of file storing map tile data.
+        :param data: Map tile data.
+        """
+        path = os.path.dirname(fn)
+        os.makedirs(path, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, fn)
+        except:
+            os.unlink(tmp)
+            raise
+
+
+    def _filename(self, key):
+        """
+        Get name of file storing map tile data.
+
+        :param key: Map tile URL or integer map tile key.
+        """
+        if isinstance(key, int):
+            h = '{:016x}'.format(key)
+            return os.path.join(self.path, h[-2:], h)
+        h = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.path, h[:2], h)
+
+
+class ManagedDiskCache(DiskCache):
+    """
+    Cache of map tiles stored in files of a directory with limited size.
+
+    Size, zoom, last access time and number of accesses of each map tile
+    are stored in SQLite database in the cache directory, so the cache can
+    be shared by multiple processes. Accesses of map tiles are recorded in
+    memory and written into the database in batches.
+
+    When size of the cache exceeds `max_size`, map tiles are evicted in
+    batches by a background thread until the size of the cache drops below
+    90% of `max_size`. The eviction policy is
+
+    lru
+        Least recently used map tiles are evicted first.
+    lfu
+        Least frequently used map tiles are evicted first.
+
+    Retention rules map zoom level to minimum time in seconds since last
+    access of a map tile before it can be evicted. Map tiles are never
+    evicted if the time is `None`, i.e. to keep map tiles at zoom levels
+    0-10 forever::
+
+        retention = {z: None for z in range(11)}
+
+    Zoom of map tile is known for integer map tile keys only, see
+    :py:func:`geotiler.cache.disk_downloader`.
+
+    Map tiles existing in the cache directory, but missing in the database,
+    i.e. stored by :py:class:`geotiler.cache.DiskCache`, are recorded in
+    the database when accessed or stored again.
+
+    :var max_size: Maximum size of the cache in bytes.
+    :var policy: Eviction policy, `lru` or `lfu`.
+    :var retention: Retention rules per zoom level.
+    :var batch: Number of map tiles evicted in a batch.
+    """
+    POLICIES = {
+        'lru': 'atime',
+        'lfu': 'hits, atime',
+    }
+
+    def __init__(
+        self, path, max_size, policy='lru', retention=None, batch=256,
+        flush=64
+    ):
+        """
+        Create cache of map tiles stored in a directory with limited size.
+
+        :param path: Cache directory.
+        :param max_size: Maximum size of the cache in bytes.
+        :param policy: Eviction policy, `lru` or `lfu`.
+        :param retention: Retention rules per zoom level.
+        :param batch: Number of map tiles evicted in a batch.
+        :param flush: Number of recorded accesses written in a batch.
+        """
+        if policy not in self.POLICIES:
+            raise ValueError('Unknown eviction policy: {}'.format(policy))
+
+        super().__init__(path)
+        self.max_size = max_size
+        self.policy = policy
+        self.retention = {} if retention is None else retention
+        self.batch = batch
+        self.flush = flush
+
+        db = sqlite3.connect(
+            os.path.join(path, 'cache.db'), timeout=60,
+            isolation_level=None, check_same_thread=False
+        )
+        db.execute('pragma journal_mode=wal')
+        db.execute(
+            'create table if not exists tile ('
+            ' key primary key, zoom integer, size integer not null,'
+            ' atime real not null, hits integer not null)'
+        )
+        db.execute('create index if not exists tile_atime on tile (atime)')
+
+        self._db = db
+        self._lock = threading.Lock()
+        self._accesses = {}
+        self._size = self._total_size()
+        self._thread = None
+
+
+    @property
+    def size(self):
+        """
+        Size of the cache in bytes.
+        """
+        with self._lock:
+            self._size = self._total_size()
+            return self._size
+
+
+    def get(self, key):
+        """
+        Get map tile data from cache and record the access.
+
+        :param key: Map tile URL or integer map tile key.
+        """
+        data = super().get(key)
+        if data is not None:
+            with self._lock:
+                self._record(key, len(data), 1)
+        return data
+
+
+    def set(self, key, data):
+        """
+        Store map tile data in cache.
+
+        Existing map tile data is not overwritten, but the map tile is
+        recorded in the database if missing, i.e. map tile stored by
+        :py:class:`geotiler.cache.DiskCache` before the cache size was
+        limited. Eviction of map tiles is started if size of the cache
+        exceeds its maximum size.
+
+        :param key: Map tile URL or integer map tile key.
+        :param data: Map tile data.
+        """
+        fn = self._filename(key)
+        if os.path.exists(fn):
+            with self._lock:
+                if key not in self._accesses:
+                    self._record(key, os.path.getsize(fn), 0)
+            return
+
+        self._write(fn, data)
+        zoom = key >> ZOOM_SHIFT if isinstance(key, int) else None
+        with self._lock:
+            self._db.execute(
+                'insert or replace into tile values (?, ?, ?, ?, 0)',
+                (key, zoom, len(data), time.time())
+            )
+            self._size += len(data)
+            self._check_size()
+
+
+    def evict(self):
+        """
+        Evict map tiles until size of the cache drops below 90% of its
+        maximum size.
+
+        The method is run by background thread when the cache exceeds its
+        maximum size.
+        """
+        target = int(self.max_size * 0.9)
+        order = self.POLICIES[self.policy]
+        while True:
+            with self._lock:
+                self._flush()
+                self._size = self._total_size()
+                if self._size <= target:
+                    break
+                victims = self._victims(order, self._size - target)
+            if not victims:
+                logger.warning('cache size exceeded, no map tiles to evict')
+                break
+
+            for key, size in victims:
+                try:
+                    os.unlink(self._filename(key))
+                except FileNotFoundError:
+                    pass
+
+            if __debug__:
+                logger.debug('{} map tiles evicted'.format(len(victims)))
+
+
+    def close(self):
+        """
+        Write recorded accesses of map tiles and close the cache.
+        """
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+        with self._lock:
+            self._flush()
+            self._db.close()
+
+
+    def _victims(self, order, excess):
+        """
+        Find and remove batch of map tiles to evict from the database.
+
+        Up to `batch` map tiles are found, but no more than required to
+        free `excess` bytes.
+
+        :param order: Order of map tiles to evict.
+        :param excess: Number of bytes to free.
+        """
+        now = time.time()
+        where = []
+        args = []
+        for zoom, age in sorted(self.retention.items()):
+            if age is None:
+                where.append('zoom is not ?')
+                args.append(zoom)
+            else:
+                where.append('(zoom is not ? or atime < ?)')
+                args.extend((zoom, now - age))
+        where = ' and '.join(where) if where else '1'
+
+        db = self._db
+        db.execute('begin immediate')
+        try:
+            query = 'select key, size from tile where {} order by {} limit ?'
+            items = db.execute(
+                query.format(where, order), args + [self.batch]
+            )
+            victims = []
+            for key, size in items:
+                victims.append((key, size))
+                excess -= size
+                if excess <= 0:
+                    break
+            db.executemany(
+                'delete from tile where key = ?', ((k,) for k, _ in victims)
+            )
+            db.execute('commit')
+        except:
+            db.execute('rollback')
+            raise
+        return victims
+
+
+    def _record(self, key, size, hits):
+        """
+        Record access of a map tile.
+
+        The accesses are written into the database in batches. The method
+        is called with the lock acquired.
+
+        :param key: Map tile URL or integer map tile key.
+        :param size: Size of map tile data.
+        :param hits: Number of map tile hits to record.
+        """
+        _, n, _ = self._accesses.get(key, (None, 0, None))
+        self._accesses[key] = time.time(), n + hits, size
+        if len(self._accesses) >= self.flush:
+            self._flush()
+            self._check_size()
+
+
+    def _check_size(self):
+        """
+        Start eviction of map tiles if size of the cache exceeds its maximum
+        size.
+
+        The method is called with the lock acquired.
+        """
+        start = self._size > self.max_size \
+            and (self._thread is None or not self._thread.is_alive())
+        if start:
+            self._thread = threading.Thread(target=self.evict)
+            self._thread.daemon = True
+            self._thread.start()
+
+
+    def _flush(self):
+        """
+        Write recorded accesses of map tiles into the database.
+
+        Map tiles missing in the database, i.e. stored by
+        :py:class:`geotiler.cache.DiskCache` or left by interrupted
+        eviction, are inserted, so they are counted in size of the cache
+        and can be evicted.
+        """
+        if self._accesses:
+            db = self._db
+            db.execute('begin')
+            try:
+                for k, (t, n, size) in self._accesses.items():
+                    zoom = k >> ZOOM_SHIFT if isinstance(k, int) else None
+                    cursor = db.execute(
+                        'insert or ignore into tile values (?, ?, ?, ?, 0)',
+                        (k, zoom, size, t)
+                    )
+                    self._size += size * cursor.rowcount
+                db.executemany(
+                    'update tile set atime = max(atime, ?), hits = hits + ?'
+                    ' where key = ?',
+                    ((t, n, k) for k, (t, n, _) in self._accesses.items())
+                )
+                db.execute('commit')
+            except:
+                db.execute('rollback')
+                raise
+            self._accesses.clear()
+
+
+    def _total_size(self):
+        """
+        Calculate size of the cache using the database.
+        """
+        size, = self._db.execute(
+            'select coalesce(sum(size), 0) from tile'
+        ).fetchone()
+        return size
+
+
+def _redis_key(provider):
+    """
+    Create function calculating Redis key of map tile URL.
+
+    Redis key is map provider identificator followed by 8-byte map tile
+    key.
+
+    :param provider: Map provider of map tiles.
+    """
+    _check_provider(provider)
+    prefix = provider.id.encode() + b':'
+    tile_key = url_key(provider)
+    def key(url):
+        k = tile_key(url)
+        return None if k is None else prefix + KEY_STRUCT.pack(k)
+    return key
+
+
+def _check_provider(provider):
+    """
+    Check if map provider has identificator required by cache.
+
+    The `ValueError` exception is raised if map provider identificator is
+    missing.
+
+    :param provider: Map provider of map tiles.
+    """
+    if provider.id is None:
+        raise ValueError('Map provider identificator is missing')
+
+
+def _bytes(key):
+    """
+    Convert map tile URL or map tile key to bytes.
+
+    :param key: Map tile URL, integer map tile key or bytes.
+    """
+    if isinstance(key, bytes):
+        return key
+    elif isinstance(key, int):
+        return KEY_STRUCT.pack(key)
+    return key.encode()
 
 
 # vim: sw=4:et:ai
@@ -0,0 +1,216 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Encode map images into image file data.
+"""
+
+import io
+import logging
+import struct
+import zlib
+
+import PIL.Image
+
+logger = logging.getLogger(__name__)
+
+# PIL quantization method supporting images with alpha channel
+QUANTIZE_FAST_OCTREE = 2
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# PNG color type and number of bytes per pixel for image mode
+PNG_MODES = {
+    'L': (0, 1),
+    'RGB': (2, 3),
+    'RGBA': (6, 4),
+}
+
+def encode_image(image, format='png', colors=None, **options):
+    """
+    Encode map image into image file data, i.e. PNG, JPEG or WebP file
+    data.
+
+    If `colors` is specified, then map image is quantized into palette
+    image having up to `colors` colours. This is useful for maps with
+    limited number of colours like Stamen Toner map, i.e. PNG file data is
+    much smaller and it is encoded faster.
+
+    As JPEG format does not support alpha channel, the alpha channel is
+    dropped for JPEG file data.
+
+    The options are passed to `PIL.Image.save` method, i.e.
+
+    - PNG: `compress_level` (0-9) and `optimize`
+    - JPEG: `quality` (1-95), `optimize` and `progressive`
+    - WebP: `quality` (1-100), `lossless` and `method` (0-6)
+
+    Image file data is returned as bytes.
+
+    :param image: Map image (instance of `PIL.Image` class).
+    :param format: Image file format, i.e. `png`, `jpeg` or `webp`.
+    :param colors: Number of colours of palette image.
+    :param options: Image encoder options.
+    """
+    format = format.lower()
+    if format == 'jpg':
+        format = 'jpeg'
+
+    if format == 'jpeg' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    elif colors:
+        method = QUANTIZE_FAST_OCTREE if image.mode == 'RGBA' else None
+        image = image.quantize(colors, method=method)
+
+    if __debug__:
+        logger.debug('encoding image: format={}, mode={}, options={}'.format(
+            format, image.mode, options
+        ))
+
+    f = io.BytesIO()
+    image.save(f, format=format, **options)
+    return f.getvalue()
+
+
+def recompress_png(data, compress_level=9):
+    """
+    Recompress PNG file data, i.e. map tile data.
+
+    PNG file data is decoded and encoded again with maximum compression
+    and `optimize` option. The image is not changed. The original data is
+    returned if it is not PNG file data or recompressed data is not
+    smaller.
+
+    :param data: PNG file data.
+    :param compress_level: Compression level (0-9).
+    """
+    if not data.startswith(PNG_SIGNATURE):
+        return data
+
+    try:
+        image = PIL.Image.open(io.BytesIO(data))
+        result = encode_image(
+            image, 'png', compress_level=compress_level, optimize=True
+        )
+    except (OSError, ValueError) as ex:
+        logger.warning('cannot recompress PNG file data: {}'.format(ex))
+        return data
+
+    return result if len(result) < len(data) else data
+
+
+class PNGWriter:
+    """
+    PNG file writer accepting map image strips.
+
+    The writer enables to write PNG file of a map image, which does not
+    fit in memory. Strips of the map image, i.e. generated with
+    :py:func:`geotiler.map.render_map_blocks`, are encoded and written to
+    a file one by one.
+
+    :var rows: Number of rows written so far.
+    """
+    def __init__(self, f, size, mode='RGBA', compress_level=6):
+        """
+        Create PNG file writer and write PNG file header.
+
+        :param f: File object open in binary mode.
+        :param size: Map image size.
+        :param mode: Map image mode - `RGBA`, `RGB` or `L`.
+        :param compress_level: Compression level (0-9).
+        """
+        if mode not in PNG_MODES:
+            raise ValueError('Unsupported image mode: {}'.format(mode))
+
+        self._file = f
+        self._size = tuple(size)
+        self._mode = mode
+        self._compressor = zlib.compressobj(compress_level)
+        self.rows = 0
+
+        color, _ = PNG_MODES[mode]
+        width, height = self._size
+        f.write(PNG_SIGNATURE)
+        header = struct.pack('>IIBBBBB', width, height, 8, color, 0, 0, 0)
+        self._write_chunk(b'IHDR', header)
+
+
+    def write(self, image):
+        """
+        Write map image strip.
+
+        The strip has to have the width of map image.
+
+        :param image: Map image strip (instance of `PIL.Image` class).
+        """
+        width, height = image.size
+        if width != self._size[0]:
+            raise ValueError('Image strip width is not map image width')
+        if self.rows + height > self._size[1]:
+            raise ValueError('Image strip exceeds map image height')
+
+        if image.mode != self._mode:
+            image = image.convert(self._mode)
+
+        _, n = PNG_MODES[self._mode]
+        stride = width * n
+        data = memoryview(image.tobytes())
+
+        # each scanline is preceded with filter type byte (no filter)
+        lines = bytearray((stride + 1) * height)
+        for i in range(height):
+            k = i * (stride + 1)
+            lines[k + 1:k + 1 + stride] = data[i * stride:(i + 1) * stride]
+
+        data = self._compressor.compress(lines)
+        if data:
+            self._write_chunk(b'IDAT', data)
+        self.rows += height
+
+
+    def close(self):
+        """
+        Finish writing PNG file.
+
+        The file object is not closed.
+        """
+        if self.rows != self._size[1]:
+            raise ValueError(
+                'Map image strips height is {}, expected {}'
+                .format(self.rows, self._size[1])
+            )
+        self._write_chunk(b'IDAT', self._compressor.flush())
+        self._write_chunk(b'IEND', b'')
+
+
+    def _write_chunk(self, name, data):
+        """
+        Write PNG chunk.
+
+        :param name: Chunk name.
+        :param data: Chunk data.
+        """
+        crc = zlib.crc32(data, zlib.crc32(name))
+        self._file.write(struct.pack('>I', len(data)))
+        self._file.write(name)
+        self._file.write(data)
+        self._file.write(struct.pack('>I', crc & 0xffffffff))
+
+
+# vim: sw=4:et:ai
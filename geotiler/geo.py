@@ -27,8 +27,15 @@
 
 import math
 
+MAX_ZOOM = 25
+
+# scale factor of tile coordinates for zoom difference
+ZOOM_SCALE = {d: math.pow(2, d) for d in range(-MAX_ZOOM, MAX_ZOOM + 1)}
+
 
 class Transformation(object):
+    __slots__ = 'ax', 'bx', 'cx', 'ay', 'by', 'cy', '_dx', '_dy', '_cx', '_cy'
+
     def __init__(self, ax, bx, cx, ay, by, cy):
         self.ax = ax
         self.bx = bx
@@ -37,6 +44,12 @@ class Transformation(object):
         self.by = by
         self.cy = cy
 
+        # precomputed coefficients of inverse transformation
+        self._dx = ax * by - ay * bx
+        self._dy = bx * ay - by * ax
+        self._cx = -cx * by + cy * bx
+        self._cy = -cx * ay + cy * ax
+
     def transform(self, point):
         x, y = point
         return (
@@ -48,8 +61,8 @@ class Transformation(object):
     def untransform(self, point):
         x, y = point
         return (
-            (x * self.by - y * self.bx - self.cx * self.by + self.cy * self.bx) / (self.ax * self.by - self.ay * self.bx),
-            (x * self.ay - y * self.ax - self.cx * self.ay + self.cy * self.ax) / (self.bx * self.ay - self.by * self.ax)
+            (x * self.by - y * self.bx + self._cx) / self._dx,
+            (x * self.ay - y * self.ax + self._cy) / self._dy
         )
 
 
@@ -84,6 +97,8 @@ def linearSolution(r1, s1, t1, r2, s2, t2, r3, s3, t3):
     return a, b, c
 
 class IProjection:
+    __slots__ = 'zoom', 'transformation'
+
     def __init__(self, zoom, transformation=Transformation(1, 0, 0, 0, 1, 0)):
         self.zoom = zoom
         self.transformation = transformation
@@ -138,6 +153,8 @@ class IProjection:
 
 
 class MercatorProjection(IProjection):
+    __slots__ = ()
+
     def rawProject(self, point):
         x, y = point
         return x, math.log(math.tan(0.25 * math.pi + 0.5 * y))
@@ -157,8 +174,20 @@ def zoom_to(tile_coord, zoom, target):
     :param target: Target zoom.
     """
     col, row = tile_coord
-    d_zoom = target - zoom
-    return col * math.pow(2, d_zoom), row * math.pow(2, d_zoom)
+    scale = ZOOM_SCALE.get(target - zoom)
+    if scale is None:
+        scale = math.pow(2, target - zoom)
+    return col * scale, row * scale
+
+
+# the spherical mercator world tile covers (-π, -π) to (π, π)
+WEB_MERCATOR = MercatorProjection(
+    0,
+    deriveTransformation(
+        -math.pi, math.pi, 0, 0, math.pi, math.pi, 1, 0, -math.pi, -math.pi,
+        0, 1
+    )
+)
 
 
 # vim:et sts=4 sw=4:
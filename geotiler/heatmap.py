@@ -0,0 +1,216 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Density overlay (heatmap) of positions.
+
+Positions are binned into accumulation grid of map image size. The grids
+of multiple inputs can be calculated in parallel and summed. The grid is
+smoothed with Gaussian kernel, mapped with color map and composited over
+map image.
+"""
+
+import functools
+import math
+
+import numpy as np
+import PIL.Image
+
+from .track import rev_geocode
+
+# color map from transparent blue through cyan, green and yellow to red
+COLORS = (
+    (0.00, (0, 0, 255, 0)),
+    (0.25, (0, 255, 255, 255)),
+    (0.50, (0, 255, 0, 255)),
+    (0.75, (255, 255, 0, 255)),
+    (1.00, (255, 0, 0, 255)),
+)
+
+def density(map, points):
+    """
+    Calculate number of positions falling into each map image pixel.
+
+    NumPy array of map image height and width is returned. Positions
+    outside map image are ignored.
+
+    :param map: Map instance.
+    :param points: Iterable of NumPy arrays of positions, i.e. created with
+        :py:func:`geotiler.track.read_gpx`.
+    """
+    w, h = map.size
+    size = w * h
+    grid = np.zeros(size, dtype=np.int64)
+
+    # bin pixel indexes of multiple chunks at once, so cost of binning is
+    # not dominated by the size of the grid
+    indexes = []
+    n = 0
+    for chunk in points:
+        xy = np.floor(rev_geocode(map, chunk)).astype(np.int64)
+        x, y = xy[:, 0], xy[:, 1]
+        valid = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+        idx = y[valid] * w + x[valid]
+        indexes.append(idx)
+        n += len(idx)
+        if n >= size:
+            grid += np.bincount(np.concatenate(indexes), minlength=size)
+            indexes = []
+            n = 0
+
+    if indexes:
+        grid += np.bincount(np.concatenate(indexes), minlength=size)
+    return grid.reshape(h, w)
+
+
+def reduce_density(map, inputs, reader=None, executor=None):
+    """
+    Calculate density of positions for multiple inputs and sum the
+    results.
+
+    Each input is an iterable of NumPy arrays of positions. If `reader` is
+    specified, then it is called with an input to create the iterable,
+    i.e. input is name of GPX file and reader is
+    :py:func:`geotiler.track.read_gpx`.
+
+    If `executor` is specified, then density of each input is calculated
+    with the executor. Use `concurrent.futures.ProcessPoolExecutor` to
+    calculate density of inputs in parallel. The map, inputs and reader
+    are sent to worker processes, so they have to be picklable.
+
+    :param map: Map instance.
+    :param inputs: Collection of inputs.
+    :param reader: Function creating iterable of NumPy arrays of positions
+        for an input.
+    :param executor: Executor to calculate density of inputs.
+    """
+    f = functools.partial(_density, map, reader)
+    if executor is None:
+        grids = (f(i) for i in inputs)
+    else:
+        grids = executor.map(f, inputs)
+
+    w, h = map.size
+    result = np.zeros((h, w), dtype=np.int64)
+    for grid in grids:
+        result += grid
+    return result
+
+
+def render_heatmap(
+    map, grid, image=None, radius=4, colors=COLORS, alpha=0.75, log=False
+):
+    """
+    Render density grid as heatmap.
+
+    The density grid is smoothed with Gaussian kernel of `radius` pixels
+    and normalized with its maximum value. Logarithmic scale is used if
+    `log` is true. The normalized values are mapped with color map.
+
+    The color map is a collection of pairs of normalized value and color
+    (red, green, blue and alpha values). Pixels without positions are
+    transparent.
+
+    If `image` is null, then heatmap image is returned. Otherwise, heatmap
+    is composited over the image and new image is returned. The result is
+    image in `RGBA` mode.
+
+    :param map: Map instance.
+    :param grid: Density grid, see :py:func:`geotiler.heatmap.density`.
+    :param image: Map image.
+    :param radius: Radius of Gaussian kernel in pixels.
+    :param colors: Color map.
+    :param alpha: Transparency of heatmap (0.0 - 1.0).
+    :param log: Use logarithmic scale if true.
+    """
+    values = _smooth(grid.astype(np.float64), radius)
+    if log:
+        values = np.log1p(values)
+
+    top = values.max()
+    if top > 0:
+        values /= top
+
+    lut = _color_table(colors)
+    lut[:, 3] = (lut[:, 3] * alpha).round()
+    rgba = lut[(values * 255).round().astype(np.uint8)]
+    rgba[values <= 0] = 0
+
+    overlay = PIL.Image.fromarray(rgba, 'RGBA')
+    if image is None:
+        return overlay
+    return PIL.Image.alpha_composite(image.convert('RGBA'), overlay)
+
+
+def _density(map, reader, input):
+    """
+    Calculate density of positions of an input.
+
+    :param map: Map instance.
+    :param reader: Function creating iterable of NumPy arrays of positions.
+    :param input: Input of positions.
+    """
+    points = input if reader is None else reader(input)
+    return density(map, points)
+
+
+def _smooth(values, radius):
+    """
+    Smooth values with separable Gaussian kernel.
+
+    :param values: NumPy array of values.
+    :param radius: Radius of the kernel.
+    """
+    r = int(math.ceil(radius))
+    if r < 1:
+        return values
+
+    sigma = radius / 2
+    kernel = np.exp(-0.5 * (np.arange(-r, r + 1) / sigma) ** 2)
+    kernel /= kernel.sum()
+
+    for axis in (0, 1):
+        n = values.shape[axis]
+        pad = [(0, 0), (0, 0)]
+        pad[axis] = r, r
+        padded = np.pad(values, pad, mode='constant')
+        result = np.zeros_like(values)
+        for i, k in enumerate(kernel):
+            if axis == 0:
+                result += k * padded[i:i + n]
+            else:
+                result += k * padded[:, i:i + n]
+        values = result
+    return values
+
+
+def _color_table(colors):
+    """
+    Create table of 256 colors by interpolating color map.
+
+    :param colors: Color map.
+    """
+    stops = np.array([v for v, _ in colors], dtype=np.float64)
+    rgba = np.array([c for _, c in colors], dtype=np.float64)
+    x = np.linspace(0, 1, 256)
+    table = [np.interp(x, stops, rgba[:, i]) for i in range(4)]
+    return np.stack(table, axis=1).round().astype(np.uint8)
+
+
+# vim: sw=4:et:ai
@@ -0,0 +1,220 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Spatial index of positions for map overlays.
+
+Positions are stored as 64-bit Morton codes (quadkeys) of their tile
+coordinates at zoom 32. The codes are sorted, so positions within a
+quadtree cell at any zoom level are stored in a contiguous range of
+the index. A map query is a few binary searches, so its cost depends on
+the number of positions visible on the map and not on the number of all
+positions.
+"""
+
+import numpy as np
+
+from .geo import WEB_MERCATOR
+from .track import _tile_coords, _image_coords
+
+# zoom of tile coordinates of indexed positions
+INDEX_ZOOM = 32
+
+_MASKS = tuple(np.uint64(v) for v in (
+    0x5555555555555555,
+    0x3333333333333333,
+    0x0F0F0F0F0F0F0F0F,
+    0x00FF00FF00FF00FF,
+    0x0000FFFF0000FFFF,
+    0x00000000FFFFFFFF,
+))
+_SHIFTS = tuple(np.uint64(v) for v in (1, 2, 4, 8, 16))
+
+class PointIndex:
+    """
+    Spatial index of positions.
+
+    Positions are projected with Web Mercator projection and positions
+    outside of projection bounds are clipped.
+
+    :var codes: Sorted NumPy array of Morton codes of positions.
+    """
+    def __init__(self, points):
+        """
+        Create spatial index of positions.
+
+        :param points: Iterable of NumPy arrays of positions, i.e. created
+            with :py:func:`geotiler.track.read_gpx`.
+        """
+        codes = [_encode(*_index_coords(c)) for c in points if len(c)]
+        if codes:
+            codes = np.concatenate(codes)
+            codes.sort()
+        else:
+            codes = np.empty(0, dtype=np.uint64)
+        self.codes = codes
+
+
+    def __len__(self):
+        return len(self.codes)
+
+
+    def query(self, map):
+        """
+        Find positions visible on a map.
+
+        NumPy array of shape `(n, 2)` is returned. It contains positions
+        (x, y) on map image, see :py:meth:`geotiler.Map.rev_geocode`.
+
+        :param map: Map instance.
+        """
+        x0, y0, x1, y1 = _map_box(map)
+
+        codes = self.codes
+        parts = [codes[i:j] for i, j in _ranges(codes, x0, y0, x1, y1)]
+        codes = np.concatenate(parts) if parts else codes[:0]
+
+        x, y = _decode(codes)
+        valid = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        x = x[valid].astype(np.float64)
+        y = y[valid].astype(np.float64)
+
+        scale = 2.0 ** (map.zoom - INDEX_ZOOM)
+        return _image_coords(map, x * scale, y * scale)
+
+
+def _index_coords(points):
+    """
+    Calculate integer tile coordinates of positions at index zoom.
+
+    :param points: NumPy array of positions.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    x, y = _tile_coords(WEB_MERCATOR, points, INDEX_ZOOM)
+    top = 2 ** INDEX_ZOOM - 1
+    x = np.clip(np.floor(x), 0, top).astype(np.uint64)
+    y = np.clip(np.floor(y), 0, top).astype(np.uint64)
+    return x, y
+
+
+def _map_box(map):
+    """
+    Calculate bounding box of a map in integer tile coordinates at index
+    zoom.
+
+    :param map: Map instance.
+    """
+    provider = map.provider
+    w, h = map.size
+    ox, oy = map.offset
+    scale = 2 ** (INDEX_ZOOM - map.zoom)
+
+    # tile coordinates of top-left and bottom-right corners of map image
+    x0 = map.origin[0] - (ox + w / 2) / provider.tile_width
+    y0 = map.origin[1] - (oy + h / 2) / provider.tile_height
+    x1 = x0 + w / provider.tile_width
+    y1 = y0 + h / provider.tile_height
+
+    top = 2 ** INDEX_ZOOM - 1
+    box = x0 * scale, y0 * scale, x1 * scale, y1 * scale
+    return tuple(min(max(int(v), 0), top) for v in box)
+
+
+def _ranges(codes, x0, y0, x1, y1):
+    """
+    Find ranges of index intersecting bounding box.
+
+    The bounding box is covered with quadtree cells not smaller than
+    a quarter of the box size, so there are up to 25 cells. Ranges of
+    consecutive cells are merged.
+
+    :param codes: Sorted Morton codes.
+    :param x0: Left coordinate of bounding box.
+    :param y0: Top coordinate of bounding box.
+    :param x1: Right coordinate of bounding box.
+    :param y1: Bottom coordinate of bounding box.
+    """
+    span = max(x1 - x0, y1 - y0, 1)
+    shift = min(max(span.bit_length() - 2, 0), INDEX_ZOOM - 1)
+
+    cx = np.arange(x0 >> shift, (x1 >> shift) + 1, dtype=np.uint64)
+    cy = np.arange(y0 >> shift, (y1 >> shift) + 1, dtype=np.uint64)
+    cx, cy = np.meshgrid(cx, cy)
+    cells = np.sort(_encode(cx.ravel(), cy.ravel()))
+
+    # upper bound of last cell is 2 ** 64, use inclusive bound to avoid
+    # overflow of unsigned 64-bit integers
+    size = np.uint64(1 << (2 * shift))
+    lo = np.searchsorted(codes, cells * size)
+    hi = np.searchsorted(codes, cells * size + (size - 1), side='right')
+
+    start = end = None
+    for i, j in zip(lo, hi):
+        if i == j:
+            continue
+        if i == end:
+            end = j
+            continue
+        if start is not None:
+            yield start, end
+        start, end = i, j
+    if start is not None:
+        yield start, end
+
+
+def _encode(x, y):
+    """
+    Calculate Morton codes of integer tile coordinates.
+
+    :param x: NumPy array of tile coordinates x.
+    :param y: NumPy array of tile coordinates y.
+    """
+    return _spread(x) | (_spread(y) << _SHIFTS[0])
+
+
+def _decode(codes):
+    """
+    Calculate integer tile coordinates of Morton codes.
+
+    :param codes: NumPy array of Morton codes.
+    """
+    return _compact(codes), _compact(codes >> _SHIFTS[0])
+
+
+def _spread(v):
+    """
+    Interleave bits of 32-bit integers with zeros.
+    """
+    v = v.astype(np.uint64)
+    for shift, mask in zip(reversed(_SHIFTS), reversed(_MASKS[:-1])):
+        v = (v | (v << shift)) & mask
+    return v
+
+
+def _compact(v):
+    """
+    Remove interleaved bits of 64-bit integers.
+    """
+    v = v & _MASKS[0]
+    for shift, mask in zip(_SHIFTS, _MASKS[1:]):
+        v = (v | (v >> shift)) & mask
+    return v
+
+
+# vim: sw=4:et:ai
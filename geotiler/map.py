@@ -30,20 +30,21 @@ GeoTiler map functionality.
 """
 
 import asyncio
+import collections
 import itertools
 import math
 import numbers
 import logging
+import time
 
 from .provider import DEFAULT_PROVIDER, find_provider, MapProvider
-from .geo import zoom_to
-from .tile.io import fetch_tiles
-from .tile.img import render_image
+from .geo import zoom_to, MAX_ZOOM, ZOOM_SCALE
+from .tile.io import fetch_tiles, _accepts_stats
+from .tile.grid import TileGrid
+from .tile.img import render_image, compose_image, _tile_image
 
 logger = logging.getLogger(__name__)
 
-MAX_ZOOM = 25
-
 class Map:
     """
     Map created from tiles and to be drawn as an image.
@@ -57,6 +58,8 @@ class Map:
     :var origin: Tile coordinates at map zoom level of base tile.
     :var offset: Position of base tile relative to map center.
     """
+    __slots__ = 'provider', 'origin', 'offset', '_zoom', '_size', '_grid'
+
     def __init__(
         self, extent=None, center=None, zoom=None, size=None,
         provider=DEFAULT_PROVIDER
@@ -92,6 +95,7 @@ class Map:
 
         self._zoom = zoom
         self._size = size
+        self._grid = None
 
         if center is not None and extent is not None:
             raise ValueError(
@@ -232,6 +236,27 @@ class Map:
         self._check_size(size)
         self._size = size
 
+    @property
+    def tile_grid(self):
+        """
+        Grid of map tiles of the map.
+
+        The grid contains coordinates of map tiles and their offsets within
+        map image. The grid is calculated once for a map state, i.e. until
+        map center, zoom or size changes.
+        """
+        state = self.origin, self.offset, self._zoom, tuple(self._size)
+        if self._grid is None or self._grid[0] != state:
+            coord, offset = _find_top_left_tile(self)
+            grid = TileGrid(
+                self._zoom,
+                _tile_coords(self, coord, offset),
+                _tile_offsets(self, offset)
+            )
+            self._grid = state, grid
+        return self._grid[1]
+
+
     def _check_size(self, size):
         """
         Check if `size` parameter has correct type.
@@ -279,7 +304,38 @@ class Map:
 
 
     def __str__(self):
-        return 'Map({provider}, {_size}, {origin}, {offset})'.format(**self.__dict__)
+        return 'Map({}, {}, {}, {})'.format(
+            self.provider, self._size, self.origin, self.offset
+        )
+
+
+    def copy(self):
+        """
+        Create copy of the map.
+
+        The copy shares map provider with the map. No map calculations are
+        performed, so copying a map is cheaper than creating new map.
+        """
+        cls = type(self)
+        map = cls.__new__(cls)
+        map.provider = self.provider
+        map.origin = self.origin
+        map.offset = self.offset
+        map._zoom = self._zoom
+        map._size = self._size
+        map._grid = self._grid
+        return map
+
+
+    def with_center(self, center):
+        """
+        Create copy of the map with new map geographical center.
+
+        :param center: Map geographical center.
+        """
+        map = self.copy()
+        map.center = center
+        return map
 
 
     def rev_geocode(self, location):
@@ -326,8 +382,11 @@ class Map:
         ytiles = (y - self.offset[1]) / self.provider.tile_height
 
         # distance in rows & columns at maximum zoom
-        xDistance = xtiles * math.pow(2, (MAX_ZOOM - self._zoom))
-        yDistance = ytiles * math.pow(2, (MAX_ZOOM - self._zoom))
+        scale = ZOOM_SCALE.get(MAX_ZOOM - self._zoom)
+        if scale is None:
+            scale = math.pow(2, MAX_ZOOM - self._zoom)
+        xDistance = xtiles * scale
+        yDistance = ytiles * scale
 
         # new point coordinate reflecting that distance
         x = round(max_coord[0] + xDistance)
@@ -340,28 +399,43 @@ class Map:
         return location
 
 
-def render_map(map, downloader=None, loop=None, **kw):
+def render_map(
+    map, downloader=None, loop=None, mode='RGBA', encoder=None,
+    executor=None, stats=None, **kw
+):
     """
     Download map tiles and render map image.
 
     If `downloader` is null, then default map tiles downloader is used
     (:py:func:`geotiler.tile.io.fetch_tiles`).
 
-    The function returns an image (instance of `PIL.Image` class).
+    The function returns an image (instance of `PIL.Image` class). If
+    `encoder` is specified, then the function returns image file data
+    created with the encoder, see :py:func:`geotiler.render_map_async`.
 
     :param map: Map instance.
     :param downloader: Map tiles downloader.
     :param loop: Asyncio loop (used default one if `None`).
+    :param mode: Map image mode, determined automatically if `None`.
+    :param encoder: Map image encoder.
+    :param executor: Executor to run map image encoder.
+    :param stats: Map rendering statistics object.
     :param kw: Parameters passed to default downloader.
     """
-    task = render_map_async(map, downloader=downloader, loop=loop, **kw)
+    task = render_map_async(
+        map, downloader=downloader, loop=loop, mode=mode, encoder=encoder,
+        executor=executor, stats=stats, **kw
+    )
     if loop is None:
         loop = asyncio.get_event_loop()
     return loop.run_until_complete(task)
 
 
 @asyncio.coroutine
-def render_map_async(map, downloader=None, **kw):
+def render_map_async(
+    map, downloader=None, mode='RGBA', encoder=None, executor=None,
+    stats=None, **kw
+):
     """
     Asyncio coroutine to download map tiles asynchronously and render map
     image.
@@ -369,28 +443,508 @@ def render_map_async(map, downloader=None, **kw):
     If `downloader` is null, then default map tiles downloader is used
     (:py:func:`geotiler.tile.io.fetch_tiles`).
 
-    The function returns an image (instance of `PIL.Image` class).
+    The function returns an image (instance of `PIL.Image` class). The
+    image mode is `RGBA` by default. If `mode` is null, then `RGB` mode is
+    chosen for opaque map tiles, i.e. JPEG map tiles, and map tiles are
+    pasted in their native mode (see
+    :py:func:`geotiler.tile.img.compose_image`).
+
+    If `encoder` is specified, then map image is encoded with the encoder
+    and image file data is returned. The encoder is a function accepting
+    map image as its only parameter, i.e.::
+
+        encoder = functools.partial(encode_image, format='png', colors=64)
+
+    The encoder is run with executor, so asyncio loop is not blocked while
+    encoding map image. Default executor of asyncio loop is used if
+    `executor` is null. Use `concurrent.futures.ProcessPoolExecutor` to
+    encode map images with a pool of processes.
+
+    If `stats` is specified, then statistics of map rendering are recorded
+    with the statistics object (see :py:class:`geotiler.stats.RenderStats`).
+    The statistics object is passed to downloader with `stats` parameter,
+    so the downloader can record cache hits and downloaded map tiles. The
+    parameter is passed only if the downloader accepts it, see
+    :ref:`downloader`.
 
     :param map: Map instance.
     :param downloader: Map tiles downloader.
     :param loop: Asyncio loop (used default one if `None`).
+    :param mode: Map image mode, determined automatically if `None`.
+    :param encoder: Map image encoder, i.e.
+        :py:func:`geotiler.encode.encode_image`.
+    :param executor: Executor to run map image encoder.
+    :param stats: Map rendering statistics object.
     :param kw: Parameters passed to default downloader.
     """
     if downloader is None:
         downloader = fetch_tiles
 
-    tile_url = map.provider.tile_url
+    grid = map.tile_grid
+    urls = map.provider.tile_urls(grid, map.zoom)
+    if stats is not None:
+        stats.requested(len(urls))
+        if _accepts_stats(downloader):
+            kw['stats'] = stats
+    tile_data = yield from downloader(urls, **kw)
 
-    # NOTE: consider having origin tile at top-left tile instead of the
-    # center, then we could skip this step
-    coord, offset = _find_top_left_tile(map)
+    image = render_image(map, tile_data, grid.offsets, mode, stats=stats)
+
+    if encoder is not None:
+        loop = kw.get('loop')
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        start = time.perf_counter()
+        image = yield from loop.run_in_executor(executor, encoder, image)
+        if stats is not None:
+            stats.encode_time += time.perf_counter() - start
+
+    if stats is not None:
+        stats.done()
+    return image
+
+
+def render_maps(maps, downloader=None, loop=None, mode='RGBA', **kw):
+    """
+    Download map tiles and render map images for a collection of maps.
+
+    Map tiles shared by the maps are downloaded and decoded only once. See
+    :py:func:`geotiler.render_maps_async` for details.
+
+    The function is a generator of pairs of a map and its image (instance
+    of `PIL.Image` class). The pairs are generated in order of map
+    rendering completion.
+
+    :param maps: Collection of map instances.
+    :param downloader: Map tiles downloader.
+    :param loop: Asyncio loop (used default one if `None`).
+    :param mode: Map image mode, determined automatically if `None`.
+    :param kw: Parameters passed to default downloader.
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    tasks = render_maps_async(
+        maps, downloader=downloader, loop=loop, mode=mode, **kw
+    )
+    for task in tasks:
+        yield loop.run_until_complete(task)
+
+
+def render_maps_async(maps, downloader=None, mode='RGBA', **kw):
+    """
+    Download map tiles asynchronously and render map images for
+    a collection of maps.
+
+    The union of map tiles of all maps is calculated. Each map tile is
+    downloaded and decoded only once. Map tiles, not downloaded yet, are
+    requested with downloader in a batch per map. The number of concurrent
+    batches is limited by map provider `limit` attribute.
+
+    If `downloader` is null, then default map tiles downloader is used
+    (:py:func:`geotiler.tile.io.fetch_tiles`).
+
+    The function returns an iterator of asyncio coroutines (see
+    `asyncio.as_completed`). Each coroutine returns pair of a map and its
+    image (instance of `PIL.Image` class).
+
+    :param maps: Collection of map instances.
+    :param downloader: Map tiles downloader.
+    :param loop: Asyncio loop (used default one if `None`).
+    :param mode: Map image mode, determined automatically if `None`.
+    :param kw: Parameters passed to default downloader.
+    """
+    if downloader is None:
+        downloader = fetch_tiles
+
+    loop = kw.get('loop')
+    if loop is None:
+        loop = asyncio.get_event_loop()
+
+    tiles = {}
+    limits = {}
+    tasks = []
+    for map in maps:
+        provider = map.provider
+        grid = map.tile_grid
+        keys = tuple((provider.url, map.zoom, c) for c in grid)
+        missing = tuple(k for k in keys if k not in tiles)
+        if missing:
+            limit = limits.get(provider.url)
+            if limit is None:
+                limit = asyncio.Semaphore(provider.limit, loop=loop)
+                limits[provider.url] = limit
+            urls = provider.tile_urls((c for _, _, c in missing), map.zoom)
+            task = _fetch_images(limit, downloader, urls, mode, **kw)
+            task = asyncio.ensure_future(task, loop=loop)
+            tiles.update((k, (task, i)) for i, k in enumerate(missing))
+
+        images = [tiles[k] for k in keys]
+        task = _render_images(map, images, grid.offsets, mode)
+        tasks.append(task)
+
+    return asyncio.as_completed(tasks, loop=loop)
+
+
+@asyncio.coroutine
+def _fetch_images(limit, downloader, urls, mode, **kw):
+    """
+    Download and decode map tiles.
+
+    :param limit: Semaphore limiting number of concurrent downloads.
+    :param downloader: Map tiles downloader.
+    :param urls: Collection of URLs of map tiles.
+    :param mode: Mode of tile images.
+    :param kw: Parameters passed to downloader.
+    """
+    yield from limit.acquire()
+    try:
+        tile_data = yield from downloader(urls, **kw)
+    finally:
+        limit.release()
+    return tuple(_tile_image(t, mode) if t else None for t in tile_data)
+
+
+@asyncio.coroutine
+def _render_images(map, tiles, offsets, mode):
+    """
+    Wait for map tile images and compose map image.
+
+    :param map: Map instance.
+    :param tiles: Collection of pairs of tile images task and tile index.
+    :param offsets: Tile offset within map image for each tile.
+    :param mode: Map image mode.
+    """
+    images = []
+    for task, i in tiles:
+        result = yield from task
+        images.append(result[i])
+    return map, compose_image(map, images, offsets, mode)
+
+
+def render_frames(
+    maps, downloader=None, loop=None, mode='RGBA', prefetch=2, window=256,
+    **kw
+):
+    """
+    Download map tiles and render map images for a sequence of map
+    frames.
+
+    Map tiles shared by consecutive maps are downloaded and decoded only
+    once. See :py:func:`geotiler.render_frames_async` for details.
+
+    The function is a generator of pairs of a map and its image (instance
+    of `PIL.Image` class). The pairs are generated in order of the maps.
+
+    :param maps: Sequence of map instances.
+    :param downloader: Map tiles downloader.
+    :param loop: Asyncio loop (used default one if `None`).
+    :param mode: Map image mode, determined automatically if `None`.
+    :param prefetch: Number of maps, which map tiles are prefetched.
+    :param window: Number of decoded map tiles kept in memory.
+    :param kw: Parameters passed to default downloader.
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+
+    frames = render_frames_async(
+        maps, downloader=downloader, loop=loop, mode=mode,
+        prefetch=prefetch, window=window, **kw
+    )
+    try:
+        while True:
+            # no StopAsyncIteration in Python 3.4, use the sentinel
+            frame = loop.run_until_complete(frames._next())
+            if frame is None:
+                break
+            yield frame
+    finally:
+        frames.close()
+
+
+def render_frames_async(
+    maps, downloader=None, mode='RGBA', prefetch=2, window=256, **kw
+):
+    """
+    Download map tiles asynchronously and render map images for
+    a sequence of map frames, i.e. map following a track.
+
+    The function returns asynchronous iterator of pairs of a map and its
+    image (instance of `PIL.Image` class). The pairs are generated in order
+    of the maps, i.e.::
+
+        frames = render_frames_async(
+            map.with_center(p) for p in track
+        )
+        async for map, image in frames:
+            ...
 
-    coords = _tile_coords(map, coord, offset)
-    urls = tuple(tile_url(c, map.zoom) for c in coords)
+    Map tiles of up to `prefetch` upcoming maps are downloaded and decoded
+    while map image of current map is rendered. Decoded map tiles are kept
+    in a sliding window of up to `window` map tiles, so map tiles shared
+    by consecutive maps are downloaded and decoded only once. Memory use is
+    bound by the size of the window and the number of prefetched maps.
+
+    The maps are copied when fetched from the sequence, so the sequence
+    can change and yield the same map instance.
+
+    If `downloader` is null, then default map tiles downloader is used
+    (:py:func:`geotiler.tile.io.fetch_tiles`). The number of concurrent
+    downloads is limited by map provider `limit` attribute.
+
+    Use `close` method of the iterator to cancel download of prefetched
+    map tiles if the iteration is stopped early.
+
+    :param maps: Sequence of map instances.
+    :param downloader: Map tiles downloader.
+    :param loop: Asyncio loop (used default one if `None`).
+    :param mode: Map image mode, determined automatically if `None`.
+    :param prefetch: Number of maps, which map tiles are prefetched.
+    :param window: Number of decoded map tiles kept in memory.
+    :param kw: Parameters passed to default downloader.
+    """
+    if downloader is None:
+        downloader = fetch_tiles
+    return _Frames(maps, downloader, mode, prefetch, window, kw)
+
+
+class _Frames:
+    """
+    Asynchronous iterator of map frames.
+
+    :var maps: Iterator of maps.
+    :var queue: Queue of prefetched maps, their map tiles keys and grids.
+    :var tiles: Sliding window of decoded map tile images.
+    :var pending: Map tile key to pair of download task and tile index.
+    """
+    def __init__(self, maps, downloader, mode, prefetch, window, kw):
+        self.maps = iter(maps)
+        self.downloader = downloader
+        self.mode = mode
+        self.prefetch = prefetch
+        self.window = window
+        self.kw = kw
+
+        self.loop = kw.get('loop')
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+
+        self.queue = collections.deque()
+        self.tiles = collections.OrderedDict()
+        self.pending = {}
+        self.limits = {}
+
+
+    def __aiter__(self):
+        return self
+
+
+    @asyncio.coroutine
+    def __anext__(self):
+        frame = yield from self._next()
+        if frame is None:
+            raise StopAsyncIteration()
+        return frame
+
+
+    def close(self):
+        """
+        Cancel download of prefetched map tiles.
+        """
+        for task, _ in self.pending.values():
+            task.cancel()
+        self.pending.clear()
+        self.queue.clear()
+
+
+    @asyncio.coroutine
+    def _next(self):
+        """
+        Render map image of next map.
+
+        Pair of a map and its image is returned or `None` if there are no
+        more maps.
+        """
+        self._prefetch()
+        if not self.queue:
+            return None
+
+        map, keys, grid = self.queue.popleft()
+
+        # map tiles might be evicted from the window before the map is
+        # rendered
+        missing = tuple(
+            k for k in keys if k not in self.tiles and k not in self.pending
+        )
+        self._fetch(map, missing)
+
+        tiles = self.tiles
+        for k in keys:
+            if k not in tiles:
+                task, i = self.pending.pop(k)
+                result = yield from task
+                tiles[k] = result[i]
+            tiles.move_to_end(k)
+
+        images = [tiles[k] for k in keys]
+        image = compose_image(map, images, grid.offsets, self.mode)
+
+        # evict after map image is composed, so all map tile images of
+        # a map are available even if the map is larger than the window
+        while len(tiles) > self.window:
+            tiles.popitem(last=False)
+
+        return map, image
+
+
+    def _prefetch(self):
+        """
+        Start download of map tiles of upcoming maps.
+        """
+        queue = self.queue
+        while len(queue) <= self.prefetch:
+            map = next(self.maps, None)
+            if map is None:
+                break
+
+            map = map.copy()
+            grid = map.tile_grid
+            keys = tuple((map.provider.url, map.zoom, c) for c in grid)
+            missing = tuple(
+                k for k in keys
+                if k not in self.tiles and k not in self.pending
+            )
+            self._fetch(map, missing)
+            queue.append((map, keys, grid))
+
+
+    def _fetch(self, map, keys):
+        """
+        Start download of map tiles.
+
+        :param map: Map instance.
+        :param keys: Keys of map tiles to download.
+        """
+        if not keys:
+            return
+
+        provider = map.provider
+        limit = self.limits.get(provider.url)
+        if limit is None:
+            limit = asyncio.Semaphore(provider.limit, loop=self.loop)
+            self.limits[provider.url] = limit
+
+        urls = provider.tile_urls((c for _, _, c in keys), map.zoom)
+        task = _fetch_images(
+            limit, self.downloader, urls, self.mode, **self.kw
+        )
+        task = asyncio.ensure_future(task, loop=self.loop)
+        self.pending.update((k, (task, i)) for i, k in enumerate(keys))
+
+
+def render_map_blocks(
+    map, rows=1, cols=None, downloader=None, loop=None, mode='RGBA', **kw
+):
+    """
+    Download map tiles and render map image block by block.
+
+    Map image is split into blocks aligned with map tiles. Each block
+    contains up to `rows` rows and `cols` columns of map tiles. Strips of
+    map image are rendered if `cols` is null. Map tiles intersecting a
+    block are downloaded and composed into an image of the block only, so
+    memory use is bound by the size of a block and not by the size of the
+    map image.
+
+    The function is a generator of pairs of a block box and its image
+    (instance of `PIL.Image` class). The box is a tuple of left, upper,
+    right and lower coordinates of the block within map image. The blocks
+    are generated in row-major order, i.e. strips of a map image can be
+    written with :py:class:`geotiler.encode.PNGWriter` in order.
+
+    If `mode` is null, then the mode of all images is determined with the
+    first block.
+
+    :param map: Map instance.
+    :param rows: Number of rows of map tiles in a block.
+    :param cols: Number of columns of map tiles in a block.
+    :param downloader: Map tiles downloader.
+    :param loop: Asyncio loop (used default one if `None`).
+    :param mode: Map image mode, determined automatically if `None`.
+    :param kw: Parameters passed to default downloader.
+    """
+    if downloader is None:
+        downloader = fetch_tiles
+
+    if loop is None:
+        loop = asyncio.get_event_loop()
+
+    for block in _map_blocks(map, rows, cols):
+        task = _render_block(map, block, downloader, mode, loop=loop, **kw)
+        box, image = loop.run_until_complete(task)
+        mode = image.mode
+        yield box, image
+
+
+@asyncio.coroutine
+def _render_block(map, block, downloader, mode, **kw):
+    """
+    Download map tiles of a map image block and render its image.
+
+    :param map: Map instance.
+    :param block: Map image block.
+    :param downloader: Map tiles downloader.
+    :param mode: Map image mode.
+    :param kw: Parameters passed to downloader.
+    """
+    box, coords, offsets = block
+    urls = map.provider.tile_urls(coords, map.zoom)
     tile_data = yield from downloader(urls, **kw)
 
-    offsets = _tile_offsets(map, offset)
-    return render_image(map, tile_data, offsets)
+    size = box[2] - box[0], box[3] - box[1]
+    return box, render_image(map, tile_data, offsets, mode, size)
+
+
+def _map_blocks(map, rows, cols):
+    """
+    Split map image into blocks aligned with map tiles.
+
+    Each block is a tuple of block box, coordinates of its map tiles and
+    offsets of its map tiles relative to the block box.
+
+    :param map: Map instance.
+    :param rows: Number of rows of map tiles in a block.
+    :param cols: Number of columns of map tiles in a block, all columns if
+        `None`.
+    """
+    coord, offset = _find_top_left_tile(map)
+    tw = map.provider.tile_width
+    th = map.provider.tile_height
+    w, h = map.size
+
+    n = (w - offset[0] + tw - 1) // tw
+    m = (h - offset[1] + th - 1) // th
+    if cols is None:
+        cols = n
+
+    for j in range(0, m, rows):
+        y0 = max(0, offset[1] + j * th)
+        y1 = min(h, offset[1] + (j + rows) * th)
+        tile_rows = range(j, min(m, j + rows))
+
+        for i in range(0, n, cols):
+            x0 = max(0, offset[0] + i * tw)
+            x1 = min(w, offset[0] + (i + cols) * tw)
+            tile_cols = range(i, min(n, i + cols))
+
+            if x0 >= x1 or y0 >= y1:
+                continue
+
+            tiles = tuple(itertools.product(tile_cols, tile_rows))
+            coords = tuple((coord[0] + c, coord[1] + r) for c, r in tiles)
+            offsets = tuple(
+                (offset[0] + c * tw - x0, offset[1] + r * th - y0)
+                for c, r in tiles
+            )
+            yield (x0, y0, x1, y1), coords, offsets
 
 
 def _tile_coords(map, coord, offset):
@@ -402,9 +956,12 @@ def _tile_coords(map, coord, offset):
     :param offset: Map image offset of top-left tile.
     """
     w, h = map.size
+    tw = map.provider.tile_width
+    th = map.provider.tile_height
 
-    n = (w - offset[0]) // map.provider.tile_width + 1
-    m = (h - offset[1]) // map.provider.tile_height + 1
+    # number of columns and rows of map tiles intersecting map image
+    n = (w - offset[0] + tw - 1) // tw
+    m = (h - offset[1] + th - 1) // th
     cols = range(coord[0], coord[0] + n)
     rows = range(coord[1], coord[1] + m)
     return itertools.product(cols, rows)
@@ -0,0 +1,302 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Background prefetch of map tiles.
+
+Map tiles, which are likely to be required soon, are downloaded in the
+background with a caching downloader, so map image is rendered with map
+tiles from the cache when it is needed.
+"""
+
+import asyncio
+import collections
+import logging
+import math
+
+from .geo import MAX_ZOOM
+from .map import calculateMapCenter
+
+logger = logging.getLogger(__name__)
+
+class Prefetch:
+    """
+    Background download of map tiles into a cache.
+
+    Map tiles are downloaded in batches, one batch at a time, so prefetch
+    uses single connection of map provider and map rendering is not
+    delayed by prefetch. The prefetch yields to other tasks of asyncio
+    loop before each batch.
+
+    The downloader has to be caching downloader, i.e. created with
+    :py:func:`geotiler.cache.redis_downloader`. Map tiles data returned by
+    downloader is discarded.
+
+    :var map: Map instance.
+    :var downloader: Caching map tiles downloader.
+    :var batch: Number of map tiles downloaded in a batch.
+    :var loop: Asyncio loop.
+    """
+    # maximum number of remembered URLs of prefetched map tiles
+    MAX_SEEN = 4096
+
+    def __init__(self, map, downloader, batch=4, loop=None):
+        """
+        Create background download of map tiles.
+
+        :param map: Map instance.
+        :param downloader: Caching map tiles downloader.
+        :param batch: Number of map tiles downloaded in a batch.
+        :param loop: Asyncio loop (used default one if `None`).
+        """
+        self.map = map
+        self.downloader = downloader
+        self.batch = batch
+        self.loop = asyncio.get_event_loop() if loop is None else loop
+
+        self._queue = collections.deque()
+        self._seen = collections.OrderedDict()
+        self._task = None
+
+
+    def cancel(self):
+        """
+        Cancel download of map tiles.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._queue.clear()
+        self._seen.clear()
+
+
+    def _prefetch(self, urls):
+        """
+        Schedule download of map tiles.
+
+        Map tiles already scheduled are ignored.
+
+        :param urls: Collection of URLs of map tiles.
+        """
+        seen = self._seen
+        urls = [u for u in urls if u not in seen]
+        seen.update((u, None) for u in urls)
+        while len(seen) > self.MAX_SEEN:
+            seen.popitem(last=False)
+
+        self._queue.extend(urls)
+        if urls and (self._task is None or self._task.done()):
+            task = self._download()
+            self._task = asyncio.ensure_future(task, loop=self.loop)
+
+
+    @asyncio.coroutine
+    def _download(self):
+        """
+        Download scheduled map tiles in batches.
+        """
+        queue = self._queue
+        while queue:
+            yield from asyncio.sleep(0, loop=self.loop)
+
+            n = min(self.batch, len(queue))
+            urls = tuple(queue.popleft() for _ in range(n))
+            try:
+                yield from self.downloader(urls, loop=self.loop)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logger.warning('map tiles prefetch failed: {}'.format(ex))
+
+
+class MotionPrefetch(Prefetch):
+    """
+    Prefetch of map tiles along motion vector of a map.
+
+    Map center is recorded on each call of :py:meth:`update` method. The
+    heading and speed of the map are extrapolated from the recent map
+    centers. The map tiles visible at the extrapolated map centers of next
+    `steps` updates are downloaded in the background, i.e.::
+
+        prefetch = MotionPrefetch(map, downloader)
+        while True:
+            map.center = yield from read_position()
+            prefetch.update()
+            image = yield from render_map_async(map, downloader=downloader)
+
+    The download of map tiles is cancelled when the heading changes by
+    more than `angle` or map zoom changes.
+
+    :var history: Number of recorded map centers.
+    :var steps: Number of extrapolated map centers.
+    :var angle: Maximum heading change in radians, which does not cancel
+        the download.
+    """
+    def __init__(
+        self, map, downloader, history=4, steps=3, angle=math.pi / 4,
+        batch=4, loop=None
+    ):
+        """
+        Create prefetch of map tiles along motion vector of a map.
+
+        :param map: Map instance.
+        :param downloader: Caching map tiles downloader.
+        :param history: Number of recorded map centers.
+        :param steps: Number of extrapolated map centers.
+        :param angle: Maximum heading change in radians.
+        :param batch: Number of map tiles downloaded in a batch.
+        :param loop: Asyncio loop (used default one if `None`).
+        """
+        super().__init__(map, downloader, batch=batch, loop=loop)
+        self.steps = steps
+        self.angle = angle
+
+        self._history = collections.deque(maxlen=history)
+        self._zoom = None
+        self._heading = None
+
+
+    def update(self, timestamp=None):
+        """
+        Record map center and schedule download of map tiles along motion
+        vector of the map.
+
+        :param timestamp: Time of map center change, i.e. GPS time (asyncio
+            loop time if `None`).
+        """
+        map = self.map
+        if timestamp is None:
+            timestamp = self.loop.time()
+
+        if map.zoom != self._zoom:
+            self.cancel()
+            self._history.clear()
+            self._heading = None
+            self._zoom = map.zoom
+
+        history = self._history
+        history.append((timestamp, _center_coord(map)))
+        if len(history) < 2:
+            return
+
+        (t1, c1), (t2, c2) = history[0], history[-1]
+        dt = t2 - t1
+        if dt <= 0:
+            return
+
+        vx = (c2[0] - c1[0]) / dt
+        vy = (c2[1] - c1[1]) / dt
+        if vx == 0 and vy == 0:
+            return
+
+        heading = math.atan2(vy, vx)
+        if self._heading is not None:
+            delta = heading - self._heading
+            delta = (delta + math.pi) % (2 * math.pi) - math.pi
+            if abs(delta) > self.angle:
+                if __debug__:
+                    logger.debug('heading changed, prefetch cancelled')
+                self.cancel()
+        self._heading = heading
+
+        # extrapolate map centers using average time between updates
+        interval = dt / (len(history) - 1)
+        current = map.tile_grid
+        grid = None
+        for k in range(1, self.steps + 1):
+            c = c2[0] + vx * interval * k, c2[1] + vy * interval * k
+            m = map.copy()
+            m.origin, m.offset = calculateMapCenter(map.provider, c)
+            grid = m.tile_grid if grid is None else grid | m.tile_grid
+
+        grid = grid - current
+        self._prefetch(map.provider.tile_urls(grid, map.zoom))
+
+
+class ZoomPrefetch(Prefetch):
+    """
+    Prefetch of map tiles of adjacent zoom levels of a map.
+
+    Map tiles of the map after zoom change by each of `levels` are
+    downloaded in the background on each call of :py:meth:`update`
+    method, so zoom in or zoom out renders map image with map tiles from
+    the cache, i.e.::
+
+        prefetch = ZoomPrefetch(map, downloader)
+        image = yield from render_map_async(map, downloader=downloader)
+        prefetch.update()
+
+    The download of map tiles is cancelled when map center, zoom or size
+    changes.
+
+    :var levels: Zoom level changes.
+    """
+    def __init__(self, map, downloader, levels=(1, -1), batch=4, loop=None):
+        """
+        Create prefetch of map tiles of adjacent zoom levels of a map.
+
+        :param map: Map instance.
+        :param downloader: Caching map tiles downloader.
+        :param levels: Zoom level changes.
+        :param batch: Number of map tiles downloaded in a batch.
+        :param loop: Asyncio loop (used default one if `None`).
+        """
+        super().__init__(map, downloader, batch=batch, loop=loop)
+        self.levels = levels
+        self._state = None
+
+
+    def update(self):
+        """
+        Schedule download of map tiles of adjacent zoom levels of the map.
+
+        Download of map tiles for previous map state is cancelled.
+        """
+        map = self.map
+        state = map.origin, map.offset, map.zoom, tuple(map.size)
+        if state == self._state:
+            return
+
+        self.cancel()
+        self._state = state
+
+        urls = []
+        for level in self.levels:
+            zoom = map.zoom + level
+            if 0 <= zoom <= MAX_ZOOM:
+                m = map.copy()
+                m.zoom = zoom
+                urls.extend(m.provider.tile_urls(m.tile_grid, zoom))
+        self._prefetch(urls)
+
+
+def _center_coord(map):
+    """
+    Calculate tile coordinates of map center at map zoom.
+
+    :param map: Map instance.
+    """
+    provider = map.provider
+    return (
+        map.origin[0] - map.offset[0] / provider.tile_width,
+        map.origin[1] - map.offset[1] / provider.tile_height,
+    )
+
+
+# vim: sw=4:et:ai
@@ -30,24 +30,33 @@ Load and create map providers.
 """
 
 import glob
-import itertools
 import json
 import logging
 import os.path
+import re
+import string
+import urllib.request
 
-from math import pi
-from .geo import MercatorProjection, deriveTransformation
+from .geo import WEB_MERCATOR
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_PROVIDER = 'osm'
 
+# registry of map providers; map provider id -> map provider and map
+# provider id -> map provider JSON file name for map providers to be loaded
+_PROVIDERS = {}
+_SOURCES = {}
+_base_dir_registered = False
+
 # the attributes inspired by poor-maps project tile source definition
 # https://github.com/otsaloma/poor-maps/tree/master/tilesources
 ATTRIBUTES = 'id', 'name', 'attribution', 'url', 'subdomains', 'extension', \
-    'limit'
+    'limit', 'path'
 
 class MapProvider:
+    __slots__ = ATTRIBUTES + ('projection', '_url_formats', '_url_re')
+
     def __init__(self, data):
         self.id = None
         self.name = None
@@ -56,17 +65,23 @@ class MapProvider:
         self.subdomains = tuple()
         self.extension = 'png'
         self.limit = 1
+        self.path = None
 
         attrs = ((n, data[n]) for n in ATTRIBUTES if n in data)
-        self.__dict__.update(attrs)
+        for n, v in attrs:
+            setattr(self, n, v)
 
-        # the spherical mercator world tile covers (-π, -π) to (π, π)
-        t = deriveTransformation(-pi, pi, 0, 0, pi, pi, 1, 0, -pi, -pi, 0, 1)
-        self.projection = MercatorProjection(0, t)
-        if self.subdomains:
-            self.subdomain_cycler = itertools.cycle(self.subdomains)
-        else:
-            self.subdomain_cycler = itertools.cycle(('', ))
+        # local map tiles source, i.e. /data/tiles/{z}/{x}/{y}.{ext}
+        if self.path is not None:
+            self.path = os.path.abspath(os.path.expanduser(self.path))
+            if self.url is None:
+                url = urllib.request.pathname2url(self.path)
+                url = url.replace('%7B', '{').replace('%7D', '}')
+                self.url = 'file://' + url
+
+        self.projection = WEB_MERCATOR
+        self._url_formats = None
+        self._url_re = None
 
     @property
     def tile_width(self):
@@ -77,42 +92,206 @@ class MapProvider:
         return 256
 
     def tile_url(self, tile_coord, zoom):
-        params = {
-            'subdomain': next(self.subdomain_cycler),
-            'x': tile_coord[0],
-            'y': tile_coord[1],
-            'z': zoom,
-            'ext': self.extension,
-        }
-        url = self.url.format(**params)
+        """
+        Create URL of map tile.
+
+        Subdomain of map tile URL is determined with map tile coordinates,
+        so URL of a map tile is always the same.
+
+        :param tile_coord: Tile coordinates.
+        :param zoom: Zoom of tile coordinates.
+        """
+        formats = self._formats()
+        x, y = tile_coord
+        return formats[(x + y) % len(formats)](x=x, y=y, z=zoom)
+
+    def tile_urls(self, coords, zoom):
+        """
+        Create URLs of map tiles.
+
+        Tuple of URLs is returned.
+
+        :param coords: Collection of tile coordinates.
+        :param zoom: Zoom of tile coordinates.
+        """
+        formats = self._formats()
+        n = len(formats)
+        urls = tuple(formats[(x + y) % n](x=x, y=y, z=zoom) for x, y in coords)
         if __debug__:
-            logger.debug('tile url: {}'.format(url))
-        return url
+            logger.debug('created {} tile urls'.format(len(urls)))
+        return urls
+
+    def _formats(self):
+        """
+        Get URL format functions of map provider.
+        """
+        formats = self._url_formats
+        if formats is None:
+            formats = _url_formats(self.url, self.subdomains, self.extension)
+            self._url_formats = formats
+        return formats
+
+    def parse_url(self, url):
+        """
+        Parse map tile URL and return tile coordinates and zoom.
+
+        This is reverse operation of :py:meth:`MapProvider.tile_url`. Pair
+        of tile coordinates and zoom is returned or `None` if URL does not
+        match URL template of the map provider.
+
+        :param url: URL of map tile.
+        """
+        if self._url_re is None:
+            self._url_re = _url_regex(self.url, self.extension)
+        match = self._url_re.match(url)
+        if match is None:
+            return None
+        x, y, z = (int(v) for v in match.group('x', 'y', 'z'))
+        return (x, y), z
+
+
+def _url_formats(url, subdomains, extension):
+    """
+    Create URL format functions of map provider for each subdomain.
+
+    Subdomain and file extension are substituted in map provider URL
+    template once, so only tile coordinates and zoom are substituted when
+    creating map tile URL.
+
+    :param url: Map provider URL template.
+    :param subdomains: Map provider subdomains.
+    :param extension: Map tiles file extension.
+    """
+    if not subdomains:
+        subdomains = ('',)
+    fields = {'x': '{x}', 'y': '{y}', 'z': '{z}', 'ext': extension}
+    templates = (url.format(subdomain=s, **fields) for s in subdomains)
+    return tuple(t.format for t in templates)
+
+def _url_regex(url, extension):
+    """
+    Create regular expression matching URLs created with map provider URL
+    template.
+
+    :param url: Map provider URL template.
+    :param extension: Map tiles file extension.
+    """
+    fields = {
+        'subdomain': '[^./]*',
+        'x': r'(?P<x>\d+)',
+        'y': r'(?P<y>\d+)',
+        'z': r'(?P<z>\d+)',
+        'ext': re.escape(extension),
+    }
+    items = string.Formatter().parse(url)
+    regex = ''.join(
+        re.escape(text) + (fields[name] if name else '')
+        for text, name, _, _ in items
+    )
+    return re.compile(regex + '$')
 
 
 def providers():
     """
     Get sorted list of all map providers identificators.
+
+    The list contains identificators of map providers from GeoTiler map
+    provider data base directory and of registered map providers.
     """
-    path = os.path.join(base_dir(), '*.json')
-    if __debug__:
-        logger.debug('list map providers from {}'.format(path))
-    pid = lambda fn: os.path.splitext(os.path.basename(fn))[0]
-    return sorted(pid(fn) for fn in glob.iglob(path))
+    _register_base_dir()
+    return sorted(set(_SOURCES) | set(_PROVIDERS))
 
 def find_provider(id):
     """
-    Load map provider data from JSON file and create map provider.
+    Find map provider.
+
+    Map provider is loaded from its JSON file on first use. The map provider
+    instance is shared by all callers of the function.
+
+    If map provider is not found, then `ValueError` exception is raised.
+
+    :param id: Map provider identificator.
+    """
+    provider = _PROVIDERS.get(id)
+    if provider is None:
+        _register_base_dir()
+        fn = _SOURCES.get(id)
+        if fn is None:
+            raise ValueError('Unknown map provider: {}'.format(id))
+
+        if __debug__:
+            logger.debug('loading map provider "{}" from {}'.format(id, fn))
+        with open(fn, encoding='utf8') as f:
+            data = json.load(f)
+
+        # path of local map tiles is relative to map provider file
+        if 'path' in data:
+            path = os.path.expanduser(data['path'])
+            data['path'] = os.path.join(os.path.dirname(fn), path)
+        provider = register_provider(data, id)
+    return provider
 
+def register_provider(data, id=None):
+    """
+    Create map provider using map provider data and register it.
+
+    The map provider identificator is read from map provider data if `id`
+    parameter is null.
+
+    Registered map provider is returned.
+
+    :param data: Map provider data.
     :param id: Map provider identificator.
     """
-    fn = os.path.join(base_dir(), id + '.json')
+    provider = MapProvider(data)
+    if id is not None:
+        provider.id = id
+    if provider.id is None:
+        raise ValueError('Map provider identificator is missing')
+    _PROVIDERS[provider.id] = provider
+    return provider
+
+def register_providers(path):
+    """
+    Register map providers from a directory containing JSON files of map
+    providers data.
+
+    The map providers are loaded on first use. Identificator of a map
+    provider is its JSON file name without extension.
+
+    :param path: Directory containing map providers data.
+    """
+    for id, fn in _sources(path):
+        _SOURCES[id] = fn
+        _PROVIDERS.pop(id, None)
+
+def _register_base_dir():
+    """
+    Register map providers from GeoTiler map provider data base directory.
+
+    The directory is scanned once and the map providers do not override
+    map providers registered by GeoTiler user.
+    """
+    global _base_dir_registered
+    if not _base_dir_registered:
+        for id, fn in _sources(base_dir()):
+            if id not in _PROVIDERS:
+                _SOURCES.setdefault(id, fn)
+        _base_dir_registered = True
+
+def _sources(path):
+    """
+    Find JSON files of map providers data in a directory.
+
+    Pairs of map provider identificator and JSON file name are returned.
+
+    :param path: Directory containing map providers data.
+    """
+    pattern = os.path.join(path, '*.json')
     if __debug__:
-        logger.debug('loading map provider "{}" from {}'.format(id, fn))
-    with open(fn, encoding='utf8') as f:
-        data = json.load(f)
-        provider = MapProvider(data)
-        return provider
+        logger.debug('list map providers from {}'.format(pattern))
+    for fn in glob.iglob(pattern):
+        yield os.path.splitext(os.path.basename(fn))[0], fn
 
 def base_dir():
     """
@@ -0,0 +1,150 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Map rendering statistics.
+"""
+
+import bisect
+import threading
+
+# upper bounds of map tile fetch latency histogram buckets in seconds
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+    float('inf')
+)
+
+class RenderStats:
+    """
+    Statistics of map rendering.
+
+    Pass an instance of the class to map rendering function to collect
+    statistics of map rendering, i.e.::
+
+        stats = RenderStats()
+        img = geotiler.render_map(map, stats=stats)
+        print(stats.as_dict())
+
+    The statistics are accumulated if the same instance is used for
+    multiple map renders. Optional callback is called with statistics
+    object after each map rendering, i.e. to export the statistics to
+    monitoring system.
+
+    :var tiles: Number of requested map tiles.
+    :var cache: Number of cache hits and misses per cache name.
+    :var downloaded: Number of downloaded map tiles.
+    :var bytes: Number of downloaded bytes.
+    :var latency: Map tile fetch latency histogram (count per bucket).
+    :var latency_sum: Sum of map tile fetch latencies.
+    :var decode_time: Map tiles decoding time.
+    :var composite_time: Map image composition time.
+    :var encode_time: Map image encoding time.
+    :var renders: Number of map renders.
+    """
+    def __init__(self, callback=None):
+        """
+        Create map rendering statistics object.
+
+        :param callback: Function called with the object after map
+            rendering.
+        """
+        self.callback = callback
+        self.tiles = 0
+        self.cache = {}
+        self.downloaded = 0
+        self.bytes = 0
+        self.latency = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.decode_time = 0.0
+        self.composite_time = 0.0
+        self.encode_time = 0.0
+        self.renders = 0
+        self._lock = threading.Lock()
+
+
+    def requested(self, n):
+        """
+        Record number of requested map tiles.
+
+        :param n: Number of map tiles.
+        """
+        self.tiles += n
+
+
+    def cached(self, name, hits, misses):
+        """
+        Record number of cache hits and misses.
+
+        :param name: Cache name.
+        :param hits: Number of cache hits.
+        :param misses: Number of cache misses.
+        """
+        h, m = self.cache.get(name, (0, 0))
+        self.cache[name] = h + hits, m + misses
+
+
+    def fetched(self, size, latency):
+        """
+        Record downloaded map tile.
+
+        The method can be called from multiple threads.
+
+        :param size: Map tile data size in bytes.
+        :param latency: Map tile fetch time in seconds.
+        """
+        i = bisect.bisect_left(LATENCY_BUCKETS, latency)
+        with self._lock:
+            self.downloaded += 1
+            self.bytes += size
+            self.latency[i] += 1
+            self.latency_sum += latency
+
+
+    def done(self):
+        """
+        Record end of map rendering and call statistics callback.
+        """
+        self.renders += 1
+        if self.callback is not None:
+            self.callback(self)
+
+
+    def as_dict(self):
+        """
+        Get dictionary of the statistics.
+        """
+        return {
+            'renders': self.renders,
+            'tiles': self.tiles,
+            'cache': {
+                n: {'hits': h, 'misses': m} for n, (h, m) in self.cache.items()
+            },
+            'downloaded': self.downloaded,
+            'bytes': self.bytes,
+            'latency': {
+                'buckets': list(zip(LATENCY_BUCKETS, self.latency)),
+                'sum': self.latency_sum,
+            },
+            'decode_time': self.decode_time,
+            'composite_time': self.composite_time,
+            'encode_time': self.encode_time,
+        }
+
+
+# vim: sw=4:et:ai
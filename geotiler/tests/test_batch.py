@@ -0,0 +1,95 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Batch rendering unit tests.
+"""
+
+import asyncio
+import io
+import os.path
+import tempfile
+
+import PIL.Image
+
+from geotiler.batch import render_batch
+
+CENTER = 11.788137, 46.481832
+
+def tile_data():
+    f = io.BytesIO()
+    PIL.Image.new('RGBA', (256, 256), 'blue').save(f, format='png')
+    return f.getvalue()
+
+@asyncio.coroutine
+def images(urls, **kw):
+    """
+    Map tiles downloader used by worker processes.
+    """
+    return [tile_data()] * len(urls)
+
+def encoder(image):
+    """
+    Map image encoder used by worker processes.
+    """
+    return image.size, image.getpixel((0, 0))
+
+
+def test_render_batch():
+    """
+    Test rendering maps with a pool of processes
+    """
+    maps = [
+        {'center': CENTER, 'zoom': 17, 'size': (100 + i, 200)}
+        for i in range(5)
+    ]
+    result = list(render_batch(
+        maps, workers=2, downloader=images, encoder=encoder
+    ))
+
+    assert 5 == len(result)
+    for spec, (size, pixel) in result:
+        assert tuple(spec['size']) == size
+        assert (0, 0, 255, 255) == pixel
+
+
+def test_render_batch_output():
+    """
+    Test rendering maps with a pool of processes into files
+    """
+    maps = [{'center': CENTER, 'zoom': 17, 'size': (100, 100)}] * 3
+    with tempfile.TemporaryDirectory() as path:
+        output = os.path.join(path, 'map-{:03d}.png')
+        cache_dir = os.path.join(path, 'cache')
+        result = list(render_batch(
+            maps, workers=2, downloader=images, output=output,
+            cache_dir=cache_dir
+        ))
+
+        files = sorted(fn for _, fn in result)
+        assert [output.format(i) for i in range(3)] == files
+        for fn in files:
+            img = PIL.Image.open(fn)
+            assert (100, 100) == img.size
+
+        # map tiles stored in shared disk cache
+        assert os.listdir(cache_dir)
+
+
+# vim: sw=4:et:ai
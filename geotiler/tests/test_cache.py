@@ -30,9 +30,21 @@ Caching downloader unit tests.
 """
 
 import asyncio
+import os.path
+import tempfile
+import time
 from functools import partial
 
-from geotiler.cache import caching_downloader, redis_downloader
+from geotiler.cache import caching_downloader, redis_downloader, \
+    disk_downloader, dedup_downloader, DiskCache, ManagedDiskCache, \
+    DedupCache
+from geotiler.provider import MapProvider
+from geotiler.tile.key import tile_key
+
+PROVIDER = MapProvider({
+    'id': 'osm',
+    'url': 'http://tile.openstreetmap.org/{z}/{x}/{y}.{ext}',
+})
 
 import unittest
 from unittest import mock
@@ -93,6 +105,33 @@ class CachingDownloaderTestCase(unittest.TestCase):
         self.assertEqual(('url4', 'img4'), args[3])
 
 
+    def test_caching_uniform(self):
+        """
+        Test caching downloader storing colour marker of uniform map tiles
+        """
+        @asyncio.coroutine
+        def images(urls):
+            return b'img1', b'img2'
+
+        def uniform(data):
+            return b'marker' if data == b'img1' else data
+
+        cache = mock.MagicMock()
+        cache.get.return_value = None
+        downloader = partial(
+            caching_downloader, cache.get, cache.set, images, uniform=True
+        )
+
+        loop = asyncio.get_event_loop()
+        with mock.patch('geotiler.cache.uniform_tile', uniform):
+            task = downloader(['url1', 'url2'])
+            result = loop.run_until_complete(task)
+        self.assertEqual([b'marker', b'img2'], list(result))
+
+        args = sorted(v[0] for v in cache.set.call_args_list)
+        self.assertEqual([('url1', b'marker'), ('url2', b'img2')], args)
+
+
 
 class RedisCacheTestCase(unittest.TestCase):
     """
@@ -124,5 +163,425 @@ class RedisCacheTestCase(unittest.TestCase):
         self.assertEqual(('url2', 'img2', 10), args[1])
         self.assertEqual(('url3', 'img3', 10), args[2])
 
+    def test_redis_downloader_tile_key(self):
+        """
+        Test creating Redis downloader using map tile keys
+        """
+        @asyncio.coroutine
+        def images(urls):
+            return (b'img2',)
+
+        client = mock.MagicMock()
+        client.get.side_effect = [b'img1', None]
+        downloader = redis_downloader(
+            client, downloader=images, provider=PROVIDER
+        )
+
+        urls = PROVIDER.tile_urls([(1, 2), (3, 1)], 2)
+        task = downloader(urls)
+        loop = asyncio.get_event_loop()
+        result = loop.run_until_complete(task)
+        self.assertEqual([b'img1', b'img2'], list(result))
+
+        k1 = b'osm:' + tile_key((1, 2), 2).to_bytes(8, 'big')
+        k2 = b'osm:' + tile_key((3, 1), 2).to_bytes(8, 'big')
+        args = [v[0][0] for v in client.get.call_args_list]
+        self.assertEqual([k1, k2], args)
+
+        args = sorted(v[0][:2] for v in client.setex.call_args_list)
+        self.assertEqual([(k2, b'img2'), (k1, b'img1')], args)
+
+
+    def test_redis_downloader_no_provider_id(self):
+        """
+        Test error creating Redis downloader for map provider without
+        identificator
+        """
+        provider = MapProvider({'url': PROVIDER.url})
+        client = mock.MagicMock()
+        with self.assertRaises(ValueError):
+            redis_downloader(client, provider=provider)
+        with self.assertRaises(ValueError):
+            dedup_downloader(client, provider=provider)
+
+
+
+class Store(dict):
+    """
+    Key-value store with Redis client interface.
+    """
+    def set(self, key, value, nx=False):
+        if nx and key in self:
+            return None
+        self[key] = value
+        return True
+
+    def delete(self, *keys):
+        for k in keys:
+            self.pop(k, None)
+
+    def incrby(self, key, n):
+        self[key] = self.get(key, 0) + n
+        return self[key]
+
+
+class DedupCacheTestCase(unittest.TestCase):
+    """
+    Content-addressed cache unit tests.
+    """
+    def test_dedup(self):
+        """
+        Test storing identical map tile data once
+        """
+        store = Store()
+        cache = DedupCache(store)
+        cache.set('url1', b'sea')
+        cache.set('url2', b'sea')
+        cache.set('url3', b'land')
+        cache.set('url3', b'sea')
+
+        self.assertEqual(b'sea', cache.get('url1'))
+        self.assertEqual(b'sea', cache.get('url2'))
+        self.assertEqual(b'land', cache.get('url3'))
+        self.assertIsNone(cache.get('url4'))
+
+        blobs = [k for k in store if k.startswith(b'b:')]
+        self.assertEqual(2, len(blobs))
+
+
+    def test_delete(self):
+        """
+        Test removing map tiles from content-addressed cache
+        """
+        store = Store()
+        cache = DedupCache(store)
+        cache.set(1, b'sea')
+        cache.set(2, b'sea')
+
+        cache.delete(1)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(b'sea', cache.get(2))
+
+        cache.delete(2)
+        cache.delete(3)
+        self.assertEqual({}, store)
+
+
+    def test_interrupted(self):
+        """
+        Test content-addressed cache when storing map tile is interrupted
+        """
+        store = Store()
+        cache = DedupCache(store)
+        cache.set('url1', b'sea')
+
+        # process dies after map tile data is stored
+        with mock.patch.object(store, 'incrby', side_effect=OSError):
+            with self.assertRaises(OSError):
+                cache.set('url2', b'sea')
+        self.assertIsNone(cache.get('url2'))
+
+        # process dies after reference counter is incremented
+        with mock.patch.object(store, 'set', side_effect=[True, OSError]):
+            with self.assertRaises(OSError):
+                cache.set('url3', b'sea')
+        self.assertIsNone(cache.get('url3'))
+
+        cache.set('url2', b'sea')
+        cache.set('url3', b'sea')
+        self.assertEqual(b'sea', cache.get('url2'))
+        self.assertEqual(b'sea', cache.get('url3'))
+
+        # reference counter is too large, data is never removed
+        for k in ('url1', 'url2', 'url3'):
+            cache.delete(k)
+        self.assertEqual([b'b:', b'r:'], sorted(k[:2] for k in store))
+
+
+    def test_race(self):
+        """
+        Test content-addressed cache when map tile is stored concurrently
+        """
+        store = Store()
+        cache = DedupCache(store)
+
+        # both processes see the map tile missing
+        get = lambda k, d=None: d if k[:2] == b't:' else dict.get(store, k, d)
+        with mock.patch.object(store, 'get', side_effect=get):
+            cache.set('url1', b'sea')
+            cache.set('url1', b'sea')
+
+        cache.delete('url1')
+        self.assertEqual({}, store)
+
+
+    def test_dangling(self):
+        """
+        Test forgetting map tile when its data is removed concurrently
+        """
+        store = Store()
+        cache = DedupCache(store)
+        cache.set('url1', b'sea')
+        store.delete(*[k for k in store if k.startswith(b'b:')])
+
+        self.assertIsNone(cache.get('url1'))
+        cache.set('url1', b'sea')
+        self.assertEqual(b'sea', cache.get('url1'))
+
+
+    def test_recompress(self):
+        """
+        Test recompressing map tile data before storing it
+        """
+        store = Store()
+        cache = DedupCache(store, recompress=lambda data: data[:2])
+        cache.set('url1', b'sea-1')
+        cache.set('url2', b'sea-2')
+        self.assertEqual(b'se', cache.get('url1'))
+        self.assertEqual(1, len([k for k in store if k.startswith(b'b:')]))
+
+
+    def test_dedup_downloader(self):
+        """
+        Test creating content-addressed cache downloader
+        """
+        @asyncio.coroutine
+        def images(urls, **kw):
+            return [b'sea'] * len(urls)
+
+        store = Store()
+        downloader = dedup_downloader(
+            store, downloader=images, provider=PROVIDER
+        )
+        urls = PROVIDER.tile_urls([(0, 0), (0, 1), (1, 0)], 1)
+        loop = asyncio.get_event_loop()
+        result = loop.run_until_complete(downloader(urls))
+        self.assertEqual([b'sea'] * 3, list(result))
+
+        key = b't:osm:' + tile_key((0, 1), 1).to_bytes(8, 'big')
+        self.assertIn(key, store)
+        self.assertEqual(1, len([k for k in store if k.startswith(b'b:')]))
+
+
+
+class DiskCacheTestCase(unittest.TestCase):
+    """
+    Disk cache unit tests.
+    """
+    def test_get_set(self):
+        """
+        Test storing and getting map tile data with disk cache
+        """
+        with tempfile.TemporaryDirectory() as path:
+            cache = DiskCache(path)
+            self.assertIsNone(cache.get('url1'))
+
+            cache.set('url1', b'img1')
+            self.assertEqual(b'img1', cache.get('url1'))
+            self.assertTrue(os.path.exists(cache._filename('url1')))
+
+            # existing data is not overwritten
+            cache.set('url1', b'img2')
+            self.assertEqual(b'img1', cache.get('url1'))
+
+
+    def test_disk_downloader(self):
+        """
+        Test creating disk downloader
+        """
+        requested = []
+        @asyncio.coroutine
+        def images(urls, **kw):
+            requested.extend(urls)
+            return [u.encode() for u in urls]
+
+        with tempfile.TemporaryDirectory() as path:
+            downloader = disk_downloader(path, downloader=images)
+            self.assertEqual(caching_downloader, downloader.func)
+
+            loop = asyncio.get_event_loop()
+            task = downloader(['url1', 'url2'])
+            result = loop.run_until_complete(task)
+            self.assertEqual([b'url1', b'url2'], list(result))
+
+            # new downloader shares the cache directory
+            downloader = disk_downloader(path, downloader=images)
+            task = downloader(['url1', 'url2', 'url3'])
+            result = loop.run_until_complete(task)
+            self.assertEqual([b'url1', b'url2', b'url3'], list(result))
+            self.assertEqual(['url1', 'url2', 'url3'], requested)
+
+
+    def test_disk_downloader_tile_key(self):
+        """
+        Test creating disk downloader using map tile keys
+        """
+        @asyncio.coroutine
+        def images(urls, **kw):
+            return [b'img'] * len(urls)
+
+        with tempfile.TemporaryDirectory() as path:
+            downloader = disk_downloader(
+                path, downloader=images, provider=PROVIDER
+            )
+            urls = PROVIDER.tile_urls([(1, 2)], 2)
+            loop = asyncio.get_event_loop()
+            loop.run_until_complete(downloader(urls))
+
+            cache = DiskCache(os.path.join(path, 'osm'))
+            self.assertEqual(b'img', cache.get(tile_key((1, 2), 2)))
+
+
+    def test_disk_downloader_no_provider_id(self):
+        """
+        Test error creating disk downloader for map provider without
+        identificator
+        """
+        provider = MapProvider({'url': PROVIDER.url})
+        with tempfile.TemporaryDirectory() as path:
+            with self.assertRaises(ValueError):
+                disk_downloader(path, provider=provider)
+
+
+
+class ManagedDiskCacheTestCase(unittest.TestCase):
+    """
+    Managed disk cache unit tests.
+    """
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = self._tmp.name
+
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+
+    def test_size(self):
+        """
+        Test size of managed disk cache shared by two cache objects
+        """
+        cache = ManagedDiskCache(self.path, 1000)
+        cache.set('url1', b'x' * 100)
+        cache.set('url1', b'x' * 100)
+        cache.set('url2', b'x' * 50)
+        self.assertEqual(150, cache.size)
+
+        other = ManagedDiskCache(self.path, 1000)
+        other.set('url3', b'x' * 10)
+        self.assertEqual(160, other.size)
+        self.assertEqual(160, cache.size)
+        self.assertEqual(b'x' * 100, other.get('url1'))
+
+        cache.close()
+        other.close()
+
+
+    def test_existing_tiles(self):
+        """
+        Test recording map tiles stored before the cache size was limited
+        """
+        old = DiskCache(self.path)
+        for i in range(4):
+            old.set('url{}'.format(i), b'x' * 100)
+
+        cache = ManagedDiskCache(self.path, 1000, flush=2)
+        self.assertEqual(0, cache.size)
+
+        cache.set('url0', b'x' * 100)
+        cache.get('url1')
+        cache.get('url2')
+        cache.close()
+
+        cache = ManagedDiskCache(self.path, 250)
+        self.assertEqual(300, cache.size)
+        cache.evict()
+        self.assertEqual(200, cache.size)
+
+        # one recorded map tile is evicted, url3 is not recorded in the
+        # database yet
+        files = [cache.get('url{}'.format(i)) for i in range(4)]
+        self.assertEqual(1, files.count(None))
+        self.assertIsNotNone(files[3])
+        cache.close()
+
+
+    def test_evict_lru(self):
+        """
+        Test evicting least recently used map tiles
+        """
+        cache = ManagedDiskCache(self.path, 10 ** 6, batch=1)
+        for i in range(5):
+            cache.set(tile_key((i, 0), 3), b'x' * 100)
+        cache.get(tile_key((0, 0), 3))
+
+        cache.max_size = 300
+        cache.evict()
+
+        self.assertLessEqual(cache.size, 270)
+        found = [cache.get(tile_key((i, 0), 3)) is not None for i in range(5)]
+        self.assertEqual([True, False, False, False, True], found)
+        cache.close()
+
+
+    def test_evict_lfu(self):
+        """
+        Test evicting least frequently used map tiles
+        """
+        cache = ManagedDiskCache(self.path, 10 ** 6, policy='lfu', flush=1)
+        for i in range(3):
+            cache.set('url{}'.format(i), b'x' * 100)
+        for i in (0, 0, 2):
+            cache.get('url{}'.format(i))
+
+        cache.max_size = 250
+        cache.evict()
+
+        found = [cache.get('url{}'.format(i)) is not None for i in range(3)]
+        self.assertEqual([True, False, True], found)
+        cache.close()
+
+
+    def test_evict_retention(self):
+        """
+        Test evicting map tiles with retention rules
+        """
+        retention = {0: None, 1: 3600}
+        cache = ManagedDiskCache(self.path, 10 ** 6, retention=retention)
+        cache.set(tile_key((0, 0), 0), b'x' * 100)
+        cache.set(tile_key((0, 0), 1), b'x' * 100)
+        cache.set(tile_key((0, 0), 2), b'x' * 100)
+
+        cache.max_size = 10
+        cache.evict()
+
+        self.assertIsNotNone(cache.get(tile_key((0, 0), 0)))
+        self.assertIsNotNone(cache.get(tile_key((0, 0), 1)))
+        self.assertIsNone(cache.get(tile_key((0, 0), 2)))
+        self.assertEqual(200, cache.size)
+        cache.close()
+
+
+    def test_evict_background(self):
+        """
+        Test evicting map tiles in background when cache is full
+        """
+        cache = ManagedDiskCache(self.path, 250)
+        for i in range(5):
+            cache.set('url{}'.format(i), b'x' * 100)
+        cache._thread.join()
+
+        self.assertLessEqual(cache.size, 225)
+        self.assertIsNotNone(cache.get('url4'))
+        cache.close()
+
+
+    def test_unknown_policy(self):
+        """
+        Test creating managed disk cache with unknown eviction policy
+        """
+        with self.assertRaises(ValueError):
+            ManagedDiskCache(self.path, 100, policy='fifo')
+
 
 # vim: sw=4:et:ai
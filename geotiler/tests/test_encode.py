@@ -0,0 +1,144 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Map image encoding unit tests.
+"""
+
+import asyncio
+import functools
+import io
+import PIL.Image
+
+import pytest
+
+from geotiler.encode import encode_image, recompress_png, PNGWriter
+from geotiler.map import Map, render_map
+
+
+def test_encode_png():
+    """
+    Test encoding map image as PNG file data
+    """
+    img = PIL.Image.new('RGBA', (20, 10), 'red')
+    data = encode_image(img, 'png', compress_level=1)
+
+    assert data.startswith(b'\x89PNG')
+    result = PIL.Image.open(io.BytesIO(data))
+    assert 'RGBA' == result.mode
+    assert (20, 10) == result.size
+
+
+def test_encode_png_palette():
+    """
+    Test encoding map image as palette PNG file data
+    """
+    img = PIL.Image.new('RGBA', (20, 10), 'red')
+    data = encode_image(img, 'png', colors=16)
+
+    result = PIL.Image.open(io.BytesIO(data))
+    assert 'P' == result.mode
+    assert (255, 0, 0, 255) == result.convert('RGBA').getpixel((0, 0))
+
+
+def test_encode_jpeg():
+    """
+    Test encoding map image with alpha channel as JPEG file data
+    """
+    img = PIL.Image.new('RGBA', (20, 10), 'red')
+    data = encode_image(img, 'jpg', quality=50)
+
+    result = PIL.Image.open(io.BytesIO(data))
+    assert 'JPEG' == result.format
+    assert 'RGB' == result.mode
+
+
+def test_render_map_encoder():
+    """
+    Test rendering map image with map image encoder
+    """
+    @asyncio.coroutine
+    def images(urls, loop=None):
+        return [None] * len(urls)
+
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(300, 300))
+    encoder = functools.partial(encode_image, format='png')
+    data = render_map(map, downloader=images, encoder=encoder)
+
+    assert data.startswith(b'\x89PNG')
+    result = PIL.Image.open(io.BytesIO(data))
+    assert (300, 300) == result.size
+
+def test_png_writer():
+    """
+    Test writing PNG file using map image strips
+    """
+    img = PIL.Image.new('RGBA', (20, 10), 'red')
+    img.paste((0, 0, 255, 128), (0, 4, 20, 10))
+
+    f = io.BytesIO()
+    writer = PNGWriter(f, (20, 10))
+    writer.write(img.crop((0, 0, 20, 4)))
+    writer.write(img.crop((0, 4, 20, 10)).convert('RGB'))
+    writer.close()
+
+    f.seek(0)
+    result = PIL.Image.open(f)
+    assert 'RGBA' == result.mode
+    assert (20, 10) == result.size
+    assert (255, 0, 0, 255) == result.getpixel((0, 3))
+    assert (0, 0, 255, 255) == result.getpixel((19, 9))
+
+
+def test_png_writer_error():
+    """
+    Test PNG file writer error on missing map image strips
+    """
+    f = io.BytesIO()
+    writer = PNGWriter(f, (20, 10), 'RGB')
+    writer.write(PIL.Image.new('RGB', (20, 5)))
+    with pytest.raises(ValueError):
+        writer.close()
+
+
+def test_recompress_png():
+    """
+    Test recompressing PNG file data
+    """
+    img = PIL.Image.new('RGB', (256, 256), 'blue')
+    data = encode_image(img, 'png', compress_level=0)
+
+    result = recompress_png(data)
+    assert len(result) < len(data)
+    assert img.tobytes() == PIL.Image.open(io.BytesIO(result)).tobytes()
+
+    # already compressed data is not changed
+    assert result == recompress_png(result)
+
+
+def test_recompress_png_other():
+    """
+    Test recompressing non-PNG file data
+    """
+    img = PIL.Image.new('RGB', (16, 16), 'blue')
+    data = encode_image(img, 'jpeg')
+    assert data is recompress_png(data)
+    assert b'\x89PNG\r\n\x1a\nbad' == recompress_png(b'\x89PNG\r\n\x1a\nbad')
+
+# vim: sw=4:et:ai
@@ -25,7 +25,8 @@
 #   License: BSD
 #
 
-from geotiler.geo import Transformation, MercatorProjection, zoom_to
+from geotiler.geo import Transformation, MercatorProjection, zoom_to, \
+    WEB_MERCATOR
 
 import unittest
 
@@ -109,4 +110,30 @@ class ZoomTestCase(unittest.TestCase):
         self.assertEqual((0.5, 0), coord)
 
 
+    def test_zoom_large_difference(self):
+        """
+        Test zooming tile coordinates beyond precomputed zoom scale factors
+        """
+        coord = zoom_to((1, 3), 0, 40)
+        self.assertEqual((2 ** 40, 3 * 2 ** 40), coord)
+
+
+
+class WebMercatorTestCase(unittest.TestCase):
+    """
+    Test Web Mercator projection.
+    """
+    def test_rev_geocode(self):
+        """
+        Test Web Mercator projection reverse geocoding
+        """
+        coord = WEB_MERCATOR.rev_geocode((0, 0))
+        self.assertAlmostEqual(0.5, coord[0])
+        self.assertAlmostEqual(0.5, coord[1])
+
+        pt = WEB_MERCATOR.geocode((0.25, 0.5), 0)
+        self.assertAlmostEqual(-90, pt[0])
+        self.assertAlmostEqual(0, pt[1])
+
+
 # vim: sw=4:et:ai
@@ -0,0 +1,92 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Density overlay unit tests.
+"""
+
+import concurrent.futures
+
+import numpy as np
+import PIL.Image
+
+from geotiler.map import Map
+from geotiler.heatmap import density, reduce_density, render_heatmap
+
+def test_density():
+    """
+    Test calculating density of positions
+    """
+    map = Map(center=(-6.069, 53.388), zoom=16, size=(64, 32))
+    p1 = map.geocode((10.5, 20.5))
+    p2 = map.geocode((30.5, 5.5))
+    p3 = map.geocode((-10, 5))
+    points = [np.array([p1, p2, p1]), np.array([p3, p1])]
+
+    grid = density(map, points)
+    assert (32, 64) == grid.shape
+    assert 3 == grid[20, 10]
+    assert 1 == grid[5, 30]
+    assert 4 == grid.sum()
+
+
+def test_reduce_density():
+    """
+    Test calculating density of positions for multiple inputs
+    """
+    map = Map(center=(-6.069, 53.388), zoom=16, size=(64, 32))
+    p1 = map.geocode((10.5, 20.5))
+    p2 = map.geocode((30.5, 5.5))
+    inputs = [[np.array([p1])], [np.array([p1, p2])]]
+
+    grid = reduce_density(map, inputs)
+    assert 2 == grid[20, 10]
+    assert 1 == grid[5, 30]
+
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        result = reduce_density(
+            map, [1, 2], reader=lambda i: inputs[i - 1], executor=executor
+        )
+    assert np.array_equal(grid, result)
+
+
+def test_render_heatmap():
+    """
+    Test rendering heatmap over map image
+    """
+    map = Map(center=(-6.069, 53.388), zoom=16, size=(64, 32))
+    grid = np.zeros((32, 64), dtype=np.int64)
+    grid[20, 10] = 10
+    grid[5, 30] = 1
+
+    heatmap = render_heatmap(map, grid, radius=0, alpha=1.0)
+    assert 'RGBA' == heatmap.mode
+    assert (64, 32) == heatmap.size
+    assert (255, 0, 0, 255) == heatmap.getpixel((10, 20))
+    assert 0 == heatmap.getpixel((0, 0))[3]
+    assert 0 < heatmap.getpixel((30, 5))[3] < 255
+
+    image = PIL.Image.new('RGB', (64, 32), 'white')
+    result = render_heatmap(map, grid, image, radius=3)
+    assert (255, 255, 255, 255) == result.getpixel((60, 30))
+    assert (255, 255, 255, 255) != result.getpixel((10, 20))
+    assert (255, 255, 255, 255) != result.getpixel((11, 21))
+
+
+# vim: sw=4:et:ai
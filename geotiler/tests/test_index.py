@@ -0,0 +1,96 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Spatial index of positions unit tests.
+"""
+
+import numpy as np
+
+from geotiler.map import Map
+from geotiler.index import PointIndex, _encode, _decode
+from geotiler.track import rev_geocode
+
+def test_morton_codes():
+    """
+    Test encoding and decoding Morton codes
+    """
+    x = np.array([0, 1, 0, 1, 2 ** 32 - 1], dtype=np.uint64)
+    y = np.array([0, 0, 1, 1, 2 ** 32 - 1], dtype=np.uint64)
+    codes = _encode(x, y)
+    assert [0, 1, 2, 3, 2 ** 64 - 1] == codes.tolist()
+
+    dx, dy = _decode(codes)
+    assert x.tolist() == dx.tolist()
+    assert y.tolist() == dy.tolist()
+
+
+def test_point_index_query():
+    """
+    Test finding positions visible on a map
+    """
+    rnd = np.random.RandomState(1)
+    points = [
+        rnd.uniform([-6.2, 53.3], [-5.9, 53.5], (5000, 2)) for _ in range(4)
+    ]
+    index = PointIndex(points)
+    assert 20000 == len(index)
+
+    map = Map(center=(-6.069, 53.388), zoom=15, size=(512, 256))
+    result = index.query(map)
+
+    xy = rev_geocode(map, np.concatenate(points))
+    w, h = map.size
+    valid = (xy[:, 0] >= 0) & (xy[:, 0] < w) & (xy[:, 1] >= 0) \
+        & (xy[:, 1] < h)
+    expected = xy[valid]
+
+    assert 0 < len(result) < 20000
+    assert len(expected) == len(result)
+    key = lambda a: a[np.lexsort((a[:, 1], a[:, 0]))]
+    assert np.allclose(key(expected), key(result), atol=0.01)
+
+
+def test_point_index_query_world():
+    """
+    Test finding positions visible on a map of the whole world
+    """
+    points = np.array([[170, -80], [10, 10], [-170, 80]])
+    index = PointIndex([points])
+
+    for zoom in (0, 1):
+        size = 256 * 2 ** zoom
+        map = Map(center=(0, 0), zoom=zoom, size=(size, size))
+        result = index.query(map)
+        assert 3 == len(result)
+        expected = rev_geocode(map, points)
+        key = lambda a: a[np.lexsort((a[:, 1], a[:, 0]))]
+        assert np.allclose(key(expected), key(result), atol=0.01)
+
+
+def test_point_index_empty():
+    """
+    Test finding positions in empty spatial index
+    """
+    index = PointIndex([])
+    map = Map(center=(-6.069, 53.388), zoom=15, size=(512, 256))
+    assert (0, 2) == index.query(map).shape
+
+
+# vim: sw=4:et:ai
@@ -25,11 +25,17 @@
 #   License: BSD
 #
 
+import asyncio
+import io
 import numpy as np
-from geotiler.map import Map, _find_top_left_tile, _tile_coords, _tile_offsets
+import PIL.Image
+
+from geotiler.map import Map, render_map, render_maps, render_map_blocks, \
+    render_frames, render_frames_async, _find_top_left_tile, _tile_coords, _tile_offsets
 
 import pytest
 import unittest
+from unittest import mock
 
 
 class MapTestCase(unittest.TestCase):
@@ -344,6 +350,15 @@ def test_map_create_center_zoom_size_numpy():
     assert (69827, 46376) == map.origin
     assert (-238, -194) == map.offset
 
+def test_map_create_fractional_zoom():
+    """
+    Test map creation with fractional zoom
+    """
+    map = Map(center=(0, 0), zoom=10.5, size=(100, 100))
+    assert 10.5 == map.zoom
+    lon, lat = map.geocode((50, 50))
+    assert abs(lon) < 1e-3 and abs(lat) < 1e-3
+
 def test_map_create_error_size():
     """
     Test map instantiation error with size incorrect type
@@ -362,4 +377,196 @@ def test_map_error_set_size():
     with pytest.raises(TypeError):
         map.size = (512.0, 512.0)
 
+def test_map_copy():
+    """
+    Test copying a map
+    """
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(512, 512))
+    copy = map.copy()
+
+    assert copy is not map
+    assert map.provider is copy.provider
+    assert map.extent == copy.extent
+    assert (69827, 46376) == copy.origin
+    assert (-238, -194) == copy.offset
+    assert not hasattr(copy, '__dict__')
+
+    copy.zoom = 16
+    assert 17 == map.zoom
+
+def test_map_with_center():
+    """
+    Test copying a map with new center
+    """
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(512, 512))
+    copy = map.with_center((-6.066, 53.386))
+
+    assert map.provider is copy.provider
+    assert (69827, 46376) == map.origin
+    assert (512, 512) == copy.size
+    assert 17 == copy.zoom
+    assert abs(copy.center[0] - -6.066) < 1e-4
+    assert abs(copy.center[1] - 53.386) < 1e-4
+
+def test_render_maps():
+    """
+    Test rendering multiple maps with shared map tiles
+    """
+    f = io.BytesIO()
+    PIL.Image.new('RGBA', (256, 256), 'blue').save(f, format='png')
+    tile = f.getvalue()
+
+    requested = []
+    @asyncio.coroutine
+    def images(urls, loop=None):
+        requested.extend(urls)
+        return [tile] * len(urls)
+
+    center = 11.788137, 46.481832
+    m1 = Map(center=center, zoom=17, size=(300, 300))
+    m2 = Map(center=center, zoom=17, size=(300, 300))
+    m3 = Map(center=center, zoom=17, size=(600, 300))
+
+    result = list(render_maps([m1, m2, m3], downloader=images))
+
+    assert 3 == len(result)
+    maps = [m for m, _ in result]
+    assert all(m in maps for m in (m1, m2, m3))
+    assert all(img.size == tuple(m.size) for m, img in result)
+
+    # 4 tiles for first map, second map shares all tiles with first map,
+    # third map needs 2 more columns of tiles
+    assert 8 == len(requested)
+    img = dict((id(m), img) for m, img in result)[id(m3)]
+    assert (0, 0, 255, 255) == img.getpixel((599, 299))
+
+def test_render_frames():
+    """
+    Test rendering sequence of map frames
+    """
+    f = io.BytesIO()
+    PIL.Image.new('RGBA', (256, 256), 'blue').save(f, format='png')
+    tile = f.getvalue()
+
+    requested = []
+    @asyncio.coroutine
+    def images(urls, loop=None):
+        requested.extend(urls)
+        return [tile] * len(urls)
+
+    # move map by one tile to the right for each frame, the same map
+    # instance is generated
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(256, 256))
+    def maps():
+        for i in range(4):
+            yield map
+            map.origin = map.origin[0] + 1, map.origin[1]
+
+    # asynchronous iterator protocol is not used, so no
+    # StopAsyncIteration for Python 3.4
+    with mock.patch('geotiler.map._Frames.__anext__') as f:
+        frames = list(render_frames(maps(), downloader=images, window=4))
+        assert not f.called
+
+    assert 4 == len(frames)
+    origins = [m.origin[0] for m, _ in frames]
+    assert [origins[0] + i for i in range(4)] == origins
+    assert all(img.size == (256, 256) for _, img in frames)
+
+    # 4 tiles for first map, each next map needs 2 more map tiles
+    assert 10 == len(requested)
+    assert 10 == len(set(requested))
+
+
+def test_render_frames_window():
+    """
+    Test rendering sequence of map frames with map tiles evicted from
+    sliding window
+    """
+    f = io.BytesIO()
+    PIL.Image.new('RGBA', (256, 256), 'blue').save(f, format='png')
+    tile = f.getvalue()
+
+    requested = []
+    @asyncio.coroutine
+    def images(urls, loop=None):
+        requested.extend(urls)
+        return [tile] * len(urls)
+
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(256, 256))
+    frames = render_frames([map] * 3, downloader=images, window=0)
+    assert 3 == len(list(frames))
+
+    # map tiles are downloaded once for first map and prefetched maps,
+    # but evicted after each map is rendered, so downloaded again
+    assert 12 == len(requested)
+    assert 4 == len(set(requested))
+
+
+def test_render_frames_async_close():
+    """
+    Test cancelling download of prefetched map tiles
+    """
+    f = io.BytesIO()
+    PIL.Image.new('RGBA', (256, 256), 'blue').save(f, format='png')
+    tile = f.getvalue()
+
+    @asyncio.coroutine
+    def images(urls, loop=None):
+        if len(urls) < 4:
+            yield from asyncio.sleep(60)
+        return [tile] * len(urls)
+
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(256, 256))
+    maps = [map.copy()]
+    for i in range(3):
+        m = maps[-1].copy()
+        m.origin = m.origin[0] + 1, m.origin[1]
+        maps.append(m)
+
+    loop = asyncio.get_event_loop()
+    frames = render_frames_async(maps, downloader=images, loop=loop)
+    m, img = loop.run_until_complete(frames.__anext__())
+    assert (256, 256) == img.size
+
+    tasks = set(t for t, _ in frames.pending.values())
+    assert tasks
+    frames.close()
+    loop.run_until_complete(asyncio.wait(tasks, loop=loop))
+    assert all(t.cancelled() for t in tasks)
+
+
+def test_render_map_blocks():
+    """
+    Test rendering map image block by block
+    """
+    tiles = {}
+    @asyncio.coroutine
+    def images(urls, loop=None):
+        for u in urls:
+            if u not in tiles:
+                f = io.BytesIO()
+                color = (len(tiles) * 10, 0, 0, 255)
+                PIL.Image.new('RGBA', (256, 256), color).save(f, format='png')
+                tiles[u] = f.getvalue()
+        return [tiles[u] for u in urls]
+
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(700, 600))
+    expected = render_map(map, downloader=images)
+
+    blocks = list(render_map_blocks(map, rows=2, cols=2, downloader=images))
+    boxes = [box for box, _ in blocks]
+    assert [(0, 0, 368, 362), (368, 0, 700, 362)] == boxes[:2]
+    assert all((b[2] - b[0], b[3] - b[1]) == img.size for b, img in blocks)
+
+    image = PIL.Image.new('RGBA', map.size)
+    for box, img in blocks:
+        image.paste(img, box[:2])
+    assert expected.tobytes() == image.tobytes()
+
+    # strips of map image
+    blocks = list(render_map_blocks(map, downloader=images))
+    boxes = [box for box, _ in blocks]
+    assert [(0, 0, 700, 106), (0, 106, 700, 362), (0, 362, 700, 600)] == boxes
+
 # vim: sw=4:et:ai
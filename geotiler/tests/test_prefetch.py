@@ -0,0 +1,183 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Map tiles prefetch unit tests.
+"""
+
+import asyncio
+import math
+
+from geotiler.map import Map
+from geotiler.prefetch import MotionPrefetch, ZoomPrefetch
+
+from unittest import mock
+
+CENTER = 11.788137, 46.481832
+
+def downloader(requested, delay=0):
+    """
+    Create map tiles downloader recording requested URLs.
+    """
+    @asyncio.coroutine
+    def images(urls, loop=None):
+        requested.extend(urls)
+        if delay:
+            yield from asyncio.sleep(delay)
+        return [None] * len(urls)
+    return images
+
+def test_motion_prefetch():
+    """
+    Test prefetch of map tiles along motion vector of a map
+    """
+    requested = []
+    loop = asyncio.get_event_loop()
+    map = Map(center=CENTER, zoom=17, size=(512, 512))
+    prefetch = MotionPrefetch(map, downloader(requested), loop=loop)
+
+    grid = map.tile_grid
+
+    # move map by a half of a tile to the right
+    for i in range(3):
+        prefetch.update(timestamp=i)
+        map.center = map.geocode((256 + 128, 256))
+    loop.run_until_complete(prefetch._task)
+
+    coords = [map.provider.parse_url(u)[0] for u in requested]
+    assert len(coords) == len(set(coords))
+
+    # map tiles to the right of the map are prefetched only
+    x_max = max(c[0] for c in grid)
+    rows = set(c[1] for c in grid)
+    assert coords
+    assert all(c[0] > x_max and c[1] in rows for c in coords)
+
+
+def test_motion_prefetch_stationary():
+    """
+    Test prefetch of map tiles for stationary map
+    """
+    requested = []
+    loop = asyncio.get_event_loop()
+    map = Map(center=CENTER, zoom=17, size=(512, 512))
+    prefetch = MotionPrefetch(map, downloader(requested), loop=loop)
+
+    prefetch.update(timestamp=0)
+    prefetch.update(timestamp=1)
+    assert prefetch._task is None
+
+
+def test_motion_prefetch_heading_change():
+    """
+    Test cancelling prefetch of map tiles on heading change
+    """
+    requested = []
+    loop = asyncio.get_event_loop()
+    map = Map(center=CENTER, zoom=17, size=(512, 512))
+    prefetch = MotionPrefetch(
+        map, downloader(requested, delay=60), history=2, loop=loop
+    )
+
+    prefetch.update(timestamp=0)
+    map.origin = map.origin[0] + 1, map.origin[1]
+    prefetch.update(timestamp=1)
+    task = prefetch._task
+    loop.run_until_complete(asyncio.sleep(0.01))
+    assert requested
+
+    # move up
+    map.origin = map.origin[0], map.origin[1] - 1
+    prefetch.update(timestamp=2)
+
+    loop.run_until_complete(asyncio.wait([task]))
+    assert task.cancelled()
+    assert abs(-math.pi / 2 - prefetch._heading) < 1e-9
+
+    prefetch.cancel()
+    assert not prefetch._queue
+
+
+def test_zoom_prefetch():
+    """
+    Test prefetch of map tiles of adjacent zoom levels
+    """
+    requested = []
+    loop = asyncio.get_event_loop()
+    map = Map(center=CENTER, zoom=17, size=(512, 512))
+    prefetch = ZoomPrefetch(map, downloader(requested), loop=loop)
+
+    prefetch.update()
+    loop.run_until_complete(prefetch._task)
+
+    expected = []
+    for zoom in (18, 16):
+        m = map.copy()
+        m.zoom = zoom
+        expected.extend(m.provider.tile_urls(m.tile_grid, zoom))
+    assert expected == requested
+
+    # no map change, no prefetch
+    prefetch.update()
+    assert prefetch._task.done()
+    assert len(expected) == len(requested)
+
+
+def test_zoom_prefetch_cancel():
+    """
+    Test cancelling prefetch of map tiles of adjacent zoom levels on map
+    change
+    """
+    requested = []
+    loop = asyncio.get_event_loop()
+    map = Map(center=CENTER, zoom=17, size=(512, 512))
+    prefetch = ZoomPrefetch(
+        map, downloader(requested, delay=60), levels=(1,), loop=loop
+    )
+
+    prefetch.update()
+    task = prefetch._task
+    loop.run_until_complete(asyncio.sleep(0.01))
+
+    map.zoom = 18
+    prefetch.update()
+    loop.run_until_complete(asyncio.wait([task]))
+    assert task.cancelled()
+
+    urls = prefetch._queue
+    assert all(map.provider.parse_url(u)[1] == 19 for u in urls)
+    prefetch.cancel()
+
+
+def test_zoom_prefetch_min_zoom():
+    """
+    Test prefetch of map tiles of adjacent zoom levels for minimum zoom
+    """
+    requested = []
+    loop = asyncio.get_event_loop()
+    map = Map(center=CENTER, zoom=0, size=(256, 256))
+    prefetch = ZoomPrefetch(map, downloader(requested), loop=loop)
+
+    prefetch.update()
+    loop.run_until_complete(prefetch._task)
+    assert requested
+    assert all('/1/' in u for u in requested)
+
+
+# vim: sw=4:et:ai
@@ -25,7 +25,15 @@
 #   License: BSD
 #
 
-from geotiler.provider import MapProvider, base_dir
+import json
+import os.path
+import tempfile
+
+import geotiler.provider as gp
+from geotiler.provider import MapProvider, base_dir, find_provider, \
+    providers, register_provider, register_providers
+
+import pytest
 
 from unittest import mock
 
@@ -76,6 +84,145 @@ def test_provider_init_default_override():
     assert 'jpg' == provider.extension
     assert 2 == provider.limit
 
+def test_provider_tile_url():
+    """
+    Test creating map tile URL.
+    """
+    data = {
+        'url': 'http://{subdomain}.tile.openstreetmap.org/{z}/{x}/{y}.{ext}',
+        'subdomains': ('a', 'b', 'c'),
+    }
+    provider = MapProvider(data)
+
+    url = provider.tile_url((3, 5), 7)
+    assert 'http://c.tile.openstreetmap.org/7/3/5.png' == url
+    assert url == provider.tile_url((3, 5), 7)
+    url = provider.tile_url((3, 6), 7)
+    assert 'http://a.tile.openstreetmap.org/7/3/6.png' == url
+
+def test_provider_tile_url_no_subdomains():
+    """
+    Test creating map tile URL for map provider without subdomains.
+    """
+    data = {
+        'url': 'http://s3.amazonaws.com/com.modestmaps.bluemarble/{z}-r{y}-c{x}.{ext}',
+        'extension': 'jpg',
+    }
+    provider = MapProvider(data)
+
+    url = provider.tile_url((3, 5), 7)
+    assert 'http://s3.amazonaws.com/com.modestmaps.bluemarble/7-r5-c3.jpg' == url
+
+def test_provider_tile_urls():
+    """
+    Test creating URLs of map tiles.
+    """
+    data = {
+        'url': 'http://{subdomain}.tile.openstreetmap.org/{z}/{x}/{y}.{ext}',
+        'subdomains': ('a', 'b'),
+    }
+    provider = MapProvider(data)
+
+    urls = provider.tile_urls([(1, 1), (1, 2)], 3)
+    expected = (
+        'http://a.tile.openstreetmap.org/3/1/1.png',
+        'http://b.tile.openstreetmap.org/3/1/2.png',
+    )
+    assert expected == urls
+
+def test_provider_parse_url():
+    """
+    Test parsing map tile URL.
+    """
+    data = {
+        'url': 'http://{subdomain}.tile.openstreetmap.org/{z}/{x}/{y}.{ext}',
+        'subdomains': ('a', 'b', 'c'),
+    }
+    provider = MapProvider(data)
+
+    url = provider.tile_url((3, 5), 7)
+    assert ((3, 5), 7) == provider.parse_url(url)
+    assert provider.parse_url('http://a.tile.openstreetmap.org/7/3/5.jpg') is None
+
+def test_provider_local():
+    """
+    Test creating map provider of local map tiles.
+    """
+    provider = MapProvider({'path': '/data/my tiles/{z}/{x}/{y}.{ext}'})
+    assert '/data/my tiles/{z}/{x}/{y}.{ext}' == provider.path
+
+    url = provider.tile_url((3, 5), 7)
+    assert 'file:///data/my%20tiles/7/3/5.png' == url
+    assert ((3, 5), 7) == provider.parse_url(url)
+
+def test_find_provider():
+    """
+    Test finding map provider.
+    """
+    provider = find_provider('osm')
+    assert 'osm' == provider.id
+    assert 'OpenStreetMap' == provider.name
+    assert provider is find_provider('osm')
+    assert provider.projection is find_provider('bluemarble').projection
+
+def test_find_provider_error():
+    """
+    Test error when finding unknown map provider.
+    """
+    with pytest.raises(ValueError):
+        find_provider('unknown')
+
+@mock.patch.dict(gp._PROVIDERS)
+@mock.patch.dict(gp._SOURCES)
+def test_register_provider():
+    """
+    Test registering map provider from map provider data.
+    """
+    data = {'name': 'Test', 'url': 'http://localhost/{z}/{x}/{y}.png'}
+    provider = register_provider(data, 'test-provider')
+
+    assert provider is find_provider('test-provider')
+    assert 'test-provider' in providers()
+    assert 'osm' in providers()
+
+    with pytest.raises(ValueError):
+        register_provider(data)
+
+@mock.patch.dict(gp._PROVIDERS)
+@mock.patch.dict(gp._SOURCES)
+def test_register_providers():
+    """
+    Test registering map providers from a directory.
+    """
+    data = {'name': 'Test', 'url': 'http://localhost/{z}/{x}/{y}.png'}
+    with tempfile.TemporaryDirectory() as path:
+        with open(os.path.join(path, 'test-dir.json'), 'w') as f:
+            json.dump(data, f)
+
+        register_providers(path)
+        assert 'test-dir' in providers()
+
+        provider = find_provider('test-dir')
+        assert 'test-dir' == provider.id
+        assert 'Test' == provider.name
+
+@mock.patch.dict(gp._PROVIDERS)
+@mock.patch.dict(gp._SOURCES)
+def test_register_providers_local():
+    """
+    Test registering map provider of local map tiles with relative path.
+    """
+    data = {'name': 'Test', 'path': 'tiles/{z}/{x}/{y}.{ext}'}
+    with tempfile.TemporaryDirectory() as path:
+        with open(os.path.join(path, 'test-local.json'), 'w') as f:
+            json.dump(data, f)
+
+        register_providers(path)
+        provider = find_provider('test-local')
+        expected = os.path.join(path, 'tiles/{z}/{x}/{y}.{ext}')
+        assert expected == provider.path
+        assert provider.url.startswith('file://')
+
 def test_base_dir():
     """
     Test base dir retrieval.
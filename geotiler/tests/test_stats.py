@@ -0,0 +1,142 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Map rendering statistics unit tests.
+"""
+
+import asyncio
+import io
+from functools import partial
+
+import PIL.Image
+
+from geotiler.cache import caching_downloader
+from geotiler.map import Map, render_map
+from geotiler.stats import RenderStats
+from geotiler.tile.io import _fetch_tile_stats
+
+from unittest import mock
+
+
+def test_stats_fetched():
+    """
+    Test recording downloaded map tiles
+    """
+    stats = RenderStats()
+    stats.fetched(100, 0.001)
+    stats.fetched(200, 0.03)
+    stats.fetched(300, 20)
+
+    assert 3 == stats.downloaded
+    assert 600 == stats.bytes
+    assert 1 == stats.latency[0]
+    assert 1 == stats.latency[3]
+    assert 1 == stats.latency[-1]
+    assert abs(stats.latency_sum - 20.031) < 1e-9
+
+def test_stats_cached():
+    """
+    Test recording cache hits and misses
+    """
+    stats = RenderStats()
+    stats.cached('redis', 3, 1)
+    stats.cached('redis', 2, 0)
+    stats.cached('pack', 0, 1)
+
+    result = stats.as_dict()['cache']
+    assert {'hits': 5, 'misses': 1} == result['redis']
+    assert {'hits': 0, 'misses': 1} == result['pack']
+
+def test_fetch_tile_stats():
+    """
+    Test fetching map tile with statistics
+    """
+    stats = RenderStats()
+    with mock.patch('geotiler.tile.io.fetch_tile') as f:
+        f.return_value = b'abc'
+        data = _fetch_tile_stats(stats, 'url')
+
+    assert b'abc' == data
+    assert 1 == stats.downloaded
+    assert 3 == stats.bytes
+
+def test_render_map_stats():
+    """
+    Test collecting map rendering statistics
+    """
+    f = io.BytesIO()
+    PIL.Image.new('RGB', (256, 256)).save(f, format='png')
+    tile = f.getvalue()
+
+    @asyncio.coroutine
+    def images(urls, loop=None, stats=None):
+        assert stats is not None
+        return [tile] * len(urls)
+
+    cache = {}
+    downloader = partial(
+        caching_downloader, cache.get, cache.__setitem__, images
+    )
+    callback = mock.Mock()
+    stats = RenderStats(callback)
+
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(300, 300))
+    render_map(map, downloader=downloader, stats=stats)
+    encoder = lambda img: img.tobytes()
+    render_map(map, downloader=downloader, stats=stats, encoder=encoder)
+
+    result = stats.as_dict()
+    assert 2 == result['renders']
+    assert 8 == result['tiles']
+    assert {'hits': 4, 'misses': 4} == result['cache']['cache']
+    assert result['decode_time'] > 0
+    assert result['composite_time'] > 0
+    assert result['encode_time'] > 0
+    assert 2 == callback.call_count
+    callback.assert_called_with(stats)
+
+def test_render_map_stats_downloader():
+    """
+    Test collecting map rendering statistics with downloaders not accepting
+    statistics object
+    """
+    f = io.BytesIO()
+    PIL.Image.new('RGB', (256, 256)).save(f, format='png')
+    tile = f.getvalue()
+
+    @asyncio.coroutine
+    def images(urls, loop=None):
+        return [tile] * len(urls)
+
+    stats = RenderStats()
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(300, 300))
+    render_map(map, downloader=images, stats=stats)
+
+    cache = {}
+    downloader = partial(
+        caching_downloader, cache.get, cache.__setitem__, images
+    )
+    render_map(map, downloader=downloader, stats=stats)
+
+    result = stats.as_dict()
+    assert 2 == result['renders']
+    assert {'hits': 0, 'misses': 4} == result['cache']['cache']
+
+# vim: sw=4:et:ai
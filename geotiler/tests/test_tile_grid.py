@@ -0,0 +1,137 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Grid of map tiles unit tests.
+"""
+
+from geotiler.map import Map
+from geotiler.tile.grid import TileGrid
+
+import pytest
+
+
+def test_grid():
+    """
+    Test creating grid of map tiles
+    """
+    grid = TileGrid(2, [(1, 2), (1, 3)], [(0, 0), (0, 256)])
+
+    assert 2 == grid.zoom
+    assert 2 == len(grid)
+    assert ((1, 2), (1, 3)) == grid.coords
+    assert ((0, 0), (0, 256)) == grid.offsets
+    assert [(1, 2), (1, 3)] == list(grid)
+    assert (1, 3) in grid
+    assert (3, 1) not in grid
+
+def test_grid_no_offsets():
+    """
+    Test creating grid of map tiles without offsets
+    """
+    grid = TileGrid(2, [(1, 2), (1, 3)])
+    assert grid.offsets is None
+
+def test_grid_offsets_error():
+    """
+    Test error on creating grid of map tiles with too few offsets
+    """
+    with pytest.raises(ValueError):
+        TileGrid(2, [(1, 2), (1, 3)], [(0, 0)])
+
+def test_grid_union():
+    """
+    Test union of grids of map tiles
+    """
+    g1 = TileGrid(2, [(1, 2), (1, 3)], [(0, 0), (0, 256)])
+    g2 = TileGrid(2, [(1, 3), (2, 3)], [(10, 10), (266, 10)])
+
+    grid = g1 | g2
+    assert ((1, 2), (1, 3), (2, 3)) == grid.coords
+    assert ((0, 0), (0, 256), (266, 10)) == grid.offsets
+
+    grid = g1.union(TileGrid(2, [(2, 3)]))
+    assert ((1, 2), (1, 3), (2, 3)) == grid.coords
+    assert grid.offsets is None
+
+def test_grid_difference():
+    """
+    Test difference of grids of map tiles
+    """
+    g1 = TileGrid(2, [(1, 2), (1, 3)], [(0, 0), (0, 256)])
+    g2 = TileGrid(2, [(1, 3), (2, 3)])
+
+    grid = g1 - g2
+    assert ((1, 2),) == grid.coords
+    assert ((0, 0),) == grid.offsets
+    assert ((2, 3),) == (g2 - g1).coords
+
+def test_grid_intersection():
+    """
+    Test intersection of grids of map tiles
+    """
+    g1 = TileGrid(2, [(1, 2), (1, 3)], [(0, 0), (0, 256)])
+    g2 = TileGrid(2, [(1, 3), (2, 3)])
+
+    grid = g1 & g2
+    assert ((1, 3),) == grid.coords
+    assert ((0, 256),) == grid.offsets
+
+def test_grid_zoom_error():
+    """
+    Test error on set operation on grids with different zoom levels
+    """
+    g1 = TileGrid(2, [(1, 2)])
+    g2 = TileGrid(3, [(1, 2)])
+    with pytest.raises(ValueError):
+        g1 | g2
+
+def test_map_tile_grid():
+    """
+    Test grid of map tiles of a map
+    """
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(300, 300))
+    grid = map.tile_grid
+
+    assert 17 == grid.zoom
+    expected = (69827, 46376), (69827, 46377), (69828, 46376), (69828, 46377)
+    assert expected == grid.coords
+    expected = (-88, -44), (-88, 212), (168, -44), (168, 212)
+    assert expected == grid.offsets
+
+    # grid is calculated once for map state
+    assert grid is map.tile_grid
+
+    map.zoom = 16
+    grid = map.tile_grid
+    assert 16 == grid.zoom
+    assert grid is map.tile_grid
+
+def test_map_tile_grid_aligned():
+    """
+    Test grid of map tiles of a map aligned with map tiles
+    """
+    map = Map(center=(0, 0), zoom=2, size=(512, 512))
+    assert (0, 0) == map.offset
+
+    grid = map.tile_grid
+    assert ((1, 1), (1, 2), (2, 1), (2, 2)) == grid.coords
+    assert ((0, 0), (0, 256), (256, 0), (256, 256)) == grid.offsets
+
+# vim: sw=4:et:ai
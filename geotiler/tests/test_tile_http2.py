@@ -0,0 +1,233 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+HTTP/2 map tiles downloader unit tests.
+"""
+
+import asyncio
+
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+
+from geotiler.tile.http2 import HTTP2Downloader, http2_downloader
+from geotiler.provider import MapProvider
+
+import unittest
+from unittest import mock
+
+
+class H2Server(asyncio.Protocol):
+    """
+    HTTP/2 stub server sending path of a request as response data.
+
+    Response is delayed, so concurrent streams can be counted. Status 404
+    is sent for `/missing` path. Response for `/slow` path is delayed by
+    1 second.
+
+    :var connections: Number of accepted connections.
+    :var streams: Number of concurrent streams.
+    :var max_streams: Maximum number of concurrent streams.
+    :var headers: Headers of last request.
+    """
+    connections = 0
+    streams = 0
+    max_streams = 0
+    headers = None
+
+    def __init__(self, loop):
+        config = h2.config.H2Configuration(
+            client_side=False, header_encoding='utf-8'
+        )
+        self.conn = h2.connection.H2Connection(config=config)
+        self.loop = loop
+        self.paths = {}
+
+
+    def connection_made(self, transport):
+        H2Server.connections += 1
+        self.transport = transport
+        self.conn.initiate_connection()
+        self.transport.write(self.conn.data_to_send())
+
+
+    def data_received(self, data):
+        for event in self.conn.receive_data(data):
+            if isinstance(event, h2.events.RequestReceived):
+                H2Server.headers = dict(event.headers)
+                self.paths[event.stream_id] = H2Server.headers[':path']
+                H2Server.streams += 1
+                H2Server.max_streams = max(
+                    H2Server.streams, H2Server.max_streams
+                )
+                delay = 1 if H2Server.headers[':path'] == '/slow' else 0.01
+                self.loop.call_later(delay, self.respond, event.stream_id)
+        self.transport.write(self.conn.data_to_send())
+
+
+    def respond(self, sid):
+        H2Server.streams -= 1
+        path = self.paths.pop(sid)
+        status = '404' if path == '/missing' else '200'
+        try:
+            self.conn.send_headers(sid, [(':status', status)])
+            self.conn.send_data(sid, path.encode(), end_stream=True)
+        except h2.exceptions.StreamClosedError:
+            return  # stream reset by client
+        self.transport.write(self.conn.data_to_send())
+
+
+class HTTP2DownloaderTestCase(unittest.TestCase):
+    """
+    HTTP/2 map tiles downloader unit tests.
+    """
+    def setUp(self):
+        H2Server.connections = H2Server.streams = H2Server.max_streams = 0
+
+        self.loop = loop = asyncio.new_event_loop()
+        task = loop.create_server(lambda: H2Server(loop), '127.0.0.1', 0)
+        self.server = loop.run_until_complete(task)
+        port = self.server.sockets[0].getsockname()[1]
+        self.url = 'http://127.0.0.1:{}/{{}}.png'.format(port)
+
+
+    def tearDown(self):
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+
+
+    def fetch(self, downloader, urls, **kw):
+        """
+        Download map tiles with the downloader.
+        """
+        task = downloader(urls, loop=self.loop, **kw)
+        return list(self.loop.run_until_complete(task))
+
+
+    def test_multiplexing(self):
+        """
+        Test downloading map tiles with one HTTP/2 connection
+        """
+        downloader = HTTP2Downloader(limit=3, cleartext=True)
+        urls = [self.url.format(i) for i in range(10)]
+
+        result = self.fetch(downloader, urls)
+        expected = ['/{}.png'.format(i).encode() for i in range(10)]
+        self.assertEqual(expected, result)
+
+        # one connection, concurrent streams limited
+        self.assertEqual(1, H2Server.connections)
+        self.assertEqual(3, H2Server.max_streams)
+        self.assertEqual('GeoTiler/0.11.0', H2Server.headers['user-agent'])
+
+        # connection is reused
+        result = self.fetch(downloader, urls[:2])
+        self.assertEqual(expected[:2], result)
+        self.assertEqual(1, H2Server.connections)
+
+        downloader.close()
+
+
+    def test_error(self):
+        """
+        Test downloading missing map tile with HTTP/2
+        """
+        downloader = HTTP2Downloader(limit=2, cleartext=True)
+        stats = mock.MagicMock()
+        urls = [self.url.format(1), self.url.format('missing')[:-4]]
+
+        result = self.fetch(downloader, urls, stats=stats)
+        self.assertEqual([b'/1.png', None], result)
+        self.assertEqual(1, stats.fetched.call_count)
+        downloader.close()
+
+
+    def test_queued(self):
+        """
+        Test timeout of HTTP/2 requests queued behind stream limit
+        """
+        downloader = HTTP2Downloader(limit=1, cleartext=True, timeout=0.1)
+        urls = [self.url.format(i) for i in range(20)]
+
+        result = self.fetch(downloader, urls)
+        expected = ['/{}.png'.format(i).encode() for i in range(20)]
+        self.assertEqual(expected, result)
+        self.assertEqual(1, H2Server.max_streams)
+        downloader.close()
+
+
+    def test_timeout(self):
+        """
+        Test HTTP/2 request timeout
+        """
+        downloader = HTTP2Downloader(limit=2, cleartext=True, timeout=0.1)
+        urls = [self.url.format(1), self.url.format('slow')[:-4]]
+
+        with self.assertLogs('geotiler.tile.http2', 'WARNING') as log:
+            result = self.fetch(downloader, urls)
+        self.assertEqual([b'/1.png', None], result)
+        self.assertIn(urls[1], log.output[0])
+        downloader.close()
+
+
+    def test_reconnect(self):
+        """
+        Test opening new HTTP/2 connection when previous one is closed
+        """
+        downloader = HTTP2Downloader(cleartext=True)
+        urls = [self.url.format(1)]
+
+        self.fetch(downloader, urls)
+        conn, = (t.result() for t in downloader._connections.values())
+        conn.close()
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+
+        result = self.fetch(downloader, urls)
+        self.assertEqual([b'/1.png'], result)
+        self.assertEqual(2, H2Server.connections)
+        downloader.close()
+
+
+    def test_fallback(self):
+        """
+        Test downloading map tiles without HTTP/2 for http URLs
+        """
+        downloader = HTTP2Downloader()
+        with mock.patch('geotiler.tile.http2.fetch_tile') as f:
+            f.return_value = b'tile'
+            result = self.fetch(downloader, [self.url.format(1)])
+
+        self.assertEqual([b'tile'], result)
+        f.assert_called_once_with(self.url.format(1))
+        self.assertEqual(0, H2Server.connections)
+
+
+def test_http2_downloader():
+    """
+    Test creating HTTP/2 map tiles downloader for a map provider
+    """
+    provider = MapProvider({'id': 'test', 'url': 'http://x', 'limit': 4})
+    downloader = http2_downloader(provider, cleartext=True)
+    assert 4 == downloader.limit
+    assert downloader.cleartext
+
+
+# vim: sw=4:et:ai
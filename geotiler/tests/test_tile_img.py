@@ -75,6 +75,18 @@ class MapImageRenderTestCase(unittest.TestCase):
         self.assertEquals((12, 10), img.size)
 
 
+    def test_tile_image_native(self):
+        """
+        Test converting JPEG data into PIL image object in native mode
+        """
+        tile = PIL.Image.new('RGB', (12, 10))
+        f = io.BytesIO()
+        tile.save(f, format='jpeg')
+
+        img = tile_img._tile_image(f.getbuffer(), None)
+        self.assertEqual('RGB', img.mode)
+
+
 def test_render_image():
     """
     Test rendering map image
@@ -96,7 +108,7 @@ def test_render_image():
 
         img_new.assert_called_once_with('RGBA', (30, 20))
         assert 4 == tf.call_count
-        tf.assert_called_with(tile)
+        tf.assert_called_with(tile, 'RGBA')
 
 def test_render_image_error():
     """
@@ -114,6 +126,128 @@ def test_render_image_error():
         offsets = ((0, 0), (10, 0), (20, 0), (0, 10), (10, 10), (20, 10))
         image = tile_img.render_image(map, data, offsets)
         assert 4 == tf.call_count
-        tf.assert_called_with(tile)
+        tf.assert_called_with(tile, 'RGBA')
+
+def _tile_data(mode, color, format='png'):
+    """
+    Create tile data of 10x10 tile image.
+    """
+    f = io.BytesIO()
+    PIL.Image.new(mode, (10, 10), color).save(f, format=format)
+    return f.getvalue()
+
+def test_render_image_mode_jpeg_provider():
+    """
+    Test rendering map image for map provider with JPEG map tiles
+    """
+    map = mock.MagicMock()
+    map.size = 20, 10
+    map.provider.tile_width = 10
+    map.provider.tile_height = 10
+    map.provider.extension = 'jpg'
+
+    tile = _tile_data('RGB', 'blue', 'jpeg')
+    image = tile_img.render_image(map, (tile, tile), ((0, 0), (10, 0)), None)
+    assert 'RGB' == image.mode
+
+def test_render_image_mode_opaque():
+    """
+    Test rendering map image using opaque, RGBA map tiles
+    """
+    map = mock.MagicMock()
+    map.size = 20, 10
+    map.provider.tile_width = 10
+    map.provider.tile_height = 10
+    map.provider.extension = 'png'
+
+    tile = _tile_data('RGBA', (0, 0, 255, 255))
+    image = tile_img.render_image(map, (tile, None), ((0, 0), (10, 0)), None)
+    assert 'RGB' == image.mode
+    assert (0, 0, 255) == image.getpixel((0, 0))
+
+def test_render_image_mode_transparent():
+    """
+    Test rendering map image using transparent map tiles
+    """
+    map = mock.MagicMock()
+    map.size = 20, 10
+    map.provider.tile_width = 10
+    map.provider.tile_height = 10
+    map.provider.extension = 'png'
+
+    tile = _tile_data('RGBA', (0, 0, 255, 128))
+    image = tile_img.render_image(map, (tile, tile), ((0, 0), (10, 0)), None)
+    assert 'RGBA' == image.mode
+    assert (0, 0, 255, 128) == image.getpixel((10, 0))
+
+def test_uniform_tile():
+    """
+    Test replacing data of uniform map tile with colour marker
+    """
+    data = tile_img.uniform_tile(_tile_data('RGBA', (0, 0, 255, 128)))
+    assert b'geotiler:color:RGBA:10x10:\x00\x00\xff\x80' == data
+
+    data = tile_img.uniform_tile(_tile_data('L', 100))
+    assert b'geotiler:color:L:10x10:d' == data
+
+def test_uniform_tile_palette():
+    """
+    Test replacing data of uniform map tile in palette mode
+    """
+    img = PIL.Image.new('RGB', (10, 10), (0, 0, 255)).convert('P')
+    f = io.BytesIO()
+    img.save(f, format='png')
+
+    data = tile_img.uniform_tile(f.getvalue())
+    assert b'geotiler:color:RGB:10x10:\x00\x00\xff' == data
+
+def test_uniform_tile_not_uniform():
+    """
+    Test keeping data of map tile having multiple colours
+    """
+    img = PIL.Image.new('RGB', (10, 10), (0, 0, 255))
+    img.putpixel((5, 5), (0, 0, 254))
+    f = io.BytesIO()
+    img.save(f, format='png')
+    tile = f.getvalue()
+
+    assert tile is tile_img.uniform_tile(tile)
+    assert b'xyz' == tile_img.uniform_tile(b'xyz')
+
+def test_tile_image_color():
+    """
+    Test converting colour marker into uniform map tile
+    """
+    data = b'geotiler:color:RGB:10x10:\x00\x00\xff'
+    tile = tile_img._tile_image(data, 'RGBA')
+    assert ('RGBA', (10, 10), (0, 0, 255, 255)) == tile
+
+    tile = tile_img._tile_image(data, None)
+    assert ('RGB', (10, 10), (0, 0, 255)) == tile
+
+def test_render_image_uniform():
+    """
+    Test rendering map image using uniform map tiles
+    """
+    map = mock.MagicMock()
+    map.size = 20, 10
+    map.provider.tile_width = 10
+    map.provider.tile_height = 10
+    map.provider.extension = 'png'
+
+    tile = _tile_data('RGBA', (0, 0, 255, 128))
+    marker = tile_img.uniform_tile(tile)
+    offsets = (-5, 0), (5, 0)
+    image = tile_img.render_image(map, (marker, tile), offsets)
+    expected = tile_img.render_image(map, (tile, tile), offsets)
+    assert 'RGBA' == image.mode
+    assert expected.tobytes() == image.tobytes()
+
+    # opaque, uniform map tile in native mode
+    marker = tile_img.uniform_tile(_tile_data('RGB', (0, 0, 255)))
+    image = tile_img.render_image(map, (marker, marker), offsets, None)
+    assert 'RGB' == image.mode
+    assert (0, 0, 255) == image.getpixel((0, 0))
+    assert (0, 0, 255) == image.getpixel((14, 9))
 
 # vim: sw=4:et:ai
@@ -30,11 +30,13 @@ Map tile downloading unit tests.
 """
 
 import asyncio
+import os.path
+import tempfile
 import urllib.request
 from contextlib import contextmanager
 from functools import wraps
 
-from geotiler.tile.io import fetch_tile, fetch_tiles
+from geotiler.tile.io import fetch_tile, fetch_tiles, read_tile, read_tiles
 
 import unittest
 from unittest import mock
@@ -132,4 +134,82 @@ class MapTileDownloadingTestCase(unittest.TestCase):
             self.assertEqual(expected, result)
 
 
+class LocalTilesTestCase(unittest.TestCase):
+    """
+    Local map tiles reading unit tests.
+    """
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = self.dir.name
+        for i in range(3):
+            with open(os.path.join(self.path, '{}.png'.format(i)), 'wb') as f:
+                f.write(b'tile' * (i + 1))
+
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+
+    def test_read_tile(self):
+        """
+        Test reading map tile from a file
+        """
+        data = read_tile(os.path.join(self.path, '1.png'))
+        self.assertEqual(b'tiletile', data)
+
+
+    def test_read_tiles(self):
+        """
+        Test reading map tiles from files
+        """
+        stats = mock.MagicMock()
+        paths = [os.path.join(self.path, '{}.png'.format(i)) for i in (0, 5)]
+        result = read_tiles(paths, stats=stats)
+        self.assertEqual([b'tile', None], result)
+        stats.fetched.assert_called_once_with(4, mock.ANY)
+
+
+    def test_fetch_tiles_local(self):
+        """
+        Test fetching local and remote map tiles
+        """
+        urls = [
+            'file://' + os.path.join(self.path, '0.png'),
+            'http://localhost/a.png',
+            'file://' + os.path.join(self.path, '2.png'),
+            'file://' + os.path.join(self.path, '5.png'),
+        ]
+        loop = asyncio.get_event_loop()
+        with mock.patch('geotiler.tile.io.fetch_tile') as f, \
+                mock.patch('geotiler.tile.io.FILE_BATCH', 2):
+            f.return_value = b'remote'
+            task = fetch_tiles(urls, loop=loop)
+            result = list(loop.run_until_complete(task))
+
+        f.assert_called_once_with('http://localhost/a.png')
+        expected = [b'tile', b'remote', b'tile' * 3, None]
+        self.assertEqual(expected, result)
+
+
+    def test_fetch_tiles_generator(self):
+        """
+        Test fetching local and remote map tiles using generator of URLs
+        """
+        urls = [
+            'http://localhost/a.png',
+            'file://' + os.path.join(self.path, '1.png'),
+        ]
+        loop = asyncio.get_event_loop()
+        with mock.patch('geotiler.tile.io.fetch_tile') as f:
+            f.return_value = b'remote'
+            task = fetch_tiles((u for u in urls), loop=loop)
+            result = list(loop.run_until_complete(task))
+
+            task = fetch_tiles((u for u in urls[:1]), loop=loop)
+            remote = list(loop.run_until_complete(task))
+
+        self.assertEqual([b'remote', b'tiletile'], result)
+        self.assertEqual([b'remote'], remote)
+
+
 # vim: sw=4:et:ai
@@ -0,0 +1,123 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Map tile keys unit tests.
+"""
+
+from geotiler.provider import MapProvider
+from geotiler.tile.key import tile_key, key_tile, quadkey, parent_key, \
+    children_keys, key_range, bbox_key_ranges, url_key
+
+import pytest
+
+def test_tile_key():
+    """
+    Test map tile keys order
+    """
+    assert tile_key((1, 1), 1) < tile_key((0, 0), 2)
+    assert tile_key((1, 0), 2) < tile_key((0, 1), 2)
+    assert tile_key((1, 1), 2) < tile_key((2, 0), 2)
+    assert (2 << 58 | 0b1001) == tile_key((1, 2), 2)
+
+
+def test_tile_key_error():
+    """
+    Test map tile key of map tile out of range
+    """
+    with pytest.raises(ValueError):
+        tile_key((2, 0), 1)
+    with pytest.raises(ValueError):
+        tile_key((-1, 0), 1)
+
+
+def test_key_tile():
+    """
+    Test calculating tile coordinates of map tile key
+    """
+    tiles = [((0, 0), 0), ((1, 2), 2), ((2**25 - 1, 12345), 25)]
+    for coord, zoom in tiles:
+        assert (coord, zoom) == key_tile(tile_key(coord, zoom))
+
+
+def test_quadkey():
+    """
+    Test creating quadkey string of map tile key
+    """
+    assert '' == quadkey(tile_key((0, 0), 0))
+    assert '213' == quadkey(tile_key((3, 5), 3))
+
+
+def test_parent_children():
+    """
+    Test calculating parent and children of map tile
+    """
+    key = tile_key((3, 5), 3)
+    assert ((1, 2), 2) == key_tile(parent_key(key))
+
+    children = [key_tile(k) for k in children_keys(key)]
+    assert [(6, 10), (7, 10), (6, 11), (7, 11)] == [c for c, _ in children]
+    assert all(z == 4 for _, z in children)
+    assert all(parent_key(k) == key for k in children_keys(key))
+
+    with pytest.raises(ValueError):
+        parent_key(tile_key((0, 0), 0))
+
+
+def test_key_range():
+    """
+    Test calculating range of keys of descendant map tiles
+    """
+    key = tile_key((1, 0), 1)
+    start, end = key_range(key, 3)
+    tiles = [key_tile(k) for k in range(start, end)]
+    assert 16 == len(tiles)
+    assert all(4 <= x < 8 and 0 <= y < 4 and z == 3 for (x, y), z in tiles)
+
+
+def test_bbox_key_ranges():
+    """
+    Test calculating ranges of keys of map tiles within bounding box
+    """
+    ranges = bbox_key_ranges((5, 7), (20, 13), 6)
+    keys = [k for start, end in ranges for k in range(start, end)]
+
+    expected = sorted(
+        tile_key((x, y), 6) for x in range(5, 21) for y in range(7, 14)
+    )
+    assert expected == keys
+    assert all(r1[1] < r2[0] for r1, r2 in zip(ranges, ranges[1:]))
+
+
+def test_url_key():
+    """
+    Test calculating map tile key of map tile URL
+    """
+    provider = MapProvider({
+        'url': 'http://{subdomain}.tile.openstreetmap.org/{z}/{x}/{y}.{ext}',
+        'subdomains': ('a', 'b', 'c'),
+    })
+    key = url_key(provider)
+    url = provider.tile_url((3, 5), 3)
+    assert tile_key((3, 5), 3) == key(url)
+    assert key('http://localhost/a.png') is None
+    assert key(provider.tile_url((8, 5), 3)) is None
+
+
+# vim: sw=4:et:ai
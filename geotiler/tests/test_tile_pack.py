@@ -0,0 +1,146 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Map tiles pack file unit tests.
+"""
+
+import asyncio
+import os.path
+import tempfile
+
+from geotiler.provider import MapProvider
+from geotiler.tile.pack import PackReader, PackWriter, pack_downloader, \
+    seeding_downloader
+
+import pytest
+
+PROVIDER = MapProvider({
+    'url': 'http://{subdomain}.tile.openstreetmap.org/{z}/{x}/{y}.{ext}',
+    'subdomains': ('a', 'b', 'c'),
+})
+
+@pytest.fixture
+def pack_file():
+    """
+    Create map tiles pack file name in temporary directory.
+    """
+    with tempfile.TemporaryDirectory() as path:
+        yield os.path.join(path, 'tiles.pack')
+
+def create_pack(filename, tiles):
+    """
+    Create map tiles pack file.
+    """
+    writer = PackWriter(filename)
+    for coord, zoom, data in tiles:
+        writer.add(coord, zoom, data)
+    writer.close()
+
+def test_pack_read(pack_file):
+    """
+    Test reading map tiles from pack file
+    """
+    tiles = [
+        ((3, 2), 2, b'tile-a'),
+        ((0, 0), 0, b'tile-b'),
+        ((2**18 - 1, 2**18 - 2), 18, b'tile-c'),
+        ((3, 2), 2, b'tile-d'),
+    ]
+    create_pack(pack_file, tiles)
+
+    reader = PackReader(pack_file)
+    try:
+        assert 3 == reader.size
+        assert b'tile-d' == bytes(reader.get((3, 2), 2))
+        assert b'tile-b' == bytes(reader.get((0, 0), 0))
+        assert b'tile-c' == bytes(reader.get((2**18 - 1, 2**18 - 2), 18))
+        assert reader.get((2, 3), 2) is None
+        assert reader.get((0, 0), 19) is None
+
+        data = reader.get((0, 0), 0)
+        assert isinstance(data, memoryview)
+        data.release()
+    finally:
+        reader.close()
+
+def test_pack_read_error(pack_file):
+    """
+    Test error when reading file, which is not map tiles pack file
+    """
+    with open(pack_file, 'wb') as f:
+        f.write(b'x' * 32)
+    with pytest.raises(ValueError):
+        PackReader(pack_file)
+
+def test_pack_downloader(pack_file):
+    """
+    Test pack file downloader
+    """
+    create_pack(pack_file, [((3, 2), 2, b'tile-a')])
+    reader = PackReader(pack_file)
+
+    @asyncio.coroutine
+    def images(urls, **kw):
+        assert ['http://b.tile.openstreetmap.org/2/3/3.png'] == list(urls)
+        return [b'tile-b']
+
+    urls = [
+        'http://a.tile.openstreetmap.org/2/3/2.png',
+        'http://b.tile.openstreetmap.org/2/3/3.png',
+    ]
+    loop = asyncio.get_event_loop()
+
+    downloader = pack_downloader(reader, PROVIDER)
+    result = list(loop.run_until_complete(downloader(urls)))
+    assert b'tile-a' == bytes(result[0])
+    assert result[1] is None
+
+    downloader = pack_downloader(reader, PROVIDER, images)
+    result = list(loop.run_until_complete(downloader(urls)))
+    assert b'tile-a' == bytes(result[0])
+    assert b'tile-b' == result[1]
+
+    del result
+    reader.close()
+
+def test_seeding_downloader(pack_file):
+    """
+    Test seeding map tiles pack file with downloaded map tiles
+    """
+    @asyncio.coroutine
+    def images(urls, **kw):
+        return [u.encode() for u in urls]
+
+    writer = PackWriter(pack_file)
+    downloader = seeding_downloader(writer, PROVIDER, images)
+    urls = [
+        'http://a.tile.openstreetmap.org/2/3/2.png',
+        'http://b.tile.openstreetmap.org/2/3/3.png',
+    ]
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(downloader(urls))
+    writer.close()
+
+    reader = PackReader(pack_file)
+    assert 2 == reader.size
+    assert urls[1].encode() == bytes(reader.get((3, 3), 2))
+    reader.close()
+
+# vim: sw=4:et:ai
@@ -0,0 +1,148 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Track rendering unit tests.
+"""
+
+import gzip
+import os.path
+import tempfile
+
+import numpy as np
+import PIL.Image
+
+from geotiler.map import Map
+from geotiler.track import read_gpx, track_extent, rev_geocode, \
+    track_mask, render_track
+
+import pytest
+
+GPX_DATA = b"""<?xml version="1.0" encoding="UTF-8"?>
+<gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1">
+  <trk><trkseg>
+    <trkpt lat="53.1" lon="-6.1"><ele>1</ele></trkpt>
+    <trkpt lat="53.2" lon="-6.2"/>
+  </trkseg><trkseg>
+    <trkpt lat="53.3" lon="-6.3"/>
+  </trkseg></trk>
+</gpx>
+"""
+
+def read_chunks(chunk_size):
+    """
+    Read positions from GPX file in chunks.
+    """
+    with tempfile.TemporaryDirectory() as path:
+        fn = os.path.join(path, 'track.gpx')
+        with open(fn, 'wb') as f:
+            f.write(GPX_DATA)
+        return list(read_gpx(fn, chunk_size=chunk_size))
+
+def test_read_gpx():
+    """
+    Test reading positions from GPX file in chunks
+    """
+    chunks = read_chunks(2)
+
+    assert [2, 1] == [len(c) for c in chunks]
+    expected = [[-6.1, 53.1], [-6.2, 53.2], [-6.3, 53.3]]
+    assert expected == np.concatenate(chunks).tolist()
+
+
+def test_read_gpx_compressed():
+    """
+    Test reading positions from compressed GPX file
+    """
+    with tempfile.TemporaryDirectory() as path:
+        fn = os.path.join(path, 'track.gpx.gz')
+        with gzip.open(fn, 'wb') as f:
+            f.write(GPX_DATA)
+
+        chunks = list(read_gpx(fn))
+
+    assert 1 == len(chunks)
+    assert (3, 2) == chunks[0].shape
+
+
+def test_track_extent():
+    """
+    Test calculating extent of positions
+    """
+    extent = track_extent(read_chunks(2))
+    assert (-6.3, 53.1, -6.1, 53.3) == extent
+
+
+def test_track_extent_empty():
+    """
+    Test calculating extent of no positions
+    """
+    with pytest.raises(ValueError):
+        track_extent([np.empty((0, 2))])
+
+
+def test_rev_geocode():
+    """
+    Test reverse geocoding of multiple locations
+    """
+    map = Map(center=(-6.2, 53.2), zoom=10, size=(512, 512))
+    points = np.concatenate(read_chunks(2))
+
+    result = rev_geocode(map, points)
+    expected = [map.rev_geocode(p) for p in points]
+    assert np.allclose(expected, result)
+
+
+def test_track_mask():
+    """
+    Test rasterizing positions into mask of map image pixels
+    """
+    map = Map(center=(-6.069, 53.388), zoom=16, size=(512, 512))
+    points = [
+        np.array([map.geocode((10.5, 20.5)), map.geocode((10.7, 20.2))]),
+        np.array([map.geocode((30.5, 40.5)), map.geocode((-10, 40))]),
+    ]
+    mask = track_mask(map, points)
+
+    assert (512, 512) == mask.shape
+    assert 2 == np.count_nonzero(mask)
+    assert mask[20, 10] and mask[40, 30]
+
+
+def test_render_track():
+    """
+    Test drawing positions on map image
+    """
+    map = Map(center=(-6.069, 53.388), zoom=16, size=(64, 64))
+    points = [np.array([map.geocode((10.5, 20.5))])]
+    image = PIL.Image.new('RGB', (64, 64), 'white')
+
+    result = render_track(map, points, image, radius=2)
+    assert 'RGBA' == result.mode
+    assert (255, 0, 0, 255) == result.getpixel((10, 20))
+    assert (255, 0, 0, 255) == result.getpixel((12, 20))
+    assert (255, 255, 255, 255) == result.getpixel((12, 22))
+    assert (255, 255, 255, 255) == result.getpixel((13, 20))
+
+    result = render_track(map, points, alpha=0.5)
+    assert (255, 0, 0, 128) == result.getpixel((10, 20))
+    assert 0 == result.getpixel((11, 20))[3]
+
+
+# vim: sw=4:et:ai
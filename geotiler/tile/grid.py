@@ -0,0 +1,202 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Grid of map tiles.
+"""
+
+import array
+import itertools
+
+class TileGrid:
+    """
+    Grid of map tiles.
+
+    Tile grid is a sequence of map tiles at a zoom level. Each map tile has
+    tile coordinates and optional offset within map image. The coordinates
+    and offsets are stored in arrays.
+
+    The grids support set operations - union, difference and intersection.
+    Map tiles identity is determined by tile coordinates. Map tiles order
+    is preserved, the map tiles of the first grid come first. The offset of
+    a map tile is taken from the grid the map tile comes from.
+
+    :var zoom: Zoom level of map tiles.
+    """
+    __slots__ = 'zoom', '_xs', '_ys', '_ox', '_oy', '_keys'
+
+    def __init__(self, zoom, coords, offsets=None):
+        """
+        Create grid of map tiles.
+
+        :param zoom: Zoom level of map tiles.
+        :param coords: Collection of map tiles coordinates.
+        :param offsets: Collection of map tiles offsets within map image.
+        """
+        self.zoom = zoom
+        coords = tuple(coords)
+        self._xs = array.array('q', (c[0] for c in coords))
+        self._ys = array.array('q', (c[1] for c in coords))
+        if offsets is None:
+            self._ox = self._oy = None
+        else:
+            offsets = tuple(offsets)
+            if len(offsets) != len(coords):
+                raise ValueError('Number of offsets is not number of tiles')
+            self._ox = array.array('q', (o[0] for o in offsets))
+            self._oy = array.array('q', (o[1] for o in offsets))
+        self._keys = None
+
+
+    @property
+    def coords(self):
+        """
+        Collection of map tiles coordinates.
+        """
+        return tuple(zip(self._xs, self._ys))
+
+
+    @property
+    def offsets(self):
+        """
+        Collection of map tiles offsets within map image.
+
+        The offsets are `None` if not set on grid creation.
+        """
+        if self._ox is None:
+            return None
+        return tuple(zip(self._ox, self._oy))
+
+
+    def keys(self):
+        """
+        Get set of map tiles coordinates.
+        """
+        if self._keys is None:
+            self._keys = frozenset(zip(self._xs, self._ys))
+        return self._keys
+
+
+    def union(self, other):
+        """
+        Create grid of map tiles of this grid and the other grid.
+
+        :param other: Grid of map tiles.
+        """
+        self._check_zoom(other)
+        keys = self.keys()
+        items = (i for i in range(len(other)) if other._coord(i) not in keys)
+        return self._grid(range(len(self)), other, items)
+
+
+    def difference(self, other):
+        """
+        Create grid of map tiles of this grid, which are not in the other
+        grid.
+
+        :param other: Grid of map tiles.
+        """
+        self._check_zoom(other)
+        keys = other.keys()
+        items = (i for i in range(len(self)) if self._coord(i) not in keys)
+        return self._grid(items)
+
+
+    def intersection(self, other):
+        """
+        Create grid of map tiles of this grid, which are in the other grid.
+
+        :param other: Grid of map tiles.
+        """
+        self._check_zoom(other)
+        keys = other.keys()
+        items = (i for i in range(len(self)) if self._coord(i) in keys)
+        return self._grid(items)
+
+
+    __or__ = union
+    __sub__ = difference
+    __and__ = intersection
+
+
+    def __len__(self):
+        return len(self._xs)
+
+
+    def __iter__(self):
+        return zip(self._xs, self._ys)
+
+
+    def __contains__(self, coord):
+        return tuple(coord) in self.keys()
+
+
+    def __eq__(self, other):
+        return isinstance(other, TileGrid) \
+            and self.zoom == other.zoom \
+            and self._xs == other._xs \
+            and self._ys == other._ys
+
+
+    def __repr__(self):
+        return 'TileGrid(zoom={}, size={})'.format(self.zoom, len(self))
+
+
+    def _coord(self, i):
+        """
+        Get coordinates of i-th map tile.
+        """
+        return self._xs[i], self._ys[i]
+
+
+    def _grid(self, items, other=None, other_items=()):
+        """
+        Create grid of map tiles using map tiles of this grid and of other
+        grid.
+
+        :param items: Indexes of map tiles of this grid.
+        :param other: Other grid of map tiles.
+        :param other_items: Indexes of map tiles of other grid.
+        """
+        sources = [(self, items)]
+        if other is not None:
+            sources.append((other, other_items))
+        sources = [(g, tuple(idx)) for g, idx in sources]
+
+        coords = itertools.chain.from_iterable(
+            (g._coord(i) for i in idx) for g, idx in sources
+        )
+        offsets = None
+        if all(g._ox is not None for g, _ in sources):
+            offsets = itertools.chain.from_iterable(
+                ((g._ox[i], g._oy[i]) for i in idx) for g, idx in sources
+            )
+        return TileGrid(self.zoom, coords, offsets)
+
+
+    def _check_zoom(self, other):
+        """
+        Check if zoom level of other grid is the same as zoom level of
+        this grid.
+        """
+        if self.zoom != other.zoom:
+            raise ValueError('Zoom levels of tile grids are different')
+
+
+# vim: sw=4:et:ai
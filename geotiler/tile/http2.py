@@ -0,0 +1,412 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+HTTP/2 transport to download map tiles.
+
+All map tiles of a host are downloaded with one HTTP/2 connection. The
+requests are multiplexed as concurrent streams of the connection. The
+module requires `h2` library.
+"""
+
+import asyncio
+import logging
+import ssl
+import time
+import urllib.parse
+
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+
+from .io import HEADERS, FMT_DOWNLOAD_LOG, fetch_tile
+
+logger = logging.getLogger(__name__)
+
+def http2_downloader(provider, **options):
+    """
+    Create HTTP/2 map tiles downloader for a map provider.
+
+    Map provider `limit` attribute is used as maximum number of concurrent
+    streams of HTTP/2 connection. See
+    :py:class:`geotiler.tile.http2.HTTP2Downloader` for options.
+
+    :param provider: Map provider of map tiles.
+    :param options: Options of HTTP/2 downloader.
+    """
+    return HTTP2Downloader(limit=provider.limit, **options)
+
+
+class HTTP2Downloader:
+    """
+    Map tiles downloader using HTTP/2 protocol.
+
+    The downloader is asyncio coroutine function with the same interface as
+    :py:func:`geotiler.tile.io.fetch_tiles`, i.e.::
+
+        downloader = HTTP2Downloader(limit=4)
+        image = geotiler.render_map(map, downloader=downloader)
+        downloader.close()
+
+    One connection per host is opened and kept open between calls of the
+    downloader. HTTP/2 protocol is negotiated with TLS ALPN extension for
+    `https` URLs. HTTP/2 over cleartext TCP connection (with prior
+    knowledge) is used for `http` URLs if `cleartext` is true. Otherwise,
+    or if a host does not support HTTP/2, map tiles are downloaded with
+    :py:func:`geotiler.tile.io.fetch_tile` function.
+
+    :var limit: Maximum number of concurrent streams of a connection.
+    :var ssl: SSL context for `https` connections.
+    :var cleartext: Use HTTP/2 for `http` URLs.
+    :var timeout: Map tile request timeout in seconds, time spent waiting
+        for a free stream of a connection is not included.
+    """
+    def __init__(self, limit=1, ssl=None, cleartext=False, timeout=30):
+        """
+        Create map tiles downloader using HTTP/2 protocol.
+
+        :param limit: Maximum number of concurrent streams of a connection.
+        :param ssl: SSL context for `https` connections.
+        :param cleartext: Use HTTP/2 for `http` URLs.
+        :param timeout: Map tile request timeout in seconds.
+        """
+        self.limit = limit
+        self.ssl = ssl
+        self.cleartext = cleartext
+        self.timeout = timeout
+        self._connections = {}
+
+
+    @asyncio.coroutine
+    def __call__(self, urls, loop=None, stats=None):
+        """
+        Download map tiles for the collection of URLs.
+
+        This is asyncio coroutine.
+
+        Tile data for each URL is returned. If there was an error while
+        downloading a tile, then None is returned for given URL.
+
+        :param urls: Collection of URLs.
+        :param loop: Asyncio loop (used default one if `None`).
+        :param stats: Map rendering statistics object.
+        """
+        if loop is None:
+            loop = asyncio.get_event_loop()
+
+        tasks = (self._fetch(u, loop, stats) for u in urls)
+        data = yield from asyncio.gather(
+            *tasks, loop=loop, return_exceptions=True
+        )
+
+        # log missing tiles
+        in_error = (t for t in data if isinstance(t, Exception))
+        for t in in_error:
+            logger.warning(FMT_DOWNLOAD_LOG(t))
+
+        return (None if isinstance(t, Exception) else t for t in data)
+
+
+    def close(self):
+        """
+        Close all connections of the downloader.
+        """
+        tasks = self._connections.values()
+        connections = (
+            t.result() for t in tasks
+            if t.done() and not t.cancelled() and t.exception() is None
+        )
+        for conn in connections:
+            if conn is not None:
+                conn.close()
+        self._connections.clear()
+
+
+    @asyncio.coroutine
+    def _fetch(self, url, loop, stats):
+        """
+        Fetch map tile.
+
+        :param url: URL of map tile.
+        :param loop: Asyncio loop.
+        :param stats: Map rendering statistics object.
+        """
+        start = time.perf_counter()
+        parts = urllib.parse.urlsplit(url)
+        conn = yield from self._connection(parts, loop)
+        if conn is None:
+            data = yield from loop.run_in_executor(None, fetch_tile, url)
+        else:
+            path = parts.path
+            if parts.query:
+                path += '?' + parts.query
+            try:
+                status, data = yield from conn.get(path, self.timeout)
+            except asyncio.TimeoutError:
+                fmt = 'Timeout downloading {} after {}s'.format
+                raise TimeoutError(fmt(url, self.timeout)) from None
+            if status != 200:
+                fmt = 'Unable to download {} (HTTP status {})'.format
+                raise ValueError(fmt(url, status))
+
+        if stats is not None:
+            stats.fetched(len(data), time.perf_counter() - start)
+        return data
+
+
+    @asyncio.coroutine
+    def _connection(self, parts, loop):
+        """
+        Get HTTP/2 connection to a host.
+
+        The connection is opened on first use and when previous connection
+        is closed. Null is returned if the host does not support HTTP/2.
+
+        :param parts: Parsed URL of map tile.
+        :param loop: Asyncio loop.
+        """
+        key = parts.scheme, parts.netloc
+        task = self._connections.get(key)
+        if task is None or _is_closed(task):
+            task = asyncio.ensure_future(self._connect(parts, loop), loop=loop)
+            self._connections[key] = task
+        # shield connection task shared by all requests to the host
+        conn = yield from asyncio.shield(task)
+        return conn
+
+
+    @asyncio.coroutine
+    def _connect(self, parts, loop):
+        """
+        Open HTTP/2 connection to a host.
+
+        :param parts: Parsed URL of map tile.
+        :param loop: Asyncio loop.
+        """
+        if parts.scheme == 'https':
+            context = self.ssl
+            if context is None:
+                context = ssl.create_default_context()
+                context.set_alpn_protocols(['h2', 'http/1.1'])
+            port = 443
+        elif parts.scheme == 'http' and self.cleartext:
+            context = None
+            port = 80
+        else:
+            return None
+
+        if parts.port is not None:
+            port = parts.port
+
+        conn = _Connection(parts.netloc, parts.scheme, self.limit, loop)
+        yield from loop.create_connection(
+            lambda: conn, parts.hostname, port, ssl=context
+        )
+        if not conn.http2:
+            logger.info('no HTTP/2 support by {}'.format(parts.netloc))
+            conn.close()
+            return None
+
+        if __debug__:
+            logger.debug('HTTP/2 connection to {}'.format(parts.netloc))
+        return conn
+
+
+class _Connection(asyncio.Protocol):
+    """
+    HTTP/2 connection to a host.
+
+    :var authority: Authority of map tile URLs, i.e. host name and port.
+    :var scheme: Scheme of map tile URLs.
+    :var http2: True if HTTP/2 protocol is used by the connection.
+    :var closed: True if the connection is closed.
+    """
+    def __init__(self, authority, scheme, limit, loop):
+        """
+        Create HTTP/2 connection.
+
+        :param authority: Authority of map tile URLs.
+        :param scheme: Scheme of map tile URLs.
+        :param limit: Maximum number of concurrent streams.
+        :param loop: Asyncio loop.
+        """
+        config = h2.config.H2Configuration(
+            client_side=True, header_encoding='utf-8'
+        )
+        self.authority = authority
+        self.scheme = scheme
+        self.http2 = False
+        self.closed = False
+
+        self._conn = h2.connection.H2Connection(config=config)
+        self._transport = None
+        self._limit = asyncio.Semaphore(limit, loop=loop)
+        self._loop = loop
+        self._streams = {}
+
+
+    def connection_made(self, transport):
+        self._transport = transport
+        ssl_object = transport.get_extra_info('ssl_object')
+        if ssl_object is not None:
+            protocol = ssl_object.selected_alpn_protocol()
+            if protocol != 'h2':
+                return
+
+        self.http2 = True
+        self._conn.initiate_connection()
+        self._send()
+
+
+    def data_received(self, data):
+        try:
+            events = self._conn.receive_data(data)
+        except h2.exceptions.ProtocolError as ex:
+            self._fail(ConnectionError('HTTP/2 protocol error: {}'.format(ex)))
+            self._transport.close()
+            return
+
+        for event in events:
+            stream = self._streams.get(getattr(event, 'stream_id', None))
+            if isinstance(event, h2.events.ResponseReceived) and stream:
+                stream[2].update(event.headers)
+            elif isinstance(event, h2.events.DataReceived):
+                if stream:
+                    stream[1].append(event.data)
+                self._conn.acknowledge_received_data(
+                    event.flow_controlled_length, event.stream_id
+                )
+            elif isinstance(event, h2.events.StreamEnded) and stream:
+                if not stream[0].done():
+                    stream[0].set_result(None)
+            elif isinstance(event, h2.events.StreamReset) and stream:
+                if not stream[0].done():
+                    msg = 'HTTP/2 stream reset (error code {})'
+                    error = ConnectionError(msg.format(event.error_code))
+                    stream[0].set_exception(error)
+            elif isinstance(event, h2.events.ConnectionTerminated):
+                self.closed = True
+                self._fail(ConnectionError('HTTP/2 connection terminated'))
+
+        self._send()
+
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self._fail(ConnectionError('HTTP/2 connection lost'))
+
+
+    @asyncio.coroutine
+    def get(self, path, timeout=None):
+        """
+        Send GET request and receive response.
+
+        Pair of HTTP status and response data is returned.
+
+        The timeout applies to the request only, not to waiting for a free
+        stream of the connection. The `asyncio.TimeoutError` exception is
+        raised on timeout.
+
+        :param path: Path of map tile URL.
+        :param timeout: Request timeout in seconds.
+        """
+        yield from self._limit.acquire()
+        try:
+            if self.closed:
+                raise ConnectionError('HTTP/2 connection closed')
+
+            sid = self._conn.get_next_available_stream_id()
+            future = asyncio.Future(loop=self._loop)
+            chunks = []
+            headers = {}
+            self._streams[sid] = future, chunks, headers
+
+            request = [
+                (':method', 'GET'),
+                (':authority', self.authority),
+                (':scheme', self.scheme),
+                (':path', path),
+            ]
+            request.extend((k.lower(), v) for k, v in HEADERS.items())
+            self._conn.send_headers(sid, request, end_stream=True)
+            self._send()
+
+            try:
+                yield from asyncio.wait_for(future, timeout, loop=self._loop)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                # cancel the stream on timeout
+                if not self.closed:
+                    self._conn.reset_stream(sid)
+                    self._send()
+                raise
+            finally:
+                del self._streams[sid]
+        finally:
+            self._limit.release()
+
+        status = int(headers.get(':status', 0))
+        return status, b''.join(chunks)
+
+
+    def close(self):
+        """
+        Close HTTP/2 connection.
+        """
+        if not self.closed and self.http2:
+            self._conn.close_connection()
+            self._send()
+        self.closed = True
+        self._transport.close()
+
+
+    def _send(self):
+        """
+        Send pending HTTP/2 protocol data.
+        """
+        data = self._conn.data_to_send()
+        if data:
+            self._transport.write(data)
+
+
+    def _fail(self, error):
+        """
+        Fail all pending requests of the connection.
+
+        :param error: Exception set for each pending request.
+        """
+        futures = (f for f, _, _ in self._streams.values() if not f.done())
+        for f in futures:
+            f.set_exception(error)
+
+
+def _is_closed(task):
+    """
+    Check if connection task failed or its connection is closed.
+
+    :param task: Asyncio task opening HTTP/2 connection.
+    """
+    if not task.done():
+        return False
+    if task.cancelled() or task.exception() is not None:
+        return True
+    conn = task.result()
+    return conn is not None and conn.closed
+
+
+# vim: sw=4:et:ai
@@ -30,8 +30,10 @@ Render map image using map tile data.
 """
 
 import io
+import collections
 import functools
 import logging
+import time
 
 import PIL.Image
 import PIL.ImageDraw
@@ -39,40 +41,202 @@ import PIL.ImageDraw
 logger = logging.getLogger(__name__)
 
 
-def render_image(map, tile_data, offsets):
+# modes of opaque images
+OPAQUE_MODES = '1', 'L', 'RGB', 'CMYK', 'YCbCr'
+
+# prefix of colour marker of uniform map tile
+COLOR_MARKER = b'geotiler:color:'
+
+# modes of uniform map tiles recorded with colour marker
+UNIFORM_MODES = 'L', 'LA', 'RGB', 'RGBA'
+
+ColorTile = collections.namedtuple('ColorTile', 'mode size color')
+ColorTile.__doc__ = """
+Uniform map tile having single colour.
+
+:var mode: Mode of map tile colour, i.e. `RGBA`.
+:var size: Size of map tile image.
+:var color: Colour of map tile, integer or tuple of integers.
+"""
+
+def render_image(
+    map, tile_data, offsets, mode='RGBA', size=None, stats=None
+):
     """
     Redner map image using map tile data.
 
     Each item in tile data collection is tile image data, which can be
     interpreted with `PIL` library (via `PIL.Image.open` call, i.e. PNG
-    file data or JPEG file data). The item can also be `None` if tile data
-    could not be downloaded, i.e. due to network error.
+    file data or JPEG file data) or colour marker of uniform map tile (see
+    :py:func:`geotiler.tile.img.uniform_tile`). The item can also be `None`
+    if tile data could not be downloaded, i.e. due to network error.
 
     The map tiles are rendered into single map image. Error tile image is
     rendered if data for a tile does not exist.
 
-    The PIL image object is returned.
+    The PIL image object is returned. The mode of the image is `RGBA` by
+    default. If `mode` is null, then the mode is determined with map
+    provider metadata or with first map tile, see
+    :py:func:`geotiler.tile.img.compose_image`.
 
     :param map: Map object.
     :param tile_data: Collection of tile data.
     :param offsets: Tile offset within map image for each tile data item.
+    :param mode: Map image mode, i.e. `RGBA` or `RGB`.
+    :param size: Image size, map image size is used if `None`.
+    :param stats: Map rendering statistics object.
+    """
+    images = (_tile_image(tile, mode) if tile else None for tile in tile_data)
+    if stats is None:
+        return compose_image(map, images, offsets, mode, size)
+
+    # decode tiles upfront to measure decoding and composition separately
+    start = time.perf_counter()
+    images = tuple(images)
+    for img in images:
+        if img is not None and not isinstance(img, ColorTile):
+            img.load()
+    stats.decode_time += time.perf_counter() - start
+
+    start = time.perf_counter()
+    image = compose_image(map, images, offsets, mode, size)
+    stats.composite_time += time.perf_counter() - start
+    return image
+
+
+def compose_image(map, images, offsets, mode='RGBA', size=None):
+    """
+    Compose map image from decoded map tile images.
+
+    Each item in images collection is `PIL.Image` object, uniform map tile
+    (see :py:class:`geotiler.tile.img.ColorTile`) or `None` if tile data
+    could not be obtained. Uniform map tile is rendered by filling
+    rectangle with its colour. Error tile image is rendered for a missing
+    tile image.
+
+    If `mode` is null, then `RGB` mode is used for map provider with JPEG
+    map tiles or when first tile image is opaque. Otherwise `RGBA` mode is
+    used. The tile images are pasted in their native mode and converted by
+    `PIL` only when required.
+
+    The size of the image is map image size by default. Use `size`
+    parameter to render part of a map image, i.e. a map image block.
+
+    The PIL image object is returned.
+
+    :param map: Map object.
+    :param images: Collection of tile images.
+    :param offsets: Tile offset within map image for each tile image.
+    :param mode: Map image mode, i.e. `RGBA` or `RGB`.
+    :param size: Image size, map image size is used if `None`.
     """
     if __debug__:
         logger.debug('combining tiles')
 
     provider = map.provider
 
+    if mode is None:
+        images = tuple(images)
+        mode = _image_mode(provider, images)
+
+    if size is None:
+        size = map.size
+
     # PIL requires image size to be a tuple
-    image = PIL.Image.new('RGBA', tuple(map.size))
+    image = PIL.Image.new(mode, tuple(size))
     error = _error_image(provider.tile_width, provider.tile_height)
 
-    for tile, offset in zip(tile_data, offsets):
-        img = _tile_image(tile) if tile else error
-        image.paste(img, offset)
+    for img, offset in zip(images, offsets):
+        if img is None:
+            image.paste(error, offset)
+        elif isinstance(img, ColorTile):
+            x, y = offset
+            w, h = img.size
+            color = img.color
+            if img.mode != mode:
+                color = _convert_color(img.mode, color, mode)
+            image.paste(color, (x, y, x + w, y + h))
+        else:
+            image.paste(img, offset)
 
     return image
 
 
+def uniform_tile(data):
+    """
+    Replace data of uniform map tile with colour marker.
+
+    Map tile data is decoded and if all pixels of map tile image have the
+    same colour, then colour marker is returned. The colour marker is
+    a short byte string storing mode, size and colour of map tile image.
+    Otherwise, or if map tile data cannot be decoded, the original data is
+    returned.
+
+    The colour marker can be stored in a cache instead of map tile data and
+    is rendered with a rectangle fill instead of decoding and pasting map
+    tile image, see :py:func:`geotiler.tile.img.compose_image`.
+
+    :param data: Map tile data, i.e. PNG file data.
+    """
+    try:
+        img = PIL.Image.open(io.BytesIO(data))
+        if img.mode == 'P':
+            # check palette indexes first, no conversion of most map tiles
+            lo, hi = img.getextrema()
+            if lo != hi:
+                return data
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        elif img.mode == '1':
+            img = img.convert('L')
+
+        if img.mode not in UNIFORM_MODES:
+            return data
+
+        extrema = img.getextrema()
+    except (OSError, ValueError) as ex:
+        logger.warning('cannot decode map tile data: {}'.format(ex))
+        return data
+
+    if img.mode == 'L':
+        extrema = extrema,
+    if any(lo != hi for lo, hi in extrema):
+        return data
+
+    size = '{}x{}'.format(*img.size)
+    color = bytes(lo for lo, _ in extrema)
+    return b''.join(
+        (COLOR_MARKER, img.mode.encode(), b':', size.encode(), b':', color)
+    )
+
+
+def _image_mode(provider, images):
+    """
+    Determine map image mode using map provider metadata or first tile
+    image.
+
+    :param provider: Map provider.
+    :param images: Collection of tile images.
+    """
+    if provider.extension in ('jpg', 'jpeg'):
+        return 'RGB'
+
+    img = next((img for img in images if img is not None), None)
+    if img is None:
+        opaque = False
+    elif isinstance(img, ColorTile):
+        if img.mode in ('RGBA', 'LA'):
+            opaque = img.color[-1] == 255
+        else:
+            opaque = img.mode in OPAQUE_MODES
+    elif img.mode == 'RGBA':
+        opaque = img.getextrema()[3] == (255, 255)
+    elif img.mode == 'P':
+        opaque = 'transparency' not in img.info
+    else:
+        opaque = img.mode in OPAQUE_MODES
+    return 'RGB' if opaque else 'RGBA'
+
+
 @functools.lru_cache(maxsize=4)
 def _error_image(width, height):
     """
@@ -92,15 +256,62 @@ def _error_image(width, height):
     return img
 
 
-def _tile_image(data):
+def _tile_image(data, mode='RGBA'):
     """
     Convert image data like PNG file data or JPEG file data into
     `PIL.Image` object.
 
+    The image is converted to `mode` unless it is already in that mode. If
+    `mode` is null, then image in its native mode is returned.
+
+    Uniform map tile is returned for colour marker of uniform map tile, see
+    :py:func:`geotiler.tile.img.uniform_tile`.
+
     :param data: Tile data, i.e. PNG file data.
+    :param mode: Mode of tile image.
     """
+    if bytes(data[:len(COLOR_MARKER)]) == COLOR_MARKER:
+        return _color_tile(bytes(data), mode)
+
     f = io.BytesIO(data)
-    return PIL.Image.open(f).convert('RGBA')
+    img = PIL.Image.open(f)
+    if mode is not None and img.mode != mode:
+        img = img.convert(mode)
+    return img
+
+
+@functools.lru_cache(maxsize=64)
+def _color_tile(data, mode):
+    """
+    Convert colour marker of uniform map tile into uniform map tile.
+
+    The colour is converted to `mode` unless it is already in that mode.
+    If `mode` is null, then colour in its native mode is used.
+
+    :param data: Colour marker of uniform map tile.
+    :param mode: Mode of uniform map tile.
+    """
+    tile_mode, size, color = data[len(COLOR_MARKER):].split(b':', 2)
+    tile_mode = tile_mode.decode()
+    size = tuple(int(v) for v in size.split(b'x'))
+    color = color[0] if len(color) == 1 else tuple(color)
+    if mode is not None and tile_mode != mode:
+        color = _convert_color(tile_mode, color, mode)
+        tile_mode = mode
+    return ColorTile(tile_mode, size, color)
+
+
+@functools.lru_cache(maxsize=64)
+def _convert_color(mode, color, target):
+    """
+    Convert colour from one image mode to another.
+
+    :param mode: Image mode of the colour.
+    :param color: Colour to convert.
+    :param target: Image mode of converted colour.
+    """
+    img = PIL.Image.new(mode, (1, 1), color)
+    return img.convert(target).getpixel((0, 0))
 
 
 # vim: sw=4:et:ai
@@ -30,6 +30,11 @@ Functions and coroutines to download map tiles.
 """
 
 import asyncio
+import inspect
+import itertools
+import os
+import time
+import urllib.parse
 import urllib.request
 import logging
 
@@ -43,6 +48,9 @@ HEADERS = {
 
 FMT_DOWNLOAD_LOG = 'Cannot download a tile due to error: {}'.format
 
+# number of local map tiles read with one executor call
+FILE_BATCH = 64
+
 def fetch_tile(url):
     """
     Fetch map tile.
@@ -64,8 +72,55 @@ def fetch_tile(url):
     return response.read()
 
 
+def read_tile(path):
+    """
+    Read map tile data from a file.
+
+    The file is read with one system call into buffer of file size.
+
+    :param path: File name of map tile.
+    """
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        size = os.fstat(fd).st_size
+        data = os.read(fd, size)
+        while len(data) < size:
+            chunk = os.read(fd, size - len(data))
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        os.close(fd)
+    return data
+
+
+def read_tiles(paths, stats=None):
+    """
+    Read map tile data from a collection of files.
+
+    Map tile data for each file is returned. If a file cannot be read, then
+    `None` is returned for given file.
+
+    :param paths: Collection of file names of map tiles.
+    :param stats: Map rendering statistics object.
+    """
+    result = []
+    for path in paths:
+        start = time.perf_counter()
+        try:
+            data = read_tile(path)
+        except OSError as ex:
+            logger.warning(FMT_DOWNLOAD_LOG(ex))
+            data = None
+        else:
+            if stats is not None:
+                stats.fetched(len(data), time.perf_counter() - start)
+        result.append(data)
+    return result
+
+
 @asyncio.coroutine
-def fetch_tiles(urls, loop=None):
+def fetch_tiles(urls, loop=None, stats=None):
     """
     Download map tiles for the collection of URLs.
 
@@ -74,7 +129,13 @@ def fetch_tiles(urls, loop=None):
     Tile data for each URL is returned. If there was an error while
     downloading a tile, then None is returned for given URL.
 
+    Map tiles with `file` URLs, i.e. map tiles of local map provider, are
+    read directly from files with :py:func:`geotiler.tile.io.read_tiles`
+    function in batches.
+
     :param urls: Collection of URLs.
+    :param loop: Asyncio loop (used default one if `None`).
+    :param stats: Map rendering statistics object.
     """
     if __debug__:
         logger.debug('fetching tiles...')
@@ -86,8 +147,22 @@ def fetch_tiles(urls, loop=None):
     # without executor by creating appropriate opener? running in executor
     # sucks, but thanks to `urllib.request` we get all the goodies like
     # automatic proxy handling and various protocol support
-    f = partial(loop.run_in_executor, None, fetch_tile)
-    tasks = (f(u) for u in urls)
+    urls = tuple(urls)
+    paths = tuple(_file_path(u) for u in urls)
+    local = tuple(p for p in paths if p is not None)
+    remote = tuple(u for u, p in zip(urls, paths) if p is None)
+
+    fetch = fetch_tile if stats is None else partial(_fetch_tile_stats, stats)
+    f = partial(loop.run_in_executor, None, fetch)
+    tasks = [f(u) for u in remote]
+
+    # read local map tiles in batches, not file by file
+    batches = (
+        local[i:i + FILE_BATCH] for i in range(0, len(local), FILE_BATCH)
+    )
+    tasks.extend(
+        loop.run_in_executor(None, read_tiles, b, stats) for b in batches
+    )
     data = yield from asyncio.gather(*tasks, loop=loop, return_exceptions=True)
 
     if __debug__:
@@ -97,8 +172,57 @@ def fetch_tiles(urls, loop=None):
     in_error = (t for t in data if isinstance(t, Exception))
     for t in in_error:
         logger.warning(FMT_DOWNLOAD_LOG(t))
+    data = [None if isinstance(t, Exception) else t for t in data]
 
-    return (None if isinstance(t, Exception) else t for t in data)
+    if not local:
+        return iter(data)
+
+    # restore order of map tiles
+    remote_data = iter(data[:len(remote)])
+    local_data = itertools.chain.from_iterable(
+        (None,) * FILE_BATCH if b is None else b for b in data[len(remote):]
+    )
+    return (next(remote_data if p is None else local_data) for p in paths)
+
+
+def _accepts_stats(downloader):
+    """
+    Check if map tiles downloader accepts map rendering statistics object
+    with `stats` parameter.
+
+    :param downloader: Map tiles downloader.
+    """
+    try:
+        params = inspect.signature(downloader).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    return any(p.name == 'stats' or p.kind == p.VAR_KEYWORD for p in params)
+
+
+def _file_path(url):
+    """
+    Get file name of map tile for `file` URL.
+
+    Null is returned for other URLs.
+
+    :param url: URL of map tile.
+    """
+    if not url.startswith('file:'):
+        return None
+    return urllib.request.url2pathname(urllib.parse.urlsplit(url).path)
+
+
+def _fetch_tile_stats(stats, url):
+    """
+    Fetch map tile and record its size and fetch latency.
+
+    :param stats: Map rendering statistics object.
+    :param url: URL of map tile.
+    """
+    start = time.perf_counter()
+    data = fetch_tile(url)
+    stats.fetched(len(data), time.perf_counter() - start)
+    return data
 
 
 # vim: sw=4:et:ai
@@ -0,0 +1,225 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Integer keys of map tiles.
+
+A map tile key is 64-bit integer. The zoom of a map tile is stored in the
+top 6 bits of the key and Morton code (quadkey) of tile coordinates is
+stored in the lower bits. The bits of Morton code interleave bits of
+tile coordinates, so
+
+- keys sort by zoom, then by quadkey
+- keys of map tiles within a quadtree cell form a contiguous range
+- key of a parent or a child map tile is calculated with bit shifts
+
+The key is used as map tile identity by map tiles caches and map tiles
+pack files.
+"""
+
+import struct
+
+# maximum zoom of a map tile key
+MAX_KEY_ZOOM = 29
+
+ZOOM_SHIFT = 58
+MORTON_MASK = (1 << ZOOM_SHIFT) - 1
+
+# big-endian, so byte strings of keys sort as keys
+KEY_STRUCT = struct.Struct('>Q')
+
+def tile_key(tile_coord, zoom):
+    """
+    Calculate integer key of a map tile.
+
+    `ValueError` is raised if tile coordinates are out of range of the
+    zoom level.
+
+    :param tile_coord: Tile coordinates.
+    :param zoom: Zoom of tile coordinates.
+    """
+    x, y = tile_coord
+    n = 1 << zoom
+    if not (0 <= zoom <= MAX_KEY_ZOOM and 0 <= x < n and 0 <= y < n):
+        raise ValueError(
+            'Tile coordinates {} out of range of zoom {}'
+            .format(tile_coord, zoom)
+        )
+    return zoom << ZOOM_SHIFT | _spread(x) | _spread(y) << 1
+
+
+def key_tile(key):
+    """
+    Calculate tile coordinates and zoom of a map tile key.
+
+    Pair of tile coordinates and zoom is returned.
+
+    :param key: Map tile key.
+    """
+    code = key & MORTON_MASK
+    return (_compact(code), _compact(code >> 1)), key >> ZOOM_SHIFT
+
+
+def quadkey(key):
+    """
+    Create quadkey string of a map tile key, i.e. `0231`.
+
+    :param key: Map tile key.
+    """
+    zoom = key >> ZOOM_SHIFT
+    code = key & MORTON_MASK
+    return ''.join(
+        str(code >> 2 * i & 3) for i in range(zoom - 1, -1, -1)
+    )
+
+
+def parent_key(key):
+    """
+    Calculate key of parent map tile.
+
+    `ValueError` is raised for map tile at zoom 0.
+
+    :param key: Map tile key.
+    """
+    zoom = key >> ZOOM_SHIFT
+    if zoom == 0:
+        raise ValueError('Map tile at zoom 0 has no parent')
+    return (zoom - 1) << ZOOM_SHIFT | (key & MORTON_MASK) >> 2
+
+
+def children_keys(key):
+    """
+    Calculate keys of four children map tiles.
+
+    :param key: Map tile key.
+    """
+    zoom = key >> ZOOM_SHIFT
+    if zoom == MAX_KEY_ZOOM:
+        raise ValueError('Map tile at zoom {} has no children'.format(zoom))
+    code = (zoom + 1) << ZOOM_SHIFT | (key & MORTON_MASK) << 2
+    return code, code | 1, code | 2, code | 3
+
+
+def key_range(key, zoom):
+    """
+    Calculate range of keys of descendant map tiles at a zoom.
+
+    The range is a pair of the first key and the key after the last
+    key.
+
+    :param key: Map tile key.
+    :param zoom: Zoom of descendant map tiles.
+    """
+    d = zoom - (key >> ZOOM_SHIFT)
+    if d < 0:
+        raise ValueError('Zoom {} is lower than zoom of map tile'.format(zoom))
+    start = zoom << ZOOM_SHIFT | (key & MORTON_MASK) << 2 * d
+    return start, start + (1 << 2 * d)
+
+
+def bbox_key_ranges(tile_coord1, tile_coord2, zoom):
+    """
+    Calculate ranges of keys of map tiles within bounding box.
+
+    The bounding box is defined by tile coordinates of its top-left and
+    bottom-right map tiles (inclusive). The list of sorted, non-overlapping
+    ranges is returned. A range is a pair of the first key and the key
+    after the last key.
+
+    The ranges can be used for range scans of ordered stores of map tiles.
+
+    :param tile_coord1: Tile coordinates of top-left map tile.
+    :param tile_coord2: Tile coordinates of bottom-right map tile.
+    :param zoom: Zoom of tile coordinates.
+    """
+    n = (1 << zoom) - 1
+    x1, y1 = (max(0, min(v, n)) for v in tile_coord1)
+    x2, y2 = (max(0, min(v, n)) for v in tile_coord2)
+
+    ranges = []
+    cells = [(0, 0, 0)]
+    while cells:
+        # depth-first, children in Morton order to get sorted ranges
+        cz, cx, cy = cells.pop()
+        s = zoom - cz
+        bx1, by1 = cx << s, cy << s
+        bx2, by2 = bx1 + (1 << s) - 1, by1 + (1 << s) - 1
+        if bx2 < x1 or bx1 > x2 or by2 < y1 or by1 > y2:
+            continue
+
+        if x1 <= bx1 and bx2 <= x2 and y1 <= by1 and by2 <= y2:
+            start, end = key_range(tile_key((cx, cy), cz), zoom)
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = ranges[-1][0], end
+            else:
+                ranges.append((start, end))
+        else:
+            cx, cy, cz = cx << 1, cy << 1, cz + 1
+            cells.extend((
+                (cz, cx + 1, cy + 1), (cz, cx, cy + 1),
+                (cz, cx + 1, cy), (cz, cx, cy),
+            ))
+    return ranges
+
+
+def url_key(provider):
+    """
+    Create function calculating map tile key of map tile URL of a map
+    provider.
+
+    The function returns `None` if map tile URL is not map provider URL or
+    map tile is out of range.
+
+    :param provider: Map provider.
+    """
+    def key(url):
+        tile = provider.parse_url(url)
+        if tile is None:
+            return None
+        try:
+            return tile_key(*tile)
+        except ValueError:
+            return None
+    return key
+
+
+def _spread(v):
+    """
+    Interleave bits of 32-bit integer with zeros.
+    """
+    v = (v | v << 16) & 0x0000FFFF0000FFFF
+    v = (v | v << 8) & 0x00FF00FF00FF00FF
+    v = (v | v << 4) & 0x0F0F0F0F0F0F0F0F
+    v = (v | v << 2) & 0x3333333333333333
+    return (v | v << 1) & 0x5555555555555555
+
+
+def _compact(v):
+    """
+    Remove interleaved bits of 64-bit integer.
+    """
+    v &= 0x5555555555555555
+    v = (v | v >> 1) & 0x3333333333333333
+    v = (v | v >> 2) & 0x0F0F0F0F0F0F0F0F
+    v = (v | v >> 4) & 0x00FF00FF00FF00FF
+    v = (v | v >> 8) & 0x0000FFFF0000FFFF
+    return (v | v >> 16) & 0x00000000FFFFFFFF
+
+
+# vim: sw=4:et:ai
@@ -0,0 +1,275 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Map tiles pack file.
+
+Map tiles pack file is read-only storage of map tiles. It consists of
+
+- header: magic number, format version and number of map tiles
+- index: map tile keys sorted by zoom and quadkey (see
+  :py:mod:`geotiler.tile.key`), map tile data offsets and map tile data
+  sizes
+- map tile data
+
+All numbers are little-endian. The pack file is open with `mmap`, so map
+tile lookup is binary search on the index with no system calls and map
+tile data is returned as memory view without copying.
+"""
+
+import array
+import asyncio
+import bisect
+import logging
+import mmap
+import os
+import shutil
+import struct
+import sys
+from functools import partial
+
+from ..cache import caching_downloader
+from .key import tile_key, url_key
+
+logger = logging.getLogger(__name__)
+
+PACK_MAGIC = b'GTPK'
+PACK_VERSION = 2
+
+# magic, version, reserved, number of map tiles
+PACK_HEADER = struct.Struct('<4sHHQ')
+
+class PackReader:
+    """
+    Map tiles pack file reader.
+
+    Memory views returned by the reader are valid until the reader is
+    closed. Release the memory views before closing the reader.
+
+    :var size: Number of map tiles in the pack file.
+    """
+    def __init__(self, filename):
+        """
+        Open map tiles pack file.
+
+        :param filename: Pack file name.
+        """
+        with open(filename, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        data = memoryview(self._mmap)
+        magic, version, _, n = PACK_HEADER.unpack_from(data)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            data.release()
+            self._mmap.close()
+            raise ValueError('Not a map tiles pack file: {}'.format(filename))
+
+        k = PACK_HEADER.size
+        self._keys = _index(data[k:k + 8 * n], 'Q')
+        k += 8 * n
+        self._offsets = _index(data[k:k + 8 * n], 'Q')
+        k += 8 * n
+        self._sizes = _index(data[k:k + 4 * n], 'I')
+
+        self._data = data
+        self.size = n
+
+
+    def get(self, tile_coord, zoom):
+        """
+        Get map tile data.
+
+        Memory view of map tile data is returned or `None` if there is no
+        map tile in the pack file.
+
+        :param tile_coord: Tile coordinates.
+        :param zoom: Zoom of tile coordinates.
+        """
+        return self.get_key(tile_key(tile_coord, zoom))
+
+
+    def get_key(self, key):
+        """
+        Get map tile data using map tile key.
+
+        Memory view of map tile data is returned or `None` if there is no
+        map tile in the pack file.
+
+        :param key: Map tile key, see :py:func:`geotiler.tile.key.tile_key`.
+        """
+        keys = self._keys
+        i = bisect.bisect_left(keys, key)
+        if i == self.size or keys[i] != key:
+            return None
+        offset = self._offsets[i]
+        return self._data[offset:offset + self._sizes[i]]
+
+
+    def close(self):
+        """
+        Close map tiles pack file.
+        """
+        for v in (self._keys, self._offsets, self._sizes, self._data):
+            if isinstance(v, memoryview):
+                v.release()
+        self._mmap.close()
+
+
+class PackWriter:
+    """
+    Map tiles pack file writer.
+
+    Map tile data is stored in temporary file until the writer is closed.
+    If a map tile is added multiple times, then its last data is stored in
+    the pack file.
+    """
+    def __init__(self, filename):
+        """
+        Create map tiles pack file writer.
+
+        :param filename: Pack file name.
+        """
+        self._filename = filename
+        self._tmp = open(filename + '.tmp', 'w+b')
+        self._index = {}
+
+
+    def add(self, tile_coord, zoom, data):
+        """
+        Add map tile data to the pack file.
+
+        :param tile_coord: Tile coordinates.
+        :param zoom: Zoom of tile coordinates.
+        :param data: Map tile data.
+        """
+        self.add_key(tile_key(tile_coord, zoom), data)
+
+
+    def add_key(self, key, data):
+        """
+        Add map tile data to the pack file using map tile key.
+
+        :param key: Map tile key, see :py:func:`geotiler.tile.key.tile_key`.
+        :param data: Map tile data.
+        """
+        offset = self._tmp.tell()
+        self._tmp.write(data)
+        self._index[key] = offset, len(data)
+
+
+    def close(self):
+        """
+        Write pack file header, its index and map tile data.
+        """
+        keys = sorted(self._index)
+        n = len(keys)
+        start = PACK_HEADER.size + 20 * n
+        offsets = array.array('Q', (start + self._index[k][0] for k in keys))
+        sizes = array.array('I', (self._index[k][1] for k in keys))
+        keys = array.array('Q', keys)
+        if sys.byteorder != 'little':
+            for a in (keys, offsets, sizes):
+                a.byteswap()
+
+        with open(self._filename, 'wb') as f:
+            f.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, 0, n))
+            f.write(keys.tobytes())
+            f.write(offsets.tobytes())
+            f.write(sizes.tobytes())
+            self._tmp.seek(0)
+            shutil.copyfileobj(self._tmp, f)
+
+        self._tmp.close()
+        os.unlink(self._tmp.name)
+
+        if __debug__:
+            logger.debug('{} map tiles written to {}'.format(n, self._filename))
+
+
+def pack_downloader(reader, provider, downloader=None):
+    """
+    Create downloader reading map tiles from map tiles pack file.
+
+    If `downloader` is null, then `None` is returned for map tiles missing
+    in the pack file. Otherwise, missing map tiles are downloaded with the
+    downloader.
+
+    :param reader: Map tiles pack file reader.
+    :param provider: Map provider of map tiles in the pack file.
+    :param downloader: Map tiles downloader used for missing map tiles.
+    """
+    if downloader is None:
+        downloader = _missing_tiles
+    return partial(
+        caching_downloader, reader.get_key, _ignore, downloader, name='pack',
+        key=url_key(provider)
+    )
+
+
+def seeding_downloader(writer, provider, downloader):
+    """
+    Create downloader adding downloaded map tiles to map tiles pack file.
+
+    :param writer: Map tiles pack file writer.
+    :param provider: Map provider of map tiles.
+    :param downloader: Map tiles downloader.
+    """
+    return partial(
+        caching_downloader, _missing, writer.add_key, downloader,
+        key=url_key(provider)
+    )
+
+
+def _index(data, fmt):
+    """
+    Create pack file index sequence using pack file data.
+
+    :param data: Memory view of pack file data.
+    :param fmt: Type code of index items.
+    """
+    if sys.byteorder == 'little':
+        return data.cast(fmt)
+    index = array.array(fmt)
+    index.frombytes(data)
+    index.byteswap()
+    return index
+
+
+def _missing(key):
+    """
+    Cache getter for cache without data.
+    """
+    return None
+
+
+def _ignore(key, data):
+    """
+    Cache setter ignoring map tile data.
+    """
+
+
+@asyncio.coroutine
+def _missing_tiles(urls, **kw):
+    """
+    Map tiles downloader, which does not download anything.
+    """
+    return (None,) * len(urls)
+
+
+# vim: sw=4:et:ai
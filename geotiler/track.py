@@ -0,0 +1,252 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014-2016 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Rendering of tracks, i.e. positions read from GPX files.
+
+Positions are processed in chunks stored in NumPy arrays of longitude and
+latitude pairs. GPX files are parsed iteratively, positions are projected
+onto map image with vectorized operations and positions falling into the
+same pixel are drawn once, so memory use does not depend on number of
+positions.
+"""
+
+import bz2
+import gzip
+import lzma
+import math
+import os.path
+import xml.etree.ElementTree as etree
+
+import numpy as np
+import PIL.Image
+
+# number of positions in a chunk
+CHUNK_SIZE = 65536
+
+FILE_OPENER = {
+    'xz': lzma.LZMAFile,
+    'bz2': bz2.BZ2File,
+    'gz': gzip.GzipFile,
+}
+
+def read_gpx(filename, chunk_size=CHUNK_SIZE):
+    """
+    Read positions of track points from GPX file.
+
+    The function is a generator of NumPy arrays of shape `(n, 2)`. Each
+    array contains up to `chunk_size` positions (longitude and latitude).
+
+    GPX file compressed with `xz`, `bzip2` or `gzip` is decompressed if
+    file name has `xz`, `bz2` or `gz` extension.
+
+    :param filename: Name of GPX file.
+    :param chunk_size: Maximum number of positions in a chunk.
+    """
+    _, ext = os.path.splitext(filename)
+    f_open = FILE_OPENER.get(ext[1:], open)
+
+    with f_open(filename, 'rb') as f:
+        chunk = np.empty((chunk_size, 2))
+        n = 0
+        parents = []
+        for event, elem in etree.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                parents.append(elem)
+                continue
+
+            parents.pop()
+            if elem.tag.rpartition('}')[2] == 'trkpt':
+                chunk[n] = float(elem.get('lon')), float(elem.get('lat'))
+                n += 1
+                if n == chunk_size:
+                    yield chunk
+                    chunk = np.empty((chunk_size, 2))
+                    n = 0
+
+            # drop processed elements to keep memory use constant
+            elem.clear()
+            if parents:
+                parents[-1].remove(elem)
+
+        if n:
+            yield chunk[:n]
+
+
+def track_extent(points):
+    """
+    Calculate geographical extent of positions.
+
+    The extent is a tuple of minimum longitude, minimum latitude, maximum
+    longitude and maximum latitude. `ValueError` is raised if there are no
+    positions.
+
+    :param points: Iterable of NumPy arrays of positions.
+    """
+    extent = None
+    for chunk in points:
+        if not len(chunk):
+            continue
+        lo = chunk.min(axis=0)
+        hi = chunk.max(axis=0)
+        if extent is None:
+            extent = lo, hi
+        else:
+            extent = np.minimum(extent[0], lo), np.maximum(extent[1], hi)
+
+    if extent is None:
+        raise ValueError('No positions to calculate extent')
+    lo, hi = extent
+    return float(lo[0]), float(lo[1]), float(hi[0]), float(hi[1])
+
+
+def rev_geocode(map, points):
+    """
+    Reverse geocode geographical locations.
+
+    The function calculates positions (x, y) of locations on map image, see
+    :py:meth:`geotiler.Map.rev_geocode`. NumPy array of shape `(n, 2)` is
+    returned.
+
+    :param map: Map instance.
+    :param points: NumPy array of locations (longitude, latitude).
+    """
+    points = np.asarray(points, dtype=np.float64)
+    x, y = _tile_coords(map.provider.projection, points, map.zoom)
+    return _image_coords(map, x, y)
+
+
+def track_mask(map, points):
+    """
+    Rasterize positions into a mask of map image pixels.
+
+    Positions are reverse geocoded in chunks. Boolean NumPy array of map
+    image height and width is returned. An item of the array is true if at
+    least one position falls into the pixel.
+
+    :param map: Map instance.
+    :param points: Iterable of NumPy arrays of positions.
+    """
+    w, h = map.size
+    mask = np.zeros((h, w), dtype=bool)
+    for chunk in points:
+        xy = np.floor(rev_geocode(map, chunk)).astype(np.int64)
+        x, y = xy[:, 0], xy[:, 1]
+        valid = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+        mask[y[valid], x[valid]] = True
+    return mask
+
+
+def render_track(
+    map, points, image=None, color=(255, 0, 0), alpha=1.0, radius=0.5
+):
+    """
+    Draw positions on map image.
+
+    Each position is drawn as a disc of `radius` pixels. Positions falling
+    into the same pixel are drawn once.
+
+    If `image` is null, then an image with positions only is returned.
+    Otherwise, positions are drawn over the image and new image is
+    returned. The result is image in `RGBA` mode.
+
+    :param map: Map instance.
+    :param points: Iterable of NumPy arrays of positions, i.e. created with
+        :py:func:`geotiler.track.read_gpx`.
+    :param image: Map image.
+    :param color: Color of positions (red, green and blue values).
+    :param alpha: Transparency of positions (0.0 - 1.0).
+    :param radius: Radius of a position in pixels.
+    """
+    mask = _dilate(track_mask(map, points), radius)
+
+    alpha = (mask * round(255 * alpha)).astype(np.uint8)
+    overlay = PIL.Image.new('RGBA', map.size, tuple(color) + (0,))
+    overlay.putalpha(PIL.Image.fromarray(alpha, 'L'))
+
+    if image is None:
+        return overlay
+    return PIL.Image.alpha_composite(image.convert('RGBA'), overlay)
+
+
+def _tile_coords(projection, points, zoom):
+    """
+    Calculate tile coordinates of locations at a zoom.
+
+    Pair of NumPy arrays of tile coordinates is returned.
+
+    :param projection: Map provider projection.
+    :param points: NumPy array of locations (longitude, latitude).
+    :param zoom: Zoom of tile coordinates.
+    """
+    t = projection.transformation
+
+    # spherical mercator projection, see geotiler.geo.MercatorProjection
+    x = np.radians(points[:, 0])
+    y = np.log(np.tan(0.25 * math.pi + 0.5 * np.radians(points[:, 1])))
+
+    scale = 2.0 ** (zoom - projection.zoom)
+    cx = (t.ax * x + t.bx * y + t.cx) * scale
+    cy = (t.ay * x + t.by * y + t.cy) * scale
+    return cx, cy
+
+
+def _image_coords(map, x, y):
+    """
+    Calculate positions on map image of tile coordinates at map zoom.
+
+    NumPy array of shape `(n, 2)` is returned.
+
+    :param map: Map instance.
+    :param x: NumPy array of tile coordinates x.
+    :param y: NumPy array of tile coordinates y.
+    """
+    provider = map.provider
+    ox, oy = map.offset
+    w, h = map.size
+    result = np.empty((len(x), 2))
+    result[:, 0] = ox + provider.tile_width * (x - map.origin[0]) + w / 2
+    result[:, 1] = oy + provider.tile_height * (y - map.origin[1]) + h / 2
+    return result
+
+
+def _dilate(mask, radius):
+    """
+    Dilate mask of pixels with a disc.
+
+    :param mask: Boolean NumPy array.
+    :param radius: Radius of the disc.
+    """
+    r = int(radius)
+    if r < 1:
+        return mask
+
+    h, w = mask.shape
+    result = mask.copy()
+    offsets = (
+        (dx, dy) for dx in range(-r, r + 1) for dy in range(-r, r + 1)
+        if (dx or dy) and dx * dx + dy * dy <= radius * radius
+    )
+    for dx, dy in offsets:
+        result[max(dy, 0):h + min(dy, 0), max(dx, 0):w + min(dx, 0)] |= \
+            mask[max(-dy, 0):h + min(-dy, 0), max(-dx, 0):w + min(-dx, 0)]
+    return result
+
+
+# vim: sw=4:et:ai